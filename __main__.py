@@ -14,12 +14,16 @@
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
 import argparse
+import datetime
 import os
 import sys
 
 from wowupdate.updater.Config import Config
 from wowupdate.updater.AddOnDb import AddOnDb
+from wowupdate.updater.CurseUpdater import CurseUpdater
+from wowupdate.updater.RollbackStore import RollbackStore
 from wowupdate.updater.addon_scanner import update_all
+from wowupdate.updater.check_scheduler import get_not_found_interval
 
 
 
@@ -51,7 +55,115 @@ def cmd_shell(arg):
 
 
 def cmd_update(arg):
-	update_all(addondb=addondb, config=config, dry_run=arg.dry)
+	update_all(
+		addondb=addondb,
+		config=config,
+		dry_run=arg.dry,
+		check_workers=arg.workers,
+		show_stats=arg.stats,
+		refresh=arg.refresh,
+		full=arg.full
+	)
+
+
+def cmd_cache(arg):
+	cache = config.download_cache
+
+	if arg.ACTION == 'prune':
+		removed = cache.prune()
+		print("removed %i archives" % removed)
+
+	stats = cache.getStats()
+
+	print("download cache: %s" % cache.getCacheDir())
+	print("  archives: %i (%i urls)" % (stats['archives'], stats['urls']))
+	print("  size:     %.1f of %.1f MiB" % (stats['size'] / 1048576.0, stats['max-size'] / 1048576.0))
+
+	http_cache = config.http_cache
+
+	if arg.ACTION == 'prune':
+		removed = http_cache.prune()
+		print("removed %i responses" % removed)
+
+	stats = http_cache.getStats()
+
+	print("http cache: %s" % http_cache.getCacheDir())
+	print("  responses: %i" % stats['responses'])
+	print("  size:      %.1f of %.1f MiB" % (stats['size'] / 1048576.0, stats['max-size'] / 1048576.0))
+
+
+def cmd_catalog(arg):
+	for updater in config.updaters:
+		if not isinstance(updater, CurseUpdater):
+			continue
+
+		catalog = updater.catalog
+
+		if arg.ACTION == 'refresh':
+			updated = updater.refreshCatalog(full=arg.catalog_full)
+			print("received %i projects" % updated)
+		else:
+			catalog.ensureLoaded()
+
+		print("curse catalog: %s" % catalog.getFilename())
+		print("  projects: %i" % len(catalog.projects))
+
+		if catalog.updated > 0:
+			print("  updated:  %s" % datetime.datetime.fromtimestamp(catalog.updated).strftime('%Y-%m-%d %H:%M'))
+
+
+def cmd_notfound(arg):
+	if arg.ACTION == 'clear':
+		if arg.ADDON is not None and arg.ADDON not in addondb.not_found:
+			print("%s is not marked as not found" % arg.ADDON)
+			return
+
+		addondb.clearNotFound(arg.ADDON)
+		addondb.save()
+
+		print("cleared %s" % (arg.ADDON if arg.ADDON is not None else "all addons"))
+		return
+
+	for name in sorted(addondb.not_found.keys(), key=str.lower):
+		entry = addondb.not_found[name]
+		next_attempt = entry['last-attempt'] + get_not_found_interval(entry['attempts'])
+
+		print("%-40s %3i attempts, next search %s" % (
+			name,
+			entry['attempts'],
+			datetime.datetime.fromtimestamp(next_attempt).strftime('%Y-%m-%d %H:%M')
+		))
+
+
+def cmd_rollback(arg):
+	addon = addondb.addons.get(arg.ADDON)
+
+	if addon is None:
+		addon = addondb.getFolderOwner(arg.ADDON)
+
+	if addon is None:
+		print("unknown addon %s" % arg.ADDON)
+		return
+
+	rollback_store = RollbackStore(config)
+
+	if arg.list:
+		for meta in rollback_store.getSnapshots(addon.name):
+			print("%s  %s" % (meta['id'], meta['version']))
+
+		return
+
+	old_version = addon.version
+	meta = rollback_store.restore(addon, snapshot_id=arg.snapshot)
+
+	if meta is None:
+		print("no snapshot of %s found" % addon.name)
+		return
+
+	addondb.add(addon)
+	addondb.save()
+
+	print("%s: %s => %s" % (addon.display_name, old_version, addon.version))
 
 
 def cmd_install(arg):
@@ -73,6 +185,32 @@ def make_parser():
 		action="store_true"
 	)
 
+	parser.add_argument(
+		"--workers",
+		action="store",
+		type=int,
+		default=None,
+		help="number of update checks running in parallel"
+	)
+
+	parser.add_argument(
+		"--stats",
+		action="store_true",
+		help="print the throughput of each update stage"
+	)
+
+	parser.add_argument(
+		"--refresh",
+		action="store_true",
+		help="ignore cached results of previous update checks"
+	)
+
+	parser.add_argument(
+		"--full",
+		action="store_true",
+		help="check all addons, even if they are not due to be checked"
+	)
+
 	# subparsers
 	subparsers = parser.add_subparsers()
 
@@ -86,6 +224,81 @@ def make_parser():
 	parser_updateall.set_defaults(run=cmd_update)
 
 
+	# cache
+	parser_cache = subparsers.add_parser("cache")
+
+	parser_cache.add_argument(
+		"ACTION",
+		action="store",
+		choices=["stats", "prune"]
+	)
+
+	parser_cache.set_defaults(run=cmd_cache)
+
+
+	# catalog
+	parser_catalog = subparsers.add_parser("catalog")
+
+	parser_catalog.add_argument(
+		"ACTION",
+		action="store",
+		choices=["stats", "refresh"]
+	)
+
+	parser_catalog.add_argument(
+		"--full",
+		action="store_true",
+		dest="catalog_full",
+		help="request all projects instead of the ones modified since the last refresh"
+	)
+
+	parser_catalog.set_defaults(run=cmd_catalog)
+
+
+	# notfound
+	parser_notfound = subparsers.add_parser("notfound")
+
+	parser_notfound.add_argument(
+		"ACTION",
+		action="store",
+		choices=["list", "clear"]
+	)
+
+	parser_notfound.add_argument(
+		"ADDON",
+		action="store",
+		nargs="?",
+		default=None,
+		help="addon to search again on the next update, instead of all"
+	)
+
+	parser_notfound.set_defaults(run=cmd_notfound)
+
+
+	# rollback
+	parser_rollback = subparsers.add_parser("rollback")
+
+	parser_rollback.add_argument(
+		"ADDON",
+		action="store",
+	)
+
+	parser_rollback.add_argument(
+		"--list",
+		action="store_true",
+		help="list the snapshots of this addon"
+	)
+
+	parser_rollback.add_argument(
+		"--snapshot",
+		action="store",
+		default=None,
+		help="restore this snapshot instead of the most recent one"
+	)
+
+	parser_rollback.set_defaults(run=cmd_rollback)
+
+
 	# install
 	parser_install = subparsers.add_parser("install")
 
@@ -119,8 +332,10 @@ def make_parser_shell():
 	return parser
 
 
-parser = make_parser_cl()
-result = parser.parse_args()
-result.run(result)
+# worker processes import this module as well, but must not run any command
+if __name__ == '__main__':
+	parser = make_parser_cl()
+	result = parser.parse_args()
+	result.run(result)
 
-exit()
+	exit()
@@ -0,0 +1,367 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# A local stand-in for the Curse API, which answers requests for synthetic
+# projects and counts them. To use it, add the following entry to the
+# 'config' section of addons.db.json:
+#
+#   "curse-api-url": "http://localhost:8780/api/v2"
+#
+# Archives are sent with support for Range requests. To test resuming
+# downloads, --cut-after closes each connection after sending the given
+# number of bytes of an archive, and --file-size pads archives to be large
+# enough for that.
+#
+# Projects passed to create_server as missing_projects are left out of the
+# answers to bulk requests, like projects the API no longer returns in bulk,
+# but can still be requested one by one.
+#
+# usage: python benchmarks/curse_mock_server.py [--port 8780] [--version 2.0] [--projects 1000]
+#                                               [--file-size 0] [--cut-after 0]
+
+import argparse
+import datetime
+import email.utils
+import gzip
+import hashlib
+import io
+import json
+import re
+import socket
+import threading
+import urllib.parse
+import zipfile
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+
+api_prefix = '/api/v2'
+
+# the projects were modified one minute apart, the one with the highest id last
+modified_base = datetime.datetime(2021, 1, 1, tzinfo=datetime.timezone.utc)
+
+regex_range = re.compile('bytes=(\\d+)-$')
+
+
+class MockState:
+	def __init__(self, version, projects, file_size=0, cut_after=0, missing_projects=()):
+		self.version   = version
+		self.projects  = projects
+		self.file_size = file_size
+		self.cut_after = cut_after
+		self.missing_projects = set(missing_projects)
+		self.requests  = {}
+		self.ranges    = []
+		self.archives  = {}
+		self.lock      = threading.Lock()
+
+
+	def count(self, name):
+		with self.lock:
+			self.requests[name] = self.requests.get(name, 0) + 1
+
+
+	def recordRange(self, range_header, if_range_header):
+		with self.lock:
+			self.ranges.append((range_header, if_range_header))
+
+
+	def getArchive(self, name):
+		# archives are created once, so their content and ETag stay the same
+		with self.lock:
+			key = (name, self.version, self.file_size)
+
+			if key not in self.archives:
+				self.archives[key] = make_zip(name, self.version, self.file_size)
+
+			return self.archives[key]
+
+
+def make_project(base_url, project_id, version):
+	name = 'Project%i' % project_id
+	file_id = project_id * 1000 + 1
+
+	modified = modified_base + datetime.timedelta(minutes=project_id)
+
+	return {
+		'id':            project_id,
+		'name':          name,
+		'slug':          name.lower(),
+		'downloadCount': project_id * 10,
+		'dateModified':  modified.strftime('%Y-%m-%dT%H:%M:%S.000Z'),
+		'gameVersionLatestFiles': [
+			{
+				'gameVersionFlavor': 'wow_retail',
+				'fileType':          1,
+				'projectFileId':     file_id,
+			}
+		],
+		'latestFiles': [
+			{
+				'id':          file_id,
+				'displayName': version,
+				'downloadUrl': '%s/files/%i/%s.zip' % (base_url, project_id, name),
+				'modules':     [{'foldername': name, 'fingerprint': 0}],
+			}
+		],
+	}
+
+
+def make_padding(name, size):
+	# incompressible, but always the same data for the same archive
+	blocks = []
+
+	for i in range((size + 31) // 32):
+		blocks.append(hashlib.sha256(('%s:%i' % (name, i)).encode('utf-8')).digest())
+
+	return b''.join(blocks)[:size]
+
+
+def make_zip(name, version, file_size=0):
+	data = io.BytesIO()
+	date_time = modified_base.timetuple()[:6]
+
+	def write(path, content, compress_type=zipfile.ZIP_DEFLATED):
+		archive.writestr(zipfile.ZipInfo(path, date_time), content, compress_type=compress_type)
+
+	with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+		write('%s/%s.toc' % (name, name), '## Title: %s\n## Version: %s\n' % (name, version))
+		write('%s/%s.lua' % (name, name), 'print("%s")\n' % name)
+
+		if file_size > 0:
+			write('%s/Media/padding.bin' % name, make_padding(name, file_size), zipfile.ZIP_STORED)
+
+	return data.getvalue()
+
+
+class MockHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def getBaseUrl(self):
+		return 'http://%s' % self.headers.get('Host', '%s:%i' % self.server.server_address)
+
+
+	def sendJson(self, json_data, status=200):
+		self.sendData(json.dumps(json_data).encode('utf-8'), 'application/json', status)
+
+
+	def sendData(self, data, content_type, status=200):
+		content_encoding = None
+
+		# json is compressed, if the client accepts it
+		if content_type == 'application/json' and 'gzip' in self.headers.get('Accept-Encoding', ''):
+			data = gzip.compress(data)
+			content_encoding = 'gzip'
+
+		etag = '"%s"' % hashlib.sha1(data).hexdigest()[:16]
+
+		# unchanged responses are confirmed without a body
+		if status == 200 and self.headers.get('If-None-Match') == etag:
+			self.server.state.count('not-modified')
+			self.send_response(304)
+			self.send_header('ETag', etag)
+			self.end_headers()
+			return
+
+		self.send_response(status)
+		self.send_header('Content-Type', content_type)
+		self.send_header('Content-Length', str(len(data)))
+		self.send_header('ETag', etag)
+
+		if content_encoding is not None:
+			self.send_header('Content-Encoding', content_encoding)
+		self.end_headers()
+		self.wfile.write(data)
+
+
+	def sendFile(self, data):
+		state = self.server.state
+		etag = '"%s"' % hashlib.sha1(data).hexdigest()[:16]
+		range_header = self.headers.get('Range')
+		if_range_header = self.headers.get('If-Range')
+		start = 0
+
+		state.recordRange(range_header, if_range_header)
+
+		# a range is only sent, if the file did not change since the first part was received
+		if range_header is not None and if_range_header in (None, etag):
+			m = regex_range.match(range_header)
+
+			if m is not None:
+				start = int(m.group(1))
+
+			if start >= len(data):
+				self.send_response(416)
+				self.send_header('Content-Range', 'bytes */%i' % len(data))
+				self.send_header('Content-Length', '0')
+				self.end_headers()
+				return
+
+		if start > 0:
+			self.send_response(206)
+			self.send_header('Content-Range', 'bytes %i-%i/%i' % (start, len(data) - 1, len(data)))
+		else:
+			self.send_response(200)
+
+		self.send_header('Content-Type', 'application/zip')
+		self.send_header('Content-Length', str(len(data) - start))
+		self.send_header('Accept-Ranges', 'bytes')
+		self.send_header('ETag', etag)
+		self.send_header('Last-Modified', email.utils.format_datetime(modified_base, usegmt=True))
+		self.end_headers()
+
+		body = data[start:]
+
+		if state.cut_after > 0 and len(body) > state.cut_after:
+			# drop the connection in the middle of the body
+			state.count('cut')
+			self.wfile.write(body[:state.cut_after])
+			self.wfile.flush()
+			self.connection.shutdown(socket.SHUT_RDWR)
+			self.close_connection = True
+			return
+
+		self.wfile.write(body)
+
+
+	def readJson(self):
+		length = int(self.headers.get('Content-Length', 0))
+
+		return json.loads(self.rfile.read(length).decode('utf-8'))
+
+
+	def do_GET(self):
+		state = self.server.state
+		url = urllib.parse.urlparse(self.path)
+		parts = url.path.split('/')
+
+		if url.path.startswith(api_prefix + '/addon/search'):
+			state.count('search')
+			params = urllib.parse.parse_qs(url.query)
+			query = params.get('searchFilter', [''])[0]
+
+			if query == '':
+				# a page of all projects, most recently modified first
+				index     = int(params.get('index', ['0'])[0])
+				page_size = int(params.get('pageSize', ['50'])[0])
+				project_ids = range(state.projects - index, max(0, state.projects - index - page_size), -1)
+
+				self.sendJson([make_project(self.getBaseUrl(), project_id, state.version) for project_id in project_ids])
+
+			elif query.startswith('Project') and query[7:].isdecimal():
+				self.sendJson([make_project(self.getBaseUrl(), int(query[7:]), state.version)])
+			else:
+				self.sendJson([])
+
+		elif url.path.startswith(api_prefix + '/addon/') and parts[-1].isdecimal():
+			state.count('addon')
+			self.sendJson(make_project(self.getBaseUrl(), int(parts[-1]), state.version))
+
+		elif url.path.startswith('/files/'):
+			state.count('file')
+			name = parts[-1][:-len('.zip')]
+			self.sendFile(state.getArchive(name))
+
+		else:
+			self.sendJson({'error': 'not found'}, status=404)
+
+
+	def do_POST(self):
+		state = self.server.state
+		url = urllib.parse.urlparse(self.path)
+
+		if url.path == api_prefix + '/addon':
+			state.count('addon-batch')
+			project_ids = [int(project_id) for project_id in self.readJson()]
+			self.sendJson([make_project(self.getBaseUrl(), project_id, state.version) for project_id in project_ids if project_id not in state.missing_projects])
+
+		elif url.path == api_prefix + '/fingerprint':
+			state.count('fingerprint')
+			self.readJson()
+			self.sendJson({'exactMatches': []})
+
+		else:
+			self.sendJson({'error': 'not found'}, status=404)
+
+
+	def log_message(self, format, *args):
+		print(format % args)
+
+
+def create_server(port, version='2.0', projects=1000, file_size=0, cut_after=0, missing_projects=()):
+	server = ThreadingHTTPServer(('localhost', port), MockHandler)
+	server.daemon_threads = True
+	server.state = MockState(version, projects, file_size=file_size, cut_after=cut_after, missing_projects=missing_projects)
+
+	return server
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description="Local mock of the Curse API"
+	)
+
+	parser.add_argument(
+		"--port",
+		type=int,
+		default=8780
+	)
+
+	parser.add_argument(
+		"--projects",
+		type=int,
+		default=1000,
+		help="number of projects returned when listing all projects"
+	)
+
+	parser.add_argument(
+		"--version",
+		default="2.0",
+		help="version of the latest release of every project"
+	)
+
+	parser.add_argument(
+		"--file-size",
+		type=int,
+		default=0,
+		help="number of bytes added to every archive"
+	)
+
+	parser.add_argument(
+		"--cut-after",
+		type=int,
+		default=0,
+		help="close the connection after sending this number of bytes of an archive"
+	)
+
+	args = parser.parse_args()
+
+	server = create_server(args.port, args.version, args.projects, file_size=args.file_size, cut_after=args.cut_after)
+
+	print('listening on http://localhost:%i%s' % (args.port, api_prefix))
+
+	try:
+		server.serve_forever()
+
+	except KeyboardInterrupt:
+		pass
+
+	for name, count in sorted(server.state.requests.items()):
+		print('%-12s %i requests' % (name, count))
+
+
+if __name__ == '__main__':
+	main()
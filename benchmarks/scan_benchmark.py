@@ -0,0 +1,281 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+# Measures the time of scanning a synthetic Interface/AddOns directory.
+#
+# usage: python benchmarks/scan_benchmark.py [--sizes 100 1000 10000] [--repeat 5]
+
+import argparse
+import io
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from wowupdate.updater.AddOn import Toc
+from wowupdate.updater.AddOnDb import AddOnDb
+from wowupdate.updater.AddOnDb import addondb_filename
+from wowupdate.updater.Config import Config
+from wowupdate.updater.ScanSnapshot import ScanSnapshot
+from wowupdate.updater.addon_scanner import list_existing_names
+from wowupdate.updater.addon_scanner import remove_sub_addons
+from wowupdate.updater.addon_scanner import scan_unknown_addons
+from wowupdate.updater.addon_scanner import split_abandoned_addons
+
+
+library_names = [
+	'LibStub',
+	'CallbackHandler-1.0',
+	'AceAddon-3.0',
+	'AceDB-3.0',
+	'AceGUI-3.0',
+	'LibSharedMedia-3.0',
+	'LibDataBroker-1.1',
+	'LibDBIcon-1.0',
+]
+
+module_suffixes = [
+	'Options',
+	'Config',
+	'Core',
+	'Data',
+	'Loader',
+]
+
+
+def write_toc(addons_dir, folder, title, version, dependencies=None, project_id=None):
+	path = os.path.join(addons_dir, folder)
+	os.makedirs(path, exist_ok=True)
+
+	with io.open(os.path.join(path, folder + '.toc'), 'w', encoding='utf-8') as toc:
+		toc.write('## Interface: 90105\n')
+		toc.write('## Title: %s\n' % title)
+		toc.write('## Notes: Synthetic addon %s\n' % folder)
+		toc.write('## Author: Benchmark\n')
+		toc.write('## Version: %s\n' % version)
+
+		if dependencies:
+			toc.write('## Dependencies: %s\n' % ', '.join(dependencies))
+
+		if project_id is not None:
+			toc.write('## X-Curse-Packaged-Version: %s\n' % version)
+			toc.write('## X-Curse-Project-ID: %s\n' % project_id)
+
+		toc.write('## SavedVariables: %sDB\n' % folder)
+		toc.write('\n')
+
+		for index in range(8):
+			toc.write('file%i.lua\n' % index)
+
+		toc.write('%s.xml\n' % folder)
+
+
+def make_title(rng, name):
+	color = '%06x' % rng.randrange(0x1000000)
+	title = '|cff%s%s|r' % (color, name)
+
+	# some addons have an icon in front of their title
+	if rng.random() < 0.3:
+		title = '|TInterface\\AddOns\\%s\\icon:16:16|t %s' % (name, title)
+
+	return title
+
+
+# Creates a tree of the given number of folders. About a third of the
+# folders are bundled libraries and modules of other addons, half of the
+# addons are known by the addon db and a few entries of the addon db
+# refer to folders which do not exist.
+def generate_addons_dir(root, size, rng):
+	addons_dir = os.path.join(root, 'Interface', 'AddOns')
+	os.makedirs(addons_dir)
+
+	db_addons = {}
+	folders = 0
+	index = 0
+
+	while folders < size:
+		name = 'Addon%05i' % index
+		version = '%i.%i.%i' % (rng.randrange(10), rng.randrange(20), rng.randrange(100))
+		project_id = str(10000 + index) if rng.random() < 0.7 else None
+		addon_folders = [name]
+
+		write_toc(addons_dir, name, make_title(rng, name), version, project_id=project_id)
+
+		# modules of a package share the version and depend on the main addon
+		for suffix in rng.sample(module_suffixes, rng.randrange(3)):
+			module = '%s_%s' % (name, suffix)
+			write_toc(addons_dir, module, make_title(rng, module), version, dependencies=[name])
+			addon_folders.append(module)
+
+		# bundled libraries, which are installed as a folder of their own
+		if rng.random() < 0.2:
+			library = '%s-%s' % (rng.choice(library_names), name)
+			write_toc(addons_dir, library, library, '1.0')
+			addon_folders.append(library)
+
+		if index % 2 == 0:
+			entry = {
+				'folders': addon_folders,
+				'version': version,
+			}
+
+			if project_id is not None:
+				entry['curse_project_id'] = project_id
+
+			db_addons[name] = entry
+
+		folders += len(addon_folders)
+		index += 1
+
+	# addons which were deleted manually
+	for deleted in range(max(1, size // 100)):
+		name = 'Deleted%05i' % deleted
+		db_addons[name] = {
+			'folders': [name],
+			'version': '1.0',
+		}
+
+	with io.open(os.path.join(addons_dir, addondb_filename), 'w') as output:
+		json.dump({'addons': db_addons, 'config': {}}, output, indent=2)
+
+	return addons_dir
+
+
+def measure(function, repeat):
+	timings = []
+	result = None
+
+	for _ in range(repeat):
+		started = time.perf_counter()
+		result = function()
+		timings.append(time.perf_counter() - started)
+
+	return timings, result
+
+
+def print_timings(name, timings):
+	print('  %-24s min %9.3fms   median %9.3fms' % (
+		name,
+		min(timings) * 1000,
+		statistics.median(timings) * 1000
+	))
+
+
+def run_benchmark(size, repeat, seed):
+	rng = random.Random(seed)
+	root = tempfile.mkdtemp(prefix='wowupdate-bench-')
+
+	try:
+		addons_dir = generate_addons_dir(root, size, rng)
+
+		config = Config()
+		config.addons_dir = addons_dir
+
+		def open_addondb():
+			addondb = AddOnDb(config)
+			addondb.open()
+			return addondb
+
+		def scan_cold():
+			snapshot_file = ScanSnapshot(config).getFilename()
+			if os.path.exists(snapshot_file):
+				os.remove(snapshot_file)
+
+			snapshot = ScanSnapshot(config)
+			snapshot.open()
+			addons = scan_unknown_addons(addondb, snapshot)
+			snapshot.save()
+			return addons
+
+		def scan_warm():
+			snapshot = ScanSnapshot(config)
+			snapshot.open()
+			return scan_unknown_addons(addondb, snapshot)
+
+		def parse_tocs():
+			return [Toc.parseFile(path) for path in toc_files]
+
+		print('%i folders:' % size)
+
+		timings, addondb = measure(open_addondb, repeat)
+		print_timings('AddOnDb.open', timings)
+
+		timings, scanned = measure(scan_cold, repeat)
+		print_timings('scan (no snapshot)', timings)
+
+		timings, scanned = measure(scan_warm, repeat)
+		print_timings('scan (snapshot)', timings)
+
+		addons = addondb.getAddons() + scanned
+
+		timings, grouped = measure(lambda: remove_sub_addons(addons), repeat)
+		print_timings('sub addon grouping', timings)
+
+		timings, _ = measure(
+			lambda: split_abandoned_addons(grouped, list_existing_names(addons_dir)),
+			repeat
+		)
+		print_timings('abandoned detection', timings)
+
+		toc_files = []
+		for entry in os.scandir(addons_dir):
+			if entry.is_dir():
+				toc_files.append(os.path.join(entry.path, entry.name + '.toc'))
+
+		timings, _ = measure(parse_tocs, repeat)
+		print_timings('Toc.parseFile (all)', timings)
+
+	finally:
+		shutil.rmtree(root)
+
+
+def main():
+	parser = argparse.ArgumentParser(
+		description="Benchmark for scanning the AddOns directory"
+	)
+
+	parser.add_argument(
+		"--sizes",
+		nargs="+",
+		type=int,
+		default=[100, 1000, 10000]
+	)
+
+	parser.add_argument(
+		"--repeat",
+		type=int,
+		default=5
+	)
+
+	parser.add_argument(
+		"--seed",
+		type=int,
+		default=1
+	)
+
+	args = parser.parse_args()
+
+	for size in args.sizes:
+		run_benchmark(size, args.repeat, args.seed)
+
+
+if __name__ == '__main__':
+	main()
@@ -0,0 +1,48 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import importlib.util
+import os
+import threading
+
+import pytest
+
+
+mock_server_path = os.path.join(os.path.dirname(__file__), '..', 'benchmarks', 'curse_mock_server.py')
+
+spec = importlib.util.spec_from_file_location('curse_mock_server', mock_server_path)
+curse_mock_server = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(curse_mock_server)
+
+
+@pytest.fixture
+def start_mock_server():
+	# starts the local stand-in for the Curse API on a free port
+	servers = []
+
+	def start(**kwargs):
+		server = curse_mock_server.create_server(0, **kwargs)
+		thread = threading.Thread(target=server.serve_forever, daemon=True)
+		thread.start()
+
+		servers.append(server)
+
+		return server
+
+	yield start
+
+	for server in servers:
+		server.shutdown()
+		server.server_close()
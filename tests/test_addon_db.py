@@ -0,0 +1,34 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from wowupdate.updater.AddOnDb import AddOnDb
+from wowupdate.updater.Config import Config
+
+
+def test_prune_not_found_forgets_deleted_folders():
+	addondb = AddOnDb(Config())
+	addondb.recordNotFound('Deleted')
+	addondb.recordNotFound('MyAddon')
+	addondb.dirty = False
+
+	addondb.pruneNotFound(set(['myaddon']))
+
+	assert list(addondb.not_found.keys()) == ['MyAddon']
+	assert addondb.dirty
+
+	addondb.dirty = False
+	addondb.pruneNotFound(set(['myaddon']))
+
+	assert not addondb.dirty
@@ -0,0 +1,108 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import os
+
+from wowupdate.updater.AddOn import AddOn
+from wowupdate.updater.AddOn import Toc
+from wowupdate.updater.addon_scanner import list_existing_names
+from wowupdate.updater.addon_scanner import remove_sub_addons
+from wowupdate.updater.addon_scanner import split_abandoned_addons
+
+
+def create_addon(name, version='1.0', dependencies=None):
+	toc = Toc()
+	toc.version = version
+
+	if dependencies is not None:
+		toc.dependencies = dependencies
+
+	return AddOn.fromToc(name, toc)
+
+
+def get_names(addons):
+	return [addon.name for addon in addons]
+
+
+def test_remove_sub_addons_keeps_top_level_addons():
+	addons = [
+		create_addon('Alpha'),
+		create_addon('Beta'),
+		create_addon('Gamma', dependencies=['Alpha']),
+	]
+
+	# Gamma depends on Alpha, but is no part of the Alpha package
+	assert get_names(remove_sub_addons(addons)) == ['Alpha', 'Beta', 'Gamma']
+
+
+def test_remove_sub_addons_drops_sub_addons():
+	addons = [
+		create_addon('DBM-Core'),
+		create_addon('DBM-Core_Options', dependencies=['DBM-Core']),
+		create_addon('Other'),
+		create_addon('DBM-Core_Raids', dependencies=['Other', 'DBM-Core']),
+	]
+
+	assert get_names(remove_sub_addons(addons)) == ['DBM-Core', 'Other']
+
+
+def test_remove_sub_addons_checks_the_first_addon():
+	# the first addon is a sub addon itself and has to be dropped as well
+	addons = [
+		create_addon('Suite_Module', dependencies=['Suite']),
+		create_addon('Suite'),
+	]
+
+	assert get_names(remove_sub_addons(addons)) == ['Suite']
+
+
+def test_remove_sub_addons_keeps_the_first_addon():
+	addons = [
+		create_addon('Suite'),
+		create_addon('Suite_Module', dependencies=['Suite']),
+	]
+
+	assert get_names(remove_sub_addons(addons)) == ['Suite']
+
+
+def test_remove_sub_addons_keeps_sub_addons_of_another_version():
+	addons = [
+		create_addon('Suite', version='2.0'),
+		create_addon('Suite_Module', version='1.0', dependencies=['Suite']),
+	]
+
+	assert get_names(remove_sub_addons(addons)) == ['Suite', 'Suite_Module']
+
+
+def test_split_abandoned_addons_ignores_case():
+	addons = [
+		create_addon('Alpha'),
+		create_addon('Beta'),
+		create_addon('Gone'),
+	]
+
+	# a folder renamed to a different case on a case insensitive file system
+	existing_names = set(['alpha', 'beta'])
+
+	existing, abandoned = split_abandoned_addons(addons, existing_names)
+
+	assert get_names(existing) == ['Alpha', 'Beta']
+	assert get_names(abandoned) == ['Gone']
+
+
+def test_list_existing_names(tmp_path):
+	os.mkdir(os.path.join(str(tmp_path), 'MyAddon'))
+
+	assert list_existing_names(str(tmp_path)) == set(['myaddon'])
@@ -0,0 +1,274 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import concurrent.futures
+import urllib.error
+
+import pytest
+
+from wowupdate.updater.Config import Config
+
+
+class NoThreadsExecutor(concurrent.futures.ThreadPoolExecutor):
+	def submit(self, function, *args, **kwargs):
+		raise AssertionError("a thread was used for %s" % function)
+
+
+async def read_request(reader):
+	# returns the path of the request, or None when the client closed the connection
+	request_line = await reader.readline()
+
+	if len(request_line) == 0:
+		return None
+
+	content_length = 0
+
+	while True:
+		line = await reader.readline()
+
+		if line in (b'\r\n', b''):
+			break
+
+		name, _, value = line.decode('iso-8859-1').partition(':')
+
+		if name.strip().lower() == 'content-length':
+			content_length = int(value)
+
+	await reader.readexactly(content_length)
+
+	return request_line.split()[1].decode('iso-8859-1')
+
+
+def write_response(writer, status, body, headers=None):
+	lines = ['HTTP/1.1 %i Status' % status, 'Content-Length: %i' % len(body)]
+
+	for name, value in (headers or {}).items():
+		lines.append('%s: %s' % (name, value))
+
+	writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1') + body)
+
+
+async def start_server(handle):
+	server = await asyncio.start_server(handle, '127.0.0.1', 0)
+
+	return server, 'http://127.0.0.1:%i' % server.sockets[0].getsockname()[1]
+
+
+async def stop(config, server):
+	# closing the kept-alive connections ends the server's handlers
+	await config.http_pool.async_pool.close()
+
+	server.close()
+	await server.wait_closed()
+	await asyncio.sleep(0.01)
+
+
+def create_config(tmp_path, **settings):
+	config = Config()
+	config.config['http-cache-dir'] = str(tmp_path)
+	config.config.update(settings)
+
+	return config
+
+
+def test_requests_wait_for_the_network_without_threads(tmp_path):
+	config = create_config(tmp_path, **{'http-max-connections': 200})
+	count = 100
+
+	async def run():
+		all_arrived = asyncio.Event()
+		arrived = 0
+
+		async def handle(reader, writer):
+			nonlocal arrived
+
+			path = await read_request(reader)
+			arrived += 1
+
+			if arrived == count:
+				all_arrived.set()
+
+			# no response is sent before all requests were received
+			await all_arrived.wait()
+
+			write_response(writer, 200, path.encode('utf-8'))
+			await writer.drain()
+			writer.close()
+
+		server, base_url = await start_server(handle)
+		asyncio.get_running_loop().set_default_executor(NoThreadsExecutor())
+
+		async def get(i):
+			with await config.http.getAsync('%s/%i' % (base_url, i)) as response:
+				return response.read()
+
+		try:
+			return await asyncio.wait_for(asyncio.gather(*[get(i) for i in range(count)]), 10)
+
+		finally:
+			await stop(config, server)
+
+	assert asyncio.run(run()) == [('/%i' % i).encode('utf-8') for i in range(count)]
+
+
+def test_connections_in_use_are_limited(tmp_path):
+	config = create_config(tmp_path, **{'http-max-connections': 5, 'http-pool-size': 0})
+	open_connections = 0
+	max_open_connections = 0
+
+	async def run():
+		async def handle(reader, writer):
+			nonlocal open_connections, max_open_connections
+
+			open_connections += 1
+			max_open_connections = max(max_open_connections, open_connections)
+
+			await read_request(reader)
+			await asyncio.sleep(0.01)
+
+			write_response(writer, 200, b'ok')
+			await writer.drain()
+
+			# the connection isn't kept open by the client
+			await reader.read()
+			writer.close()
+			open_connections -= 1
+
+		server, base_url = await start_server(handle)
+
+		async def get():
+			with await config.http.getAsync(base_url + '/') as response:
+				return response.read()
+
+		try:
+			return await asyncio.gather(*[get() for _ in range(20)])
+
+		finally:
+			await stop(config, server)
+
+	assert asyncio.run(run()) == [b'ok'] * 20
+	assert max_open_connections == 5
+
+
+def test_chunked_responses_keep_the_connection_open(tmp_path):
+	config = create_config(tmp_path)
+	connections = 0
+
+	async def run():
+		async def handle(reader, writer):
+			nonlocal connections
+			connections += 1
+
+			while await read_request(reader) is not None:
+				writer.write(b'HTTP/1.1 200 OK\r\nTransfer-Encoding: chunked\r\n\r\n5;name=value\r\nhello\r\n6\r\n world\r\n0\r\nTrailer: x\r\n\r\n')
+				await writer.drain()
+
+			writer.close()
+
+		server, base_url = await start_server(handle)
+		bodies = []
+
+		try:
+			for _ in range(3):
+				with await config.http.getAsync(base_url + '/') as response:
+					bodies.append(response.read())
+
+			await config.http_pool.async_pool.close()
+
+		finally:
+			await stop(config, server)
+
+		return bodies
+
+	assert asyncio.run(run()) == [b'hello world'] * 3
+	assert connections == 1
+
+
+def test_redirects_are_followed_and_errors_raised(tmp_path):
+	config = create_config(tmp_path)
+
+	async def run():
+		async def handle(reader, writer):
+			while True:
+				path = await read_request(reader)
+
+				if path is None:
+					break
+				elif path == '/old':
+					write_response(writer, 302, b'moved', {'Location': '/new'})
+				elif path == '/new':
+					write_response(writer, 200, b'new')
+				else:
+					write_response(writer, 404, b'missing')
+
+				await writer.drain()
+
+			writer.close()
+
+		server, base_url = await start_server(handle)
+
+		try:
+			with await config.http.getAsync(base_url + '/old') as response:
+				assert response.url == base_url + '/new'
+				assert response.read() == b'new'
+
+			with pytest.raises(urllib.error.HTTPError) as exc_info:
+				await config.http.getAsync(base_url + '/gone')
+
+			assert exc_info.value.code == 404
+			assert exc_info.value.read() == b'missing'
+
+		finally:
+			await stop(config, server)
+
+	asyncio.run(run())
+
+
+def test_responses_are_cached(tmp_path):
+	config = create_config(tmp_path)
+	requests = []
+
+	async def run():
+		async def handle(reader, writer):
+			while True:
+				path = await read_request(reader)
+
+				if path is None:
+					break
+
+				requests.append(path)
+				write_response(writer, 200, b'{"id": 1}', {'Cache-Control': 'max-age=60', 'ETag': '"v1"'})
+				await writer.drain()
+
+			writer.close()
+
+		server, base_url = await start_server(handle)
+		bodies = []
+
+		try:
+			for _ in range(2):
+				with await config.http.getAsync(base_url + '/data', cache=True) as response:
+					bodies.append(response.read())
+
+		finally:
+			await stop(config, server)
+
+		return bodies
+
+	assert asyncio.run(run()) == [b'{"id": 1}'] * 2
+	assert requests == ['/data']
+	assert config.http_cache.hits == 1
@@ -0,0 +1,108 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import gzip
+import io
+import zlib
+
+import pytest
+
+from wowupdate.updater import content_decoding
+from wowupdate.updater.content_decoding import UnsupportedContentEncoding
+from wowupdate.updater.content_decoding import decode_response
+from wowupdate.updater.content_decoding import read_json_from_response
+
+
+class FakeResponse(io.BytesIO):
+	def __init__(self, data, content_encoding=None):
+		io.BytesIO.__init__(self, data)
+		self.headers = {}
+
+		if content_encoding is not None:
+			self.headers['Content-Encoding'] = content_encoding
+
+
+def raw_deflate(data):
+	compressor = zlib.compressobj(wbits=-zlib.MAX_WBITS)
+
+	return compressor.compress(data) + compressor.flush()
+
+
+def decode(data, content_encoding):
+	with decode_response(FakeResponse(data, content_encoding)) as stream:
+		return stream.read()
+
+
+text = b'local addon, ns = ...\n' * 100
+
+
+def test_response_without_encoding_is_returned_unchanged():
+	response = FakeResponse(text)
+
+	assert decode_response(response) is response
+
+	response = FakeResponse(text, 'identity')
+
+	assert decode_response(response) is response
+
+
+def test_gzip():
+	assert decode(gzip.compress(text), 'gzip') == text
+
+
+def test_gzip_with_several_members():
+	assert decode(gzip.compress(b'first\n') + gzip.compress(b'second\n'), 'gzip') == b'first\nsecond\n'
+
+
+def test_deflate_with_zlib_header():
+	assert decode(zlib.compress(text), 'deflate') == text
+
+
+def test_deflate_without_zlib_header():
+	assert decode(raw_deflate(text), 'deflate') == text
+
+
+def test_output_larger_than_a_chunk_is_continued_from_the_unconsumed_input():
+	# the compressed data fits into a single read, but decompresses to many chunks
+	data = bytes(range(256)) * (content_decoding.decode_chunk_size // 16)
+	compressed = gzip.compress(data)
+
+	assert len(compressed) < content_decoding.decode_chunk_size
+	assert decode(compressed, 'gzip') == data
+
+
+def test_input_received_in_small_parts():
+	class SlowResponse(FakeResponse):
+		def read(self, size=-1):
+			return FakeResponse.read(self, 7)
+
+	with decode_response(SlowResponse(gzip.compress(b'a') + gzip.compress(text), 'gzip')) as stream:
+		assert stream.read() == b'a' + text
+
+
+def test_stacked_encodings_are_decoded_in_reverse_order():
+	# deflate was applied first, gzip last
+	assert decode(gzip.compress(zlib.compress(text)), 'deflate, gzip') == text
+	assert decode(gzip.compress(zlib.compress(text)), 'Deflate, identity, GZIP') == text
+
+
+def test_unsupported_encoding():
+	with pytest.raises(UnsupportedContentEncoding):
+		decode_response(FakeResponse(text, 'compress'))
+
+
+def test_json_is_read_from_a_compressed_response():
+	assert read_json_from_response(FakeResponse(gzip.compress(b'{"id": 1}'), 'gzip')) == {'id': 1}
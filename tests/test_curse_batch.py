@@ -0,0 +1,96 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+
+from wowupdate.updater.AddOn import AddOn
+from wowupdate.updater.Config import Config
+from wowupdate.updater.CurseUpdater import CurseUpdater
+
+
+def create_updater(server, tmp_path):
+	config = Config()
+	config.config['curse-api-url'] = 'http://localhost:%i/api/v2' % server.server_address[1]
+	config.config['http-cache-dir'] = str(tmp_path)
+
+	return CurseUpdater(config)
+
+
+def create_addons(project_ids):
+	addons = []
+
+	for project_id in project_ids:
+		addon = AddOn('Project%i' % project_id)
+		addon.toc.curse_project_id = str(project_id)
+		addons.append(addon)
+
+	return addons
+
+
+def test_prefetched_projects_need_no_further_requests(start_mock_server, tmp_path):
+	server = start_mock_server(version='2.0')
+	updater = create_updater(server, tmp_path)
+	addons = create_addons([3, 1, 2])
+
+	updater.prefetchUpdatesFor(addons)
+
+	for addon in addons:
+		downloadable = updater.findUpdateFor(addon)
+
+		assert downloadable.name == addon.name
+		assert downloadable.version == '2.0'
+
+	assert server.state.requests == {'addon-batch': 1}
+
+
+def test_project_missing_from_batch_is_requested_by_id(start_mock_server, tmp_path):
+	server = start_mock_server(version='2.0', missing_projects=[2])
+	updater = create_updater(server, tmp_path)
+	addons = create_addons([1, 2, 3])
+
+	updater.prefetchUpdatesFor(addons)
+
+	assert [updater.findUpdateFor(addon).name for addon in addons] == ['Project1', 'Project2', 'Project3']
+	assert server.state.requests == {'addon-batch': 1, 'addon': 1}
+
+
+def test_prefetched_projects_are_downloaded_async(start_mock_server, tmp_path):
+	server = start_mock_server(version='2.0', missing_projects=[2])
+	updater = create_updater(server, tmp_path)
+	updater.config.config['download-cache-dir'] = str(tmp_path / 'archives')
+	updater.config.config['curse-batch-size'] = 2
+	addons = create_addons([1, 2, 3, 4])
+
+	async def update():
+		try:
+			await updater.prefetchUpdatesForAsync(addons)
+
+			downloadables = await asyncio.gather(*[updater.findUpdateForAsync(addon) for addon in addons])
+			installables = await asyncio.gather(*[downloadable.downloadAsync() for downloadable in downloadables])
+
+			return downloadables, installables
+
+		finally:
+			await updater.config.http_pool.async_pool.close()
+
+	downloadables, installables = asyncio.run(update())
+
+	assert [downloadable.name for downloadable in downloadables] == ['Project1', 'Project2', 'Project3', 'Project4']
+	assert [installable.folders for installable in installables] == [set([addon.name]) for addon in addons]
+	assert server.state.requests == {'addon-batch': 2, 'addon': 1, 'file': 4}
+
+	for installable in installables:
+		installable.close()
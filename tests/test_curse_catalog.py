@@ -0,0 +1,52 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from wowupdate.updater.AddOn import AddOn
+from wowupdate.updater.Config import Config
+from wowupdate.updater.CurseUpdater import CurseUpdater
+
+
+def create_project_json_data(project_id, name, folders, downloads=0):
+	return {
+		'id':            project_id,
+		'name':          name,
+		'slug':          name.lower().replace(' ', '-'),
+		'downloadCount': downloads,
+		'latestFiles':   [{'modules': [{'foldername': folder} for folder in folders]}],
+	}
+
+
+def test_catalog_identifies_addons_by_name(tmp_path, monkeypatch):
+	monkeypatch.setenv('XDG_CACHE_HOME', str(tmp_path))
+	monkeypatch.delenv('LOCALAPPDATA', raising=False)
+
+	updater = CurseUpdater(Config())
+	updater.catalog.update(
+		[
+			create_project_json_data(1, 'Deadly Boss Mods', ['DBM-Core', 'DBM-GUI'], downloads=100),
+			create_project_json_data(2, 'Deadly Boss Mods Fork', ['DBM-Core'], downloads=10),
+			create_project_json_data(3, 'Details', ['Details']),
+		],
+		0
+	)
+
+	addons = [AddOn('DBM-Core'), AddOn('details'), AddOn('Unknown')]
+	identified = updater.identifyAddonsByName(addons)
+
+	# the most popular project wins, names are matched ignoring their case
+	assert [addon.name for addon in identified] == ['DBM-Core', 'details']
+	assert addons[0].toc.curse_project_id == '1'
+	assert addons[1].toc.curse_project_id == '3'
+	assert addons[2].toc.curse_project_id is None
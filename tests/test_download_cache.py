@@ -0,0 +1,96 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import threading
+
+from wowupdate.updater.Config import Config
+from wowupdate.updater.DownloadCache import DownloadCache
+from wowupdate.updater.ZipInstaller import ZipDownloadable
+from wowupdate.updater.ZipInstaller import downloadZipFromResponse
+
+
+class FakeResponse(io.BytesIO):
+	def __init__(self, data):
+		io.BytesIO.__init__(self, data)
+		self.headers = {}
+
+
+def create_unusable_cache_config(tmp_path):
+	# a cache directory below a regular file can never be created
+	blocker = os.path.join(str(tmp_path), 'blocker')
+
+	with io.open(blocker, 'w') as output:
+		output.write('')
+
+	config = Config()
+	config.config['download-cache-dir'] = os.path.join(blocker, 'archives')
+
+	return config
+
+
+def test_unusable_cache_falls_back_to_memory(start_mock_server, tmp_path):
+	server = start_mock_server()
+	config = create_unusable_cache_config(tmp_path)
+	data = server.state.getArchive('Project1')
+
+	installable = downloadZipFromResponse(FakeResponse(data), name='Project1', cache=config.download_cache)
+
+	assert installable.content_hash is None
+	assert installable.folders == set(['Project1'])
+	installable.close()
+
+
+def test_unusable_cache_falls_back_to_uncached_download(start_mock_server, tmp_path):
+	server = start_mock_server()
+	config = create_unusable_cache_config(tmp_path)
+	url = 'http://localhost:%i/files/1/Project1.zip' % server.server_address[1]
+
+	downloadable = ZipDownloadable(url=url, cache=config.download_cache, session=config.http)
+	downloadable.name = 'Project1'
+	installable = downloadable.download()
+
+	assert installable.folders == set(['Project1'])
+	assert installable.version == '2.0'
+	installable.close()
+
+
+def test_index_is_shared_between_caches(tmp_path):
+	config = Config()
+	config.config['download-cache-dir'] = str(tmp_path)
+
+	errors = []
+
+	# separate instances only share the lock file, like separate processes
+	def store(i):
+		try:
+			cache = DownloadCache(config)
+			cache.store(io.BytesIO(b'archive %i' % i), url='http://localhost/%i.zip' % i)
+
+		except Exception as exc:
+			errors.append(exc)
+
+	threads = [threading.Thread(target=store, args=(i,)) for i in range(20)]
+
+	for thread in threads:
+		thread.start()
+
+	for thread in threads:
+		thread.join()
+
+	assert errors == []
+	assert DownloadCache(config).getStats()['archives'] == 20
+	assert DownloadCache(config).getStats()['urls'] == 20
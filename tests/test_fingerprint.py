@@ -0,0 +1,104 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+
+from wowupdate.updater.Config import Config
+from wowupdate.updater.Fingerprint import FolderFingerprinter
+from wowupdate.updater.Fingerprint import get_fingerprint_files
+from wowupdate.updater.Fingerprint import murmurhash2
+
+
+# an addon with files loaded through its toc and xml files, and files
+# like textures and readmes, which are not part of the fingerprint
+addon_files = {
+	'MyAddon/MyAddon.toc': (
+		'## Interface: 90005\r\n'
+		'## Title: My Addon\r\n'
+		'# Disabled.lua\r\n'
+		'embeds.xml\r\n'
+		'Core.lua\r\n'
+		'Locales\\enUS.lua\r\n'
+	),
+	'MyAddon/embeds.xml': (
+		'<Ui xmlns="http://www.blizzard.com/wow/ui/">\n'
+		'\t<Script file="Libs\\LibStub\\LibStub.lua"/>\n'
+		'\t<!-- <Script file="Unused.lua"/> -->\n'
+		'\t<Include file="libs/Lib.xml"/>\n'
+		'</Ui>\n'
+	),
+	'MyAddon/Libs/LibStub/LibStub.lua': 'LibStub = {}\n',
+	'MyAddon/Libs/Lib.xml':             '<Ui>\n\t<Script file="Lib.lua"/>\n</Ui>\n',
+	'MyAddon/Libs/Lib.lua':             'local lib = {}\n',
+	'MyAddon/Core.lua':                 'local addon = {}\n\nfunction addon:Init()\nend\n',
+	'MyAddon/Locales/enUS.lua':         'L = {}\n',
+	'MyAddon/Bindings.xml':             '<Bindings>\n</Bindings>\n',
+	'MyAddon/Disabled.lua':             'disabled\n',
+	'MyAddon/Unused.lua':               'unused\n',
+	'MyAddon/README.md':                '# My Addon\n',
+	'MyAddon/.pkgmeta':                 'package-as: MyAddon\n',
+	'MyAddon/Media/Texture.tga':        'texture\n',
+}
+
+fingerprinted_files = [
+	'MyAddon/Bindings.xml',
+	'MyAddon/Core.lua',
+	'MyAddon/Libs/Lib.lua',
+	'MyAddon/Libs/Lib.xml',
+	'MyAddon/Libs/LibStub/LibStub.lua',
+	'MyAddon/Locales/enUS.lua',
+	'MyAddon/MyAddon.toc',
+	'MyAddon/embeds.xml',
+]
+
+
+def create_addon(addons_dir):
+	for relative_path, content in addon_files.items():
+		path = os.path.join(addons_dir, *relative_path.split('/'))
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		with io.open(path, 'wb') as output:
+			output.write(content.encode('utf-8'))
+
+
+def test_murmurhash2():
+	# values of the reference implementation of MurmurHash2
+	assert murmurhash2(b'', 1) == 1540447798
+	assert murmurhash2(b'abc', 1) == 1621425345
+	assert murmurhash2(b'Thequickbrownfoxjumpsoverthelazydog', 1) == 3751777527
+
+
+def test_only_loaded_files_are_fingerprinted(tmp_path):
+	create_addon(str(tmp_path))
+
+	files = get_fingerprint_files(os.path.join(str(tmp_path), 'MyAddon'))
+	relative_paths = sorted([os.path.relpath(path, str(tmp_path)).replace(os.sep, '/') for path in files])
+
+	assert relative_paths == fingerprinted_files
+
+
+def test_folder_fingerprint(tmp_path):
+	create_addon(str(tmp_path))
+
+	config = Config()
+	config.addons_dir = str(tmp_path)
+	config.config['fingerprint-workers'] = 1
+
+	fingerprinter = FolderFingerprinter(config)
+
+	# calculated by the reference implementation of MurmurHash2 over the
+	# files listed above, the same way as the Curse client does
+	assert fingerprinter.getFingerprints(['MyAddon']) == {'MyAddon': 2828333892}
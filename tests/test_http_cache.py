@@ -0,0 +1,165 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import threading
+
+from http.server import BaseHTTPRequestHandler
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+from wowupdate.updater.Config import Config
+
+
+etag = '"v1"'
+
+
+class CacheTestHandler(BaseHTTPRequestHandler):
+	protocol_version = 'HTTP/1.1'
+
+	def do_GET(self):
+		server = self.server
+		server.requests.append(dict(self.headers))
+
+		if self.headers.get('If-None-Match') == etag:
+			self.send_response(304)
+			self.send_header('ETag', etag)
+			self.send_header('Content-Length', '0')
+			self.end_headers()
+			return
+
+		body = ('body for %s' % self.headers.get('Accept-Encoding')).encode('utf-8')
+
+		self.send_response(200)
+		self.send_header('Content-Length', str(len(body)))
+		self.send_header('ETag', etag)
+
+		for name, value in server.response_headers.items():
+			self.send_header(name, value)
+
+		self.end_headers()
+		self.wfile.write(body)
+
+
+	def log_message(self, format, *args):
+		pass
+
+
+@pytest.fixture
+def start_server():
+	servers = []
+
+	def start(**response_headers):
+		server = ThreadingHTTPServer(('localhost', 0), CacheTestHandler)
+		server.daemon_threads   = True
+		server.requests         = []
+		server.response_headers = response_headers
+
+		threading.Thread(target=server.serve_forever, daemon=True).start()
+		servers.append(server)
+
+		return server, 'http://localhost:%i/data.json' % server.server_address[1]
+
+	yield start
+
+	for server in servers:
+		server.shutdown()
+		server.server_close()
+
+
+def create_config(tmp_path):
+	config = Config()
+	config.config['http-cache-dir'] = str(tmp_path)
+
+	return config
+
+
+def get(config, url, headers=None):
+	with config.http.get(url, headers=headers, cache=True) as response:
+		return response.status, response.read()
+
+
+def test_fresh_response_is_used_without_request(start_server, tmp_path):
+	server, url = start_server(**{'Cache-Control': 'max-age=60'})
+	config = create_config(tmp_path)
+
+	assert get(config, url) == get(config, url)
+	assert len(server.requests) == 1
+	assert config.http_cache.hits == 1
+
+
+def test_age_is_added_to_the_time_stored(start_server, tmp_path):
+	# the response was already older than its lifetime when it arrived
+	server, url = start_server(**{'Cache-Control': 'max-age=60', 'Age': '100'})
+	config = create_config(tmp_path)
+
+	get(config, url)
+	get(config, url)
+
+	assert len(server.requests) == 2
+	assert server.requests[1].get('If-None-Match') == etag
+	assert config.http_cache.revalidations == 1
+
+
+def test_response_is_only_used_for_the_headers_it_varies_by(start_server, tmp_path):
+	server, url = start_server(**{'Cache-Control': 'max-age=60', 'Vary': 'Accept-Encoding'})
+	config = create_config(tmp_path)
+
+	assert get(config, url, {'Accept-Encoding': 'gzip'}) == (200, b'body for gzip')
+	assert get(config, url, {'Accept-Encoding': 'identity'}) == (200, b'body for identity')
+	assert get(config, url, {'Accept-Encoding': 'identity'}) == (200, b'body for identity')
+
+	assert len(server.requests) == 2
+	assert server.requests[1].get('If-None-Match') is None
+
+
+def test_vary_any_is_not_stored(start_server, tmp_path):
+	server, url = start_server(**{'Cache-Control': 'max-age=60', 'Vary': '*'})
+	config = create_config(tmp_path)
+
+	get(config, url)
+	get(config, url)
+
+	assert len(server.requests) == 2
+	assert config.http_cache.getStats()['responses'] == 0
+
+
+def test_not_modified_without_entry_is_requested_again(start_server, tmp_path):
+	server, url = start_server()
+	config = create_config(tmp_path)
+
+	# a caller's own validator makes the server answer 304, but there is no body to return
+	assert get(config, url, {'If-None-Match': etag}) == (200, b'body for identity')
+
+	assert len(server.requests) == 2
+	assert server.requests[1].get('If-None-Match') is None
+
+
+def test_not_modified_for_removed_entry_is_requested_again(start_server, tmp_path, monkeypatch):
+	server, url = start_server()
+	config = create_config(tmp_path)
+
+	get(config, url)
+
+	# the body disappears between the lookup and the 304 response
+	def open_removed_entry(key, entry):
+		raise FileNotFoundError(key)
+
+	monkeypatch.setattr(config.http_cache, 'openEntry', open_removed_entry)
+
+	assert get(config, url) == (200, b'body for identity')
+	assert [request.get('If-None-Match') for request in server.requests] == [None, etag, None]
+
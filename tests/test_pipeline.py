@@ -0,0 +1,48 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+from wowupdate.updater.Pipeline import PipelineStage
+
+
+def test_failing_items_dont_stop_the_stage():
+	processed = []
+	errors = []
+
+	async def process(item):
+		if item % 3 == 0:
+			raise ValueError("item %i" % item)
+
+		processed.append(item)
+
+	async def run():
+		# a single worker and a small queue, so a stopped worker would block put()
+		stage = PipelineStage('test', process, workers=1, queue_size=1, on_error=lambda item, exc: errors.append(item))
+		stage.start()
+
+		for item in range(10):
+			await stage.put(item)
+
+		await asyncio.wait_for(stage.close(), timeout=5)
+
+		return stage
+
+	stage = asyncio.run(run())
+
+	assert processed == [1, 2, 4, 5, 7, 8]
+	assert errors == [0, 3, 6, 9]
+	assert stage.processed == 10
+	assert stage.failed == 4
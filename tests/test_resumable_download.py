@@ -0,0 +1,114 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+import io
+import os
+
+import pytest
+
+from wowupdate.updater.Config import Config
+from wowupdate.updater.ResumableDownload import ResumableDownload
+
+
+@pytest.fixture
+def mock_server(start_mock_server):
+	return start_mock_server(file_size=200 * 1024, cut_after=64 * 1024)
+
+
+def get_url(server, name):
+	return 'http://localhost:%i/files/1/%s.zip' % (server.server_address[1], name)
+
+
+async def run_async(config, coroutine):
+	try:
+		return await coroutine
+
+	finally:
+		await config.http_pool.async_pool.close()
+
+
+def read_file(path):
+	with io.open(path, 'rb') as input:
+		return input.read()
+
+
+def test_download_resumes_after_disconnects(mock_server, tmp_path):
+	config = Config()
+	expected = mock_server.state.getArchive('Project1')
+
+	download = ResumableDownload(config.http, get_url(mock_server, 'Project1'), str(tmp_path), retries=5)
+	path = download.download()
+
+	assert read_file(path) == expected
+
+	ranges = mock_server.state.ranges
+	etag = ranges[1][1]
+
+	# each request continues at the end of the received data
+	assert ranges[0] == (None, None)
+	assert ranges[1:] == [('bytes=%i-' % (i * 64 * 1024), etag) for i in range(1, len(ranges))]
+	assert len(ranges) == (len(expected) + 64 * 1024 - 1) // (64 * 1024)
+	assert mock_server.state.requests['cut'] == len(ranges) - 1
+
+
+def test_download_resumes_after_disconnects_async(mock_server, tmp_path):
+	config = Config()
+	expected = mock_server.state.getArchive('Project1')
+
+	download = ResumableDownload(config.http, get_url(mock_server, 'Project1'), str(tmp_path), retries=5)
+	path = asyncio.run(run_async(config, download.downloadAsync()))
+
+	assert read_file(path) == expected
+	assert len(mock_server.state.ranges) == (len(expected) + 64 * 1024 - 1) // (64 * 1024)
+	assert mock_server.state.ranges[1][0] == 'bytes=%i-' % (64 * 1024)
+
+
+def test_download_gives_up_after_retries(mock_server, tmp_path):
+	config = Config()
+
+	download = ResumableDownload(config.http, get_url(mock_server, 'Project1'), str(tmp_path), retries=1)
+
+	with pytest.raises(Exception):
+		download.download()
+
+	# the received data is kept and continued with the next attempt
+	download.retries = 5
+	path = download.download()
+
+	assert read_file(path) == mock_server.state.getArchive('Project1')
+	assert mock_server.state.ranges[2][0] == 'bytes=%i-' % (2 * 64 * 1024)
+
+
+def test_download_cache_resumes_into_the_cache(mock_server, tmp_path):
+	config = Config()
+	config.config['download-cache-dir'] = str(tmp_path)
+	config.config['download-retries'] = 5
+
+	path, content_hash = config.download_cache.download(get_url(mock_server, 'Project2'))
+
+	assert read_file(path) == mock_server.state.getArchive('Project2')
+	assert os.listdir(config.download_cache.getPartialDir()) == []
+
+
+def test_download_cache_resumes_into_the_cache_async(mock_server, tmp_path):
+	config = Config()
+	config.config['download-cache-dir'] = str(tmp_path)
+	config.config['download-retries'] = 5
+
+	path, content_hash = asyncio.run(run_async(config, config.download_cache.downloadAsync(get_url(mock_server, 'Project2'))))
+
+	assert read_file(path) == mock_server.state.getArchive('Project2')
+	assert os.listdir(config.download_cache.getPartialDir()) == []
@@ -0,0 +1,133 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+
+import pytest
+
+from wowupdate.updater.AddOn import AddOn
+from wowupdate.updater.Config import Config
+from wowupdate.updater.RollbackStore import RollbackStore
+from wowupdate.updater.TSMUpdater import TSMAppDataInstallable
+
+
+def create_config(addons_dir):
+	config = Config()
+	config.addons_dir = str(addons_dir)
+
+	return config
+
+
+def write_file(path, content):
+	os.makedirs(os.path.dirname(path), exist_ok=True)
+
+	with io.open(path, 'w') as output:
+		output.write(content)
+
+
+def read_file(path):
+	with io.open(path, 'r') as input:
+		return input.read()
+
+
+def test_snapshot_keeps_content_of_replaced_tsm_appdata(tmp_path):
+	config = create_config(tmp_path)
+	store = RollbackStore(config)
+
+	appdata_path = os.path.join(str(tmp_path), 'TradeSkillMaster_AppHelper', 'AppData.lua')
+	write_file(appdata_path, 'old pricing data')
+
+	addon = AddOn('TradeSkillMaster_AppHelper')
+	addon.version = '1'
+
+	snapshot_id = store.create(addon, addon.folders)
+
+	installable = TSMAppDataInstallable(io.BytesIO(b'new pricing data'), '2')
+	installable.install(str(tmp_path))
+
+	snapshot_path = os.path.join(store.getAddonDir(addon.name), snapshot_id, 'TradeSkillMaster_AppHelper', 'AppData.lua')
+
+	assert read_file(appdata_path) == 'new pricing data'
+	assert read_file(snapshot_path) == 'old pricing data'
+	assert not os.path.exists(appdata_path + '.wowupdate-tmp')
+
+
+def test_restore_brings_back_previous_folders(tmp_path):
+	config = create_config(tmp_path)
+	store = RollbackStore(config)
+
+	write_file(os.path.join(str(tmp_path), 'Addon', 'Addon.toc'), '## Version: 1\n')
+
+	addon = AddOn('Addon')
+	addon.version = '1'
+	store.create(addon, addon.folders)
+
+	# installers replace files instead of writing into the linked ones
+	os.remove(os.path.join(str(tmp_path), 'Addon', 'Addon.toc'))
+	write_file(os.path.join(str(tmp_path), 'Addon', 'Addon.toc'), '## Version: 2\n')
+	write_file(os.path.join(str(tmp_path), 'Addon_New', 'Addon_New.toc'), '## Version: 2\n')
+	addon.folders.add('Addon_New')
+	addon.version = '2'
+
+	meta = store.restore(addon)
+
+	assert meta is not None
+	assert addon.version == '1'
+	assert addon.folders == set(['Addon'])
+	assert read_file(os.path.join(str(tmp_path), 'Addon', 'Addon.toc')) == '## Version: 1\n'
+	assert not os.path.exists(os.path.join(str(tmp_path), 'Addon_New'))
+
+
+def test_failed_restore_keeps_current_version(tmp_path, monkeypatch):
+	config = create_config(tmp_path)
+	store = RollbackStore(config)
+
+	for folder in ['Addon', 'Addon_Options']:
+		write_file(os.path.join(str(tmp_path), folder, folder + '.toc'), '## Version: 1\n')
+
+	addon = AddOn('Addon')
+	addon.folders.add('Addon_Options')
+	addon.version = '1'
+	store.create(addon, addon.folders)
+
+	for folder in ['Addon', 'Addon_Options']:
+		os.remove(os.path.join(str(tmp_path), folder, folder + '.toc'))
+		write_file(os.path.join(str(tmp_path), folder, folder + '.toc'), '## Version: 2\n')
+
+	addon.version = '2'
+
+	replace = os.replace
+
+	# fail when swapping in the second folder of the snapshot
+	def failing_replace(src, dst):
+		if os.path.basename(dst) == 'Addon_Options' and os.path.dirname(dst) == str(tmp_path):
+			if '.replaced' not in src:
+				raise OSError("simulated failure")
+
+		replace(src, dst)
+
+	monkeypatch.setattr(os, 'replace', failing_replace)
+
+	with pytest.raises(OSError):
+		store.restore(addon)
+
+	monkeypatch.setattr(os, 'replace', replace)
+
+	for folder in ['Addon', 'Addon_Options']:
+		assert read_file(os.path.join(str(tmp_path), folder, folder + '.toc')) == '## Version: 2\n'
+
+	assert [name for name in os.listdir(str(tmp_path)) if name.startswith('.wowupdate-')] == []
+	assert addon.version == '2'
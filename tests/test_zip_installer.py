@@ -0,0 +1,149 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import os
+import shutil
+import zipfile
+
+import pytest
+
+from wowupdate.updater import InstallManifest as install_manifest
+from wowupdate.updater.InstallManifest import InstallManifest
+from wowupdate.updater.ZipInstaller import createZipInstallable
+
+
+def create_archive(folders, version='1.0'):
+	data = io.BytesIO()
+
+	with zipfile.ZipFile(data, 'w', zipfile.ZIP_DEFLATED) as archive:
+		for folder in folders:
+			archive.writestr('%s/%s.toc' % (folder, folder), '## Version: %s\n' % version)
+			archive.writestr('%s/Core.lua' % folder, 'print("%s")\n' % folder)
+
+	data.seek(0)
+
+	return data
+
+
+def install(addons_dir, folders, install_mode, version='1.0'):
+	installable = createZipInstallable(create_archive(folders, version))
+	installable.install_mode = install_mode
+	installable.install(addons_dir)
+
+
+def read_toc(addons_dir, folder):
+	with io.open(os.path.join(addons_dir, folder, folder + '.toc'), 'r') as input:
+		return input.read()
+
+
+def list_staging_dirs(addons_dir):
+	return [name for name in os.listdir(addons_dir) if name.startswith('.wowupdate-')]
+
+
+def test_manifest_is_written_by_all_install_modes(tmp_path):
+	for install_mode in ['staged', 'direct', 'differential']:
+		addons_dir = os.path.join(str(tmp_path), install_mode)
+		os.mkdir(addons_dir)
+
+		install(addons_dir, ['Alpha'], install_mode)
+
+		manifest = InstallManifest(addons_dir)
+		manifest.open()
+
+		assert sorted(manifest.getFolder('Alpha').keys()) == ['Alpha.toc', 'Core.lua']
+
+
+def test_differential_install_after_staged_install_reads_no_files(tmp_path, monkeypatch):
+	addons_dir = str(tmp_path)
+	install(addons_dir, ['Alpha'], 'staged')
+
+	read_files = []
+
+	def file_crc32(path, chunk_size=64 * 1024):
+		read_files.append(path)
+		return 0
+
+	monkeypatch.setattr(install_manifest, 'file_crc32', file_crc32)
+
+	install(addons_dir, ['Alpha'], 'differential')
+
+	assert read_files == []
+
+
+def test_manifest_forgets_deleted_folders(tmp_path):
+	addons_dir = str(tmp_path)
+	install(addons_dir, ['Alpha', 'Beta'], 'staged')
+
+	shutil.rmtree(os.path.join(addons_dir, 'Beta'))
+	install(addons_dir, ['Alpha'], 'staged')
+
+	manifest = InstallManifest(addons_dir)
+	manifest.open()
+
+	assert sorted(manifest.folders.keys()) == ['Alpha']
+
+
+def test_staged_install_replaces_existing_folders(tmp_path):
+	addons_dir = str(tmp_path)
+	install(addons_dir, ['Alpha', 'Beta'], 'staged', '1.0')
+
+	# a file, which is not part of the new version, must not survive the swap
+	with io.open(os.path.join(addons_dir, 'Alpha', 'Obsolete.lua'), 'w') as output:
+		output.write('')
+
+	install(addons_dir, ['Alpha', 'Beta'], 'staged', '2.0')
+
+	for folder in ['Alpha', 'Beta']:
+		assert read_toc(addons_dir, folder) == '## Version: 2.0\n'
+
+	assert not os.path.exists(os.path.join(addons_dir, 'Alpha', 'Obsolete.lua'))
+	assert list_staging_dirs(addons_dir) == []
+
+
+def test_failed_staged_install_keeps_previous_version(tmp_path, monkeypatch):
+	addons_dir = str(tmp_path)
+	install(addons_dir, ['Alpha', 'Beta'], 'staged', '1.0')
+
+	installable = createZipInstallable(create_archive(['Alpha', 'Beta'], '2.0'))
+	installable.install_mode = 'staged'
+
+	# swap in the first folder, then fail on the second one
+	swapped = []
+	replace = os.replace
+
+	def failing_replace(src, dst):
+		if os.path.dirname(dst) == addons_dir and '.replaced' not in src:
+			if len(swapped) > 0:
+				raise OSError("simulated failure")
+
+			swapped.append(dst)
+
+		replace(src, dst)
+
+	monkeypatch.setattr(os, 'replace', failing_replace)
+
+	with pytest.raises(OSError):
+		installable.install(addons_dir)
+
+	monkeypatch.setattr(os, 'replace', replace)
+	installable.close()
+
+	assert len(swapped) == 1
+
+	for folder in ['Alpha', 'Beta']:
+		assert read_toc(addons_dir, folder) == '## Version: 1.0\n'
+
+	assert list_staging_dirs(addons_dir) == []
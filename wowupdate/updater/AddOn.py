@@ -106,6 +106,29 @@ class Toc:
 		return d
 
 
+	def to_json(self):
+		return {
+			'title':            self.title,
+			'version':          self.version,
+			'dependencies':     self.dependencies,
+			'curse_version':    self.curse_version,
+			'curse_project_id': self.curse_project_id,
+			'git_url':          self.git_url,
+			'website_url':      self.website_url,
+		}
+
+
+	@staticmethod
+	def from_json(data):
+		toc = Toc()
+
+		for key, value in data.items():
+			if hasattr(toc, key):
+				setattr(toc, key, value)
+
+		return toc
+
+
 	def __init__(self):
 		self.title				= None
 		self.version			= None
@@ -126,14 +149,19 @@ class AddOn:
 		toc = Toc.parseFile(os.path.join(path, name+'.toc'))
 
 		if toc is not None:
-			addon = AddOn(name)
-			addon.updateToc(toc)
-
-			return addon
+			return AddOn.fromToc(name, toc)
 
 		return None
 
 
+	@staticmethod
+	def fromToc(name, toc):
+		addon = AddOn(name)
+		addon.updateToc(toc)
+
+		return addon
+
+
 	def __init__(self, name):
 		self.name				= name
 		self.display_name		= name
@@ -142,6 +170,11 @@ class AddOn:
 		self.last_updated		= 0
 		self.ignore_updates		= False
 
+		# update check history
+		self.last_checked		= 0
+		self.remote_version		= None
+		self.release_history	= []
+
 		# add the addon name as a primary folder
 		self.folders.add(name)
 
@@ -172,11 +205,11 @@ class AddOn:
 		return False
 
 
-	def checkIfAnyFolderExists(self, addons_path):
+	def checkIfAnyFolderIn(self, existing_names):
+		# names are compared in lower case, since os.path.normcase does not
+		# fold the case on macOS, although its file systems ignore it as well
 		for f in self.folders:
-			path = os.path.join(addons_path, f)
-
-			if os.path.exists(path):
+			if f.lower() in existing_names:
 				return True
 
 		return False
@@ -216,6 +249,15 @@ class AddOn:
 		if self.ignore_updates:
 			data['ignore-updates'] = self.ignore_updates
 
+		if self.last_checked > 0:
+			data['last-checked'] = self.last_checked
+
+		if self.remote_version is not None:
+			data['remote-version'] = self.remote_version
+
+		if len(self.release_history) > 0:
+			data['release-history'] = self.release_history
+
 		return data
 
 
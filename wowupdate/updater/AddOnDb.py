@@ -17,8 +17,11 @@ import io
 import json
 import os
 
+from time import time
+
 from wowupdate.updater.AddOn import AddOn
 from wowupdate.updater.AddOn import Toc
+from wowupdate.updater.check_scheduler import is_not_found_retry_due
 
 
 addondb_filename = 'addons.db.json'
@@ -30,23 +33,55 @@ class AddOnDb:
 		self.dirty  = False
 		self.addons = {}
 
+		# maps each folder to the addons it belongs to, usually just one
+		self.folder_owners  = {}
+		self.addon_folders  = {}
+
+		# addons, which could not be found by any updater
+		self.not_found = {}
+
 
 	def clear(self):
 		self.addons = {}
+		self.folder_owners = {}
+		self.addon_folders = {}
 		self.dirty = True
 
 
 	def add(self, addon):
+		self.unindexFolders(addon.name)
 		self.addons[addon.name] = addon
+		self.indexFolders(addon)
 		self.dirty = True
 
 
 	def remove(self, addon):
 		if addon.name in self.addons:
+			self.unindexFolders(addon.name)
 			del self.addons[addon.name]
 			self.dirty = True
 
 
+	def indexFolders(self, addon):
+		folders = set(addon.folders)
+
+		for folder in folders:
+			self.folder_owners.setdefault(folder, []).append(addon)
+
+		self.addon_folders[addon.name] = folders
+
+
+	def unindexFolders(self, addon_name):
+		if addon_name in self.addon_folders:
+			for folder in self.addon_folders.pop(addon_name):
+				owners = [owner for owner in self.folder_owners[folder] if owner.name != addon_name]
+
+				if len(owners) > 0:
+					self.folder_owners[folder] = owners
+				else:
+					del self.folder_owners[folder]
+
+
 	def getAddons(self):
 		addons = []
 
@@ -57,11 +92,47 @@ class AddOnDb:
 
 
 	def isFolderKnown(self, folder):
-		for addon in self.addons.values():
-			if folder in addon.folders:
-				return True
+		return folder in self.folder_owners
+
+
+	def getFolderOwner(self, folder):
+		if folder in self.folder_owners:
+			return self.folder_owners[folder][0]
+
+		return None
+
+
+	def isNotFoundRetryDue(self, addon_name):
+		if addon_name not in self.not_found:
+			return True
 
-		return False
+		return is_not_found_retry_due(self.not_found[addon_name])
+
+
+	def recordNotFound(self, addon_name):
+		entry = self.not_found.get(addon_name, {'attempts': 0})
+		entry['attempts'] += 1
+		entry['last-attempt'] = int(time())
+
+		self.not_found[addon_name] = entry
+		self.dirty = True
+
+
+	def clearNotFound(self, addon_name=None):
+		if addon_name is None:
+			self.not_found = {}
+			self.dirty = True
+		elif addon_name in self.not_found:
+			del self.not_found[addon_name]
+			self.dirty = True
+
+
+	def pruneNotFound(self, existing_names):
+		# forget addons, which were deleted from the AddOns directory
+		for addon_name in list(self.not_found.keys()):
+			if addon_name.lower() not in existing_names:
+				del self.not_found[addon_name]
+				self.dirty = True
 
 
 	def open(self):
@@ -105,12 +176,26 @@ class AddOnDb:
 					if 'ignore-updates' in addon_data:
 						addon.ignore_updates = addon_data['ignore-updates']
 
+					if 'last-checked' in addon_data:
+						addon.last_checked = addon_data['last-checked']
+
+					if 'remote-version' in addon_data:
+						addon.remote_version = addon_data['remote-version']
+
+					if 'release-history' in addon_data:
+						addon.release_history = addon_data['release-history']
+
 					addon.updateToc(toc)
 
+					self.unindexFolders(key)
 					self.addons[key] = addon
+					self.indexFolders(addon)
 
 				self.dirty = False
 
+			if 'not-found' in data:
+				self.not_found = data['not-found']
+
 			successful = True
 
 			if 'config' in data:
@@ -130,6 +215,9 @@ class AddOnDb:
 		json_data["addons"] = addon_data
 		json_data["config"] = self.config.config
 
+		if len(self.not_found) > 0:
+			json_data["not-found"] = self.not_found
+
 		#bytes = io.BytesIO()
 		#json.dump(json_data, bytes, sort_keys=True, indent=2)
 
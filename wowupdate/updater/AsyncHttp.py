@@ -0,0 +1,515 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import asyncio
+import email.parser
+import http.client
+import socket
+import tempfile
+import urllib.error
+import urllib.parse
+import urllib.request
+
+
+# number of connections in use at the same time, if not configured otherwise
+default_http_max_connections = 64
+
+# size of the chunks read from a response, when reading it completely
+read_chunk_size = 64 * 1024
+
+# bodies read completely are kept in memory up to this size, larger ones on disk
+buffer_spool_size = 4 * 1024 * 1024
+
+# limits of the response head, like http.client
+max_line_length  = 65536
+max_header_lines = 100
+
+
+
+async def wait(awaitable, timeout):
+	# a timeout is raised as socket.timeout, like by the blocking connections
+	try:
+		return await asyncio.wait_for(awaitable, timeout)
+
+	except asyncio.TimeoutError:
+		raise socket.timeout("timed out")
+
+
+async def read_line(reader, timeout):
+	try:
+		line = await wait(reader.readuntil(b'\n'), timeout)
+
+	except asyncio.IncompleteReadError as exc:
+		line = exc.partial
+
+	except asyncio.LimitOverrunError:
+		raise http.client.LineTooLong("header line")
+
+	if len(line) > max_line_length:
+		raise http.client.LineTooLong("header line")
+
+	return line
+
+
+def format_host(host, port, default_port):
+	if ':' in host:
+		host = '[%s]' % host
+
+	if port != default_port:
+		return '%s:%i' % (host, port)
+
+	return host
+
+
+
+# A connection on asyncio streams, which sends requests and reads responses
+# in the same way as http.client.HTTPConnection, but without blocking a
+# thread while waiting for the network.
+class AsyncHttpConnection:
+	def __init__(self, reader, writer, host_header, timeout):
+		self.reader        = reader
+		self.writer        = writer
+		self.host_header   = host_header
+		self.timeout       = timeout
+		self.absolute_urls = False
+
+
+	async def request(self, method, target, body=None, headers=None):
+		names = set([name.lower() for name in (headers or {}).keys()])
+		lines = ['%s %s HTTP/1.1' % (method, target)]
+
+		if 'host' not in names:
+			lines.append('Host: %s' % self.host_header)
+
+		# http.client asks for an uncompressed response as well
+		if 'accept-encoding' not in names:
+			lines.append('Accept-Encoding: identity')
+
+		if body is not None and 'content-length' not in names:
+			lines.append('Content-Length: %i' % len(body))
+
+		for name, value in (headers or {}).items():
+			lines.append('%s: %s' % (name, value))
+
+		self.writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('iso-8859-1'))
+
+		if body is not None:
+			self.writer.write(body)
+
+		await wait(self.writer.drain(), self.timeout)
+
+
+	async def getresponse(self):
+		# interim responses like '100 Continue' are skipped
+		while True:
+			version, status, reason = await self.readStatus()
+			headers = await self.readHeaders()
+
+			if status >= 200:
+				return version, status, reason, headers
+
+
+	async def readStatus(self):
+		line = await read_line(self.reader, self.timeout)
+
+		if len(line) == 0:
+			# the server closed a kept-alive connection
+			raise http.client.RemoteDisconnected("Remote end closed connection without response")
+
+		parts = line.decode('iso-8859-1').rstrip('\r\n').split(None, 2)
+
+		if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+			raise http.client.BadStatusLine(line)
+
+		try:
+			status = int(parts[1])
+
+		except ValueError:
+			raise http.client.BadStatusLine(line)
+
+		return parts[0], status, parts[2] if len(parts) > 2 else ''
+
+
+	async def readHeaders(self):
+		lines = []
+
+		while True:
+			line = await read_line(self.reader, self.timeout)
+
+			if line in (b'\r\n', b'\n', b''):
+				break
+
+			lines.append(line)
+
+			if len(lines) > max_header_lines:
+				raise http.client.HTTPException("got more than %d headers" % max_header_lines)
+
+		return email.parser.Parser(_class=http.client.HTTPMessage).parsestr(b''.join(lines).decode('iso-8859-1'))
+
+
+	def close(self):
+		self.writer.close()
+
+
+
+# Keeps connections open after a response was read completely, with the
+# settings of the HttpConnectionPool of the blocking requests. Connections
+# and the limit of connections in use belong to the event loop, which
+# created them, so a new event loop starts with an empty pool.
+class AsyncHttpConnectionPool:
+	def __init__(self, pool):
+		self.pool        = pool
+		self.loop        = None
+		self.limit       = None
+		self.connections = {}
+
+
+	def getPoolSize(self):
+		return self.pool.getPoolSize()
+
+
+	def getTimeout(self):
+		return self.pool.getTimeout()
+
+
+	def getMaxConnections(self):
+		return max(1, int(self.pool.config.getConfig('http-max-connections', default_http_max_connections)))
+
+
+	def bind(self):
+		loop = asyncio.get_running_loop()
+
+		if loop is not self.loop:
+			self.loop        = loop
+			self.limit       = asyncio.Semaphore(self.getMaxConnections())
+			self.connections = {}
+
+
+	async def acquire(self, scheme, host, port):
+		self.bind()
+
+		# waits while too many connections are in use, idle ones don't count
+		await self.limit.acquire()
+
+		idle = self.connections.get((scheme, host, port))
+
+		if idle:
+			return idle.pop(), True
+
+		try:
+			return await self.createConnection(scheme, host, port), False
+
+		except:
+			self.limit.release()
+			raise
+
+
+	def release(self, scheme, host, port, connection, reuse=True):
+		idle = self.connections.setdefault((scheme, host, port), [])
+
+		if reuse and len(idle) < self.getPoolSize():
+			idle.append(connection)
+		else:
+			connection.close()
+
+		self.limit.release()
+
+
+	async def createConnection(self, scheme, host, port):
+		timeout = self.getTimeout()
+		ssl_context = self.pool.ssl_context if scheme == 'https' else None
+		host_header = format_host(host, port, 443 if scheme == 'https' else 80)
+		proxy = urllib.request.getproxies().get(scheme)
+
+		if proxy is not None and not urllib.request.proxy_bypass(host):
+			proxy_url = urllib.parse.urlsplit(proxy)
+
+			if scheme == 'https':
+				sock = await self.openTunnel(proxy_url.hostname, proxy_url.port or 80, host, port)
+				reader, writer = await wait(asyncio.open_connection(sock=sock, ssl=ssl_context, server_hostname=host), timeout)
+
+				return AsyncHttpConnection(reader, writer, host_header, timeout)
+
+			reader, writer = await wait(asyncio.open_connection(proxy_url.hostname, proxy_url.port or 80), timeout)
+
+			# requests through a plain http proxy contain the whole url
+			connection = AsyncHttpConnection(reader, writer, host_header, timeout)
+			connection.absolute_urls = True
+
+			return connection
+
+		reader, writer = await wait(asyncio.open_connection(host, port, ssl=ssl_context), timeout)
+
+		return AsyncHttpConnection(reader, writer, host_header, timeout)
+
+
+	async def openTunnel(self, proxy_host, proxy_port, host, port):
+		# connects to the proxy and asks it for a tunnel, TLS is started on the returned socket
+		loop = asyncio.get_running_loop()
+		timeout = self.getTimeout()
+		sock = None
+
+		for family, type, proto, _, address in await loop.getaddrinfo(proxy_host, proxy_port, type=socket.SOCK_STREAM):
+			sock = socket.socket(family, type, proto)
+			sock.setblocking(False)
+
+			try:
+				await wait(loop.sock_connect(sock, address), timeout)
+				break
+
+			except OSError:
+				sock.close()
+				sock = None
+
+		if sock is None:
+			raise urllib.error.URLError("can't connect to proxy %s:%i" % (proxy_host, proxy_port))
+
+		try:
+			target = format_host(host, port, None)
+			await wait(loop.sock_sendall(sock, ('CONNECT %s HTTP/1.1\r\nHost: %s\r\n\r\n' % (target, target)).encode('iso-8859-1')), timeout)
+
+			# the proxy sends nothing after its response, until the tunnel is used
+			head = b''
+
+			while b'\r\n\r\n' not in head:
+				data = await wait(loop.sock_recv(sock, 4096), timeout)
+
+				if len(data) == 0 or len(head) > max_line_length:
+					raise http.client.RemoteDisconnected("proxy closed the connection")
+
+				head += data
+
+			status_line = head.split(b'\r\n', 1)[0].decode('iso-8859-1')
+			parts = status_line.split(None, 2)
+
+			if len(parts) < 2 or parts[1] != '200':
+				raise OSError("Tunnel connection failed: %s" % status_line)
+
+		except:
+			sock.close()
+			raise
+
+		return sock
+
+
+	async def close(self):
+		connections = self.connections
+		self.connections = {}
+
+		closing = []
+
+		for idle in connections.values():
+			for connection in idle:
+				connection.close()
+				closing.append(connection.writer.wait_closed())
+
+		await asyncio.gather(*closing, return_exceptions=True)
+
+
+
+# The response of a request sent through an AsyncHttpConnectionPool. Its body
+# is read with 'await response.read(size)'. The connection goes back into the
+# pool when the response is closed after its body was read completely.
+class AsyncHttpResponse:
+	def __init__(self, pool, address, connection, method, version, status, reason, headers, url):
+		self.pool       = pool
+		self.address    = address
+		self.connection = connection
+		self.status     = status
+		self.reason     = reason
+		self.headers    = headers
+		self.url        = url
+
+		self.chunked   = 'chunked' in headers.get('Transfer-Encoding', '').lower()
+		self.remaining = None
+		self.chunk_left = 0
+		self.complete  = False
+
+		connection_header = headers.get('Connection', '').lower()
+
+		if version == 'HTTP/1.0':
+			self.will_close = 'keep-alive' not in connection_header
+		else:
+			self.will_close = 'close' in connection_header
+
+		if method == 'HEAD' or status in (204, 304):
+			self.complete = True
+
+		elif not self.chunked:
+			try:
+				self.remaining = int(headers.get('Content-Length'))
+
+				if self.remaining <= 0:
+					self.complete = True
+
+			except (TypeError, ValueError):
+				# the body ends when the connection is closed
+				self.will_close = True
+
+
+	async def read(self, size=-1):
+		if size is None or size < 0:
+			chunks = []
+
+			while True:
+				chunk = await self.read(read_chunk_size)
+
+				if len(chunk) == 0:
+					return b''.join(chunks)
+
+				chunks.append(chunk)
+
+		if self.complete or size == 0:
+			return b''
+
+		if self.chunked:
+			return await self.readChunked(size)
+
+		if self.remaining is not None:
+			data = await wait(self.connection.reader.read(min(size, self.remaining)), self.connection.timeout)
+
+			if len(data) == 0:
+				raise http.client.IncompleteRead(b'', self.remaining)
+
+			self.remaining -= len(data)
+
+			if self.remaining == 0:
+				self.complete = True
+
+			return data
+
+		data = await wait(self.connection.reader.read(size), self.connection.timeout)
+
+		if len(data) == 0:
+			self.complete = True
+
+		return data
+
+
+	async def readChunked(self, size):
+		reader = self.connection.reader
+		timeout = self.connection.timeout
+
+		try:
+			if self.chunk_left == 0:
+				line = await read_line(reader, timeout)
+
+				try:
+					self.chunk_left = int(line.split(b';', 1)[0], 16)
+
+				except ValueError:
+					raise http.client.IncompleteRead(b'')
+
+				if self.chunk_left == 0:
+					# skip the trailer
+					while (await read_line(reader, timeout)) not in (b'\r\n', b'\n', b''):
+						pass
+
+					self.complete = True
+
+					return b''
+
+			data = await wait(reader.readexactly(min(size, self.chunk_left)), timeout)
+			self.chunk_left -= len(data)
+
+			if self.chunk_left == 0:
+				await wait(reader.readexactly(2), timeout)
+
+			return data
+
+		except asyncio.IncompleteReadError as exc:
+			raise http.client.IncompleteRead(exc.partial)
+
+
+	def close(self):
+		if self.connection is None:
+			return
+
+		self.pool.release(*self.address, self.connection, reuse=(self.complete and not self.will_close))
+		self.connection = None
+
+
+	async def __aenter__(self):
+		return self
+
+
+	async def __aexit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+
+# A response, which was read completely, so it can be used like the response
+# of a blocking request: its body is read without awaiting anything.
+class BufferedHttpResponse:
+	def __init__(self, url, status, reason, headers, body):
+		self.url     = url
+		self.status  = status
+		self.reason  = reason
+		self.headers = headers
+		self.body    = body
+
+
+	def read(self, size=None):
+		if size is None or size < 0:
+			return self.body.read()
+
+		return self.body.read(size)
+
+
+	def readinto(self, buffer):
+		return self.body.readinto(buffer)
+
+
+	def geturl(self):
+		return self.url
+
+
+	def close(self):
+		self.body.close()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+
+async def buffer_response(response):
+	# reads the body into memory, or into a temporary file when it's large
+	body = tempfile.SpooledTemporaryFile(max_size=buffer_spool_size)
+
+	try:
+		while True:
+			chunk = await response.read(read_chunk_size)
+
+			if len(chunk) == 0:
+				break
+
+			body.write(chunk)
+
+	except:
+		body.close()
+		raise
+
+	finally:
+		response.close()
+
+	body.seek(0)
+
+	return BufferedHttpResponse(response.url, response.status, response.reason, response.headers, body)
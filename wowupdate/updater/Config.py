@@ -1,6 +1,10 @@
 
 from wowupdate.updater.CurseUpdater import CurseUpdater
+from wowupdate.updater.DownloadCache import DownloadCache
 from wowupdate.updater.GithubUpdater import GithubUpdater
+from wowupdate.updater.HttpCache import HttpCache
+from wowupdate.updater.HttpSession import HttpConnectionPool
+from wowupdate.updater.HttpSession import HttpSession
 from wowupdate.updater.TSMUpdater import TSMUpdater
 
 
@@ -8,6 +12,13 @@ class Config:
 	def __init__(self):
 		self.addons_dir = None
 		self.config = {}
+		self.download_cache = DownloadCache(self)
+
+		# connections are kept open and shared by all updaters
+		self.http_pool = HttpConnectionPool(self)
+		self.http_cache = HttpCache(self)
+		self.http = HttpSession(self.http_pool, cache=self.http_cache)
+
 		self.updaters = [
 			CurseUpdater(self),
 			GithubUpdater(self),
@@ -15,10 +26,10 @@ class Config:
 		]
 
 
-	def getConfig(self, key):
+	def getConfig(self, key, default=None):
 		if key in self.config:
 			return self.config[key]
 
-		return None
+		return default
 
 
@@ -0,0 +1,183 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import io
+import json
+import os
+import re
+import threading
+
+from time import time
+
+from wowupdate.updater.DownloadCache import get_user_cache_dir
+
+
+curse_catalog_filename = 'curse-catalog.json'
+
+# hours until the catalog is considered outdated, if not configured otherwise
+default_curse_catalog_max_age = 24
+
+regex_not_alnum = re.compile('[^a-z0-9]')
+
+
+
+def normalize_name(name):
+	# ignores case, spaces and punctuation, so 'Deadly Boss Mods' matches 'deadly-boss-mods'
+	return regex_not_alnum.sub('', name.lower())
+
+
+def parse_curse_date(value):
+	if value is None:
+		return 0
+
+	try:
+		date = datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S')
+		return int(date.replace(tzinfo=datetime.timezone.utc).timestamp())
+
+	except ValueError:
+		return 0
+
+
+
+# A local copy of the name, slug and folders of all WoW projects on Curse,
+# so unknown addons can be matched to a project without a search request.
+# The catalog is refreshed by requesting the most recently modified projects
+# until reaching the ones, which were already known at the last refresh.
+class CurseCatalog:
+	def __init__(self, config):
+		self.config   = config
+		self.lock     = threading.Lock()
+		self.loaded   = False
+		self.projects = {}
+		self.updated  = 0
+
+		# lookup tables of exact and normalized names to project ids
+		self.exact_names      = {}
+		self.normalized_names = {}
+
+
+	def getFilename(self):
+		return os.path.join(get_user_cache_dir(), curse_catalog_filename)
+
+
+	def open(self):
+		try:
+			with io.open(self.getFilename(), 'r') as input:
+				data = json.load(input)
+
+				self.projects = data.get('projects', {})
+				self.updated  = data.get('updated', 0)
+
+		except (OSError, ValueError):
+			self.projects = {}
+			self.updated  = 0
+
+		self.buildIndex()
+		self.loaded = True
+
+
+	def save(self):
+		path = self.getFilename()
+		tmp_path = path + '.tmp'
+
+		os.makedirs(os.path.dirname(path), exist_ok=True)
+
+		with io.open(tmp_path, 'w') as output:
+			json.dump({'projects': self.projects, 'updated': self.updated}, output, sort_keys=True)
+
+		os.replace(tmp_path, path)
+
+
+	def ensureLoaded(self):
+		with self.lock:
+			if not self.loaded:
+				self.open()
+
+
+	def isEmpty(self):
+		return len(self.projects) == 0
+
+
+	def isOutdated(self):
+		max_age = float(self.config.getConfig('curse-catalog-max-age', default_curse_catalog_max_age))
+
+		return time() - self.updated > max_age * 3600
+
+
+	def buildIndex(self):
+		exact_names = {}
+		normalized_names = {}
+
+		for project_id, project in self.projects.items():
+			names = [project['name'], project['slug']] + project['folders']
+
+			for name in names:
+				exact_names.setdefault(name, []).append(project_id)
+
+				normalized_name = normalize_name(name)
+
+				if normalized_name != '':
+					normalized_names.setdefault(normalized_name, []).append(project_id)
+
+		self.exact_names      = exact_names
+		self.normalized_names = normalized_names
+
+
+	def update(self, projects_json_data, updated, full=False):
+		projects = {} if full else dict(self.projects)
+
+		for json_data in projects_json_data:
+			folders = set()
+
+			for latest_file in json_data.get('latestFiles', []):
+				for module in latest_file.get('modules', []):
+					if 'foldername' in module:
+						folders.add(module['foldername'])
+
+			projects[str(json_data['id'])] = {
+				'name':      json_data['name'],
+				'slug':      json_data['slug'],
+				'folders':   sorted(folders),
+				'downloads': int(json_data.get('downloadCount', 0)),
+				'modified':  parse_curse_date(json_data.get('dateModified')),
+			}
+
+		with self.lock:
+			self.projects = projects
+			self.updated  = updated
+			self.loaded   = True
+			self.buildIndex()
+
+
+	def find(self, name):
+		self.ensureLoaded()
+
+		with self.lock:
+			projects         = self.projects
+			exact_names      = self.exact_names
+			normalized_names = self.normalized_names
+
+		# exact matches are preferred over normalized ones
+		project_ids = exact_names.get(name)
+
+		if project_ids is None:
+			project_ids = normalized_names.get(normalize_name(name))
+
+		if project_ids is None:
+			return None
+
+		# when several projects share a name, the most popular one is chosen
+		return max(project_ids, key=lambda project_id: projects[project_id]['downloads'])
@@ -13,20 +13,37 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
-import gzip
-import io
+import asyncio
 import json
 import re
-import urllib.error
+import threading
 import urllib.parse
-import urllib.request
 
+from time import time
+
+from wowupdate.updater.CurseCatalog import CurseCatalog
+from wowupdate.updater.CurseCatalog import parse_curse_date
+from wowupdate.updater.content_decoding import accept_encoding
+from wowupdate.updater.content_decoding import read_json_from_response
+from wowupdate.updater.HttpSession import HttpSession
 from wowupdate.updater.Updater import IUpdater
 from wowupdate.updater.Updater import DownloadableWrapper
 from wowupdate.updater.ZipInstaller import downloadZipFromResponse
 from wowupdate.updater.ZipInstaller import ZipDownloadable
 
 
+default_curse_api_url = 'https://addons-ecs.forgesvc.net/api/v2'
+
+# number of projects requested at once, if not configured otherwise
+default_curse_batch_size = 100
+
+# number of projects per page when refreshing the catalog
+catalog_page_size = 50
+
+# projects modified shortly before the last refresh are requested again
+catalog_refresh_overlap = 3600
+
+
 regex_download_links = [
 	re.compile('<a\\s+class="download__link"\\s+href="(/.*?/file)">'),
 	re.compile('Elerium.PublicProjectDownload.countdown\\("(/.*?/file)"\\);')
@@ -45,6 +62,35 @@ class CurseUpdater(IUpdater):
 	FILE_TYPE_BETA    = 2
 	FILE_TYPE_ALPHA   = 3
 
+	SORT_LAST_UPDATED = 2
+
+	def __init__(self, config):
+		IUpdater.__init__(self, config)
+
+		# the download pages expect the previous page as referer when following redirects
+		self.http = HttpSession(
+			config.http_pool,
+			headers={
+				'User-Agent':                'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:95.0) Gecko/20100101 Firefox/95.0',
+				'Accept':                    'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
+				'Accept-Charset':            'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
+				'Accept-Encoding':           accept_encoding,
+			},
+			send_referer=True,
+			cache=config.http_cache
+		)
+
+		# project data received by a bulk request, until an addon asks for it
+		self.prefetched      = {}
+		self.prefetched_lock = threading.Lock()
+
+		self.catalog = CurseCatalog(config)
+
+
+	def getApiUrl(self, path):
+		return self.config.getConfig('curse-api-url', default_curse_api_url) + path
+
+
 	def canHandle(self, addon):
 		if addon.toc.curse_project_id is None:
 			return False
@@ -69,46 +115,265 @@ class CurseUpdater(IUpdater):
 			)
 
 
+	async def findUpdateForAsync(self, addon):
+		project_id = addon.toc.curse_project_id
+
+		if project_id.isdecimal():
+			return await self.findDownloadByIdAsync(project_id, addon.name)
+		else:
+			return await self.findDownloadBySearchQueryAsync(
+					project_id,
+					selector=lambda json_data: json_data['slug'] == project_id
+			)
+
+
+	def getCacheKey(self, addon):
+		if addon.toc.curse_project_id is not None:
+			return 'curse:%s' % addon.toc.curse_project_id
+
+		return None
+
+
+	def createCacheEntry(self, downloadable):
+		entry = IUpdater.createCacheEntry(self, downloadable)
+		entry['name'] = downloadable.name
+
+		return entry
+
+
+	def createDownloadableFromCache(self, addon, entry):
+		downloadable = ZipDownloadable(url=entry['url'], cache=self.config.download_cache, session=self.http)
+		downloadable.name = entry['name']
+		downloadable.version = entry['version']
+
+		return downloadable
+
+
 	def findDownloadByName(self, addon_name):
-		return self.findDownloadBySearchQuery(
-				addon_name,
-				selector=lambda json_data: json_data['name'] == addon_name or json_data['slug'] == addon_name
-		)
+		project_id, search = self.findProjectInCatalog(addon_name)
 
+		if project_id is not None:
+			return self.findDownloadById(project_id, addon_name)
+
+		if not search:
+			return None
+
+		return self.findDownloadBySearchQuery(addon_name, selector=self.createNameSelector(addon_name))
+
+
+	async def findDownloadByNameAsync(self, addon_name):
+		project_id, search = self.findProjectInCatalog(addon_name)
+
+		if project_id is not None:
+			return await self.findDownloadByIdAsync(project_id, addon_name)
+
+		if not search:
+			return None
+
+		return await self.findDownloadBySearchQueryAsync(addon_name, selector=self.createNameSelector(addon_name))
+
+
+	def findProjectInCatalog(self, addon_name):
+		# returns the project id found in the catalog and whether a search is still needed
+		self.catalog.ensureLoaded()
+
+		if self.catalog.isEmpty():
+			return None, True
+
+		project_id = self.catalog.find(addon_name)
+
+		if project_id is not None:
+			return project_id, False
+
+		# projects released after the last refresh of the catalog can still be found by a search
+		return None, self.catalog.isOutdated()
+
+
+	def createNameSelector(self, addon_name):
+		return lambda json_data: json_data['name'] == addon_name or json_data['slug'] == addon_name
+
+
+	def identifyAddonsByName(self, addons):
+		self.catalog.ensureLoaded()
+
+		if self.catalog.isEmpty():
+			return []
+
+		identified = []
+
+		# the project ids are checked together with all other projects by a bulk request
+		for addon in addons:
+			project_id = self.catalog.find(addon.name)
+
+			if project_id is not None:
+				addon.toc.curse_project_id = project_id
+				identified.append(addon)
+
+		return identified
 
-	def findDownloadBySearchQuery(self, query, selector):
-		escaped_query = urllib.parse.quote(query)
-		url = ('https://addons-ecs.forgesvc.net/api/v2/addon/search?gameId=%i&pageSize=25&searchFilter=%s' % (self.GAME_ID_WOW, escaped_query))
 
-		try:
+	def refreshCatalog(self, full=False):
+		self.catalog.ensureLoaded()
+
+		started = int(time())
+		since = None
+
+		if not full and not self.catalog.isEmpty():
+			since = self.catalog.updated - catalog_refresh_overlap
+
+		projects = []
+		index = 0
+
+		# the most recently modified projects come first, so an incremental
+		# refresh stops at the first project not modified since the last one
+		while True:
+			url = self.getApiUrl('/addon/search?gameId=%i&sort=%i&sortOrder=desc&pageSize=%i&index=%i' % (
+				self.GAME_ID_WOW,
+				self.SORT_LAST_UPDATED,
+				catalog_page_size,
+				index
+			))
+
 			with self.httpget(url) as response:
-				text = self.readTextFromResponse(response)
-				json_data = json.loads(text)
+				json_data = read_json_from_response(response)
+
+			for project_json_data in json_data:
+				if since is not None and parse_curse_date(project_json_data.get('dateModified')) < since:
+					break
+
+				projects.append(project_json_data)
+
+			else:
+				if len(json_data) == catalog_page_size:
+					index += len(json_data)
+					continue
+
+			break
+
+		self.catalog.update(projects, started, full=(since is None))
+		self.catalog.save()
+
+		return len(projects)
+
+
+	def getSearchUrl(self, query):
+		escaped_query = urllib.parse.quote(query)
+
+		return self.getApiUrl('/addon/search?gameId=%i&pageSize=25&searchFilter=%s' % (self.GAME_ID_WOW, escaped_query))
+
+
+	def selectSearchResult(self, json_data, selector):
+		for addon_json_data in json_data:
+			if selector(addon_json_data):
+				return self.createDownloadableFromJsonData(addon_json_data)
+
+		return None
+
+
+	def findDownloadBySearchQuery(self, query, selector):
+		with self.httpget(self.getSearchUrl(query), cache=True) as response:
+			return self.selectSearchResult(read_json_from_response(response), selector)
+
+
+	async def findDownloadBySearchQueryAsync(self, query, selector):
+		with await self.httpgetAsync(self.getSearchUrl(query), cache=True) as response:
+			return self.selectSearchResult(read_json_from_response(response), selector)
+
+
+	def getPrefetchBatches(self, addons):
+		project_ids = set()
+
+		for addon in addons:
+			project_id = addon.toc.curse_project_id
+
+			if project_id is not None and project_id.isdecimal():
+				project_ids.add(int(project_id))
+
+		project_ids = sorted(project_ids)
+		batch_size = max(1, int(self.config.getConfig('curse-batch-size', default_curse_batch_size)))
 
-				for addon_json_data in json_data:
-					if selector(addon_json_data):
-						downloadable = self.createDownloadableFromJsonData(addon_json_data)
+		return [project_ids[start:start + batch_size] for start in range(0, len(project_ids), batch_size)]
 
-						return downloadable
 
-				return None
+	def storePrefetched(self, json_data):
+		with self.prefetched_lock:
+			for project_json_data in json_data:
+				self.prefetched[str(project_json_data['id'])] = project_json_data
 
-		except urllib.error.HTTPError as exc:
-			raise exc
+
+	def prefetchUpdatesFor(self, addons):
+		# query the data of many projects with a single request
+		for batch in self.getPrefetchBatches(addons):
+			with self.httppost(self.getApiUrl('/addon'), json.dumps(batch)) as response:
+				self.storePrefetched(read_json_from_response(response))
+
+
+	async def prefetchUpdatesForAsync(self, addons):
+		async def prefetch(batch):
+			with await self.httppostAsync(self.getApiUrl('/addon'), json.dumps(batch)) as response:
+				self.storePrefetched(read_json_from_response(response))
+
+		# all batches are requested at the same time
+		await asyncio.gather(*[prefetch(batch) for batch in self.getPrefetchBatches(addons)])
+
+
+	def takePrefetched(self, addon_id):
+		with self.prefetched_lock:
+			return self.prefetched.pop(addon_id, None)
+
+
+	def getProjectUrl(self, addon_id):
+		return self.getApiUrl('/addon/%s' % urllib.parse.quote(addon_id))
 
 
 	def findDownloadById(self, addon_id, addon_name):
-		url = ('https://addons-ecs.forgesvc.net/api/v2/addon/%s' % urllib.parse.quote(addon_id))
+		json_data = self.takePrefetched(addon_id)
 
-		try:
-			with self.httpget(url) as response:
-				text = self.readTextFromResponse(response)
-				json_data = json.loads(text)
+		if json_data is not None:
+			return self.createDownloadableFromJsonData(json_data)
+
+		# not part of a bulk request, or not returned by it
+		with self.httpget(self.getProjectUrl(addon_id), cache=True) as response:
+			return self.createDownloadableFromJsonData(read_json_from_response(response))
+
+
+	async def findDownloadByIdAsync(self, addon_id, addon_name):
+		json_data = self.takePrefetched(addon_id)
+
+		if json_data is not None:
+			return self.createDownloadableFromJsonData(json_data)
+
+		with await self.httpgetAsync(self.getProjectUrl(addon_id), cache=True) as response:
+			return self.createDownloadableFromJsonData(read_json_from_response(response))
 
-				return self.createDownloadableFromJsonData(json_data)
 
-		except urllib.error.HTTPError as exc:
-			raise exc
+	def identifyAddons(self, addons, fingerprints):
+		if len(fingerprints) == 0:
+			return []
+
+		# a single request for the fingerprints of all folders
+		url = self.getApiUrl('/fingerprint')
+		data = json.dumps(sorted(set(fingerprints.values())))
+
+		with self.httppost(url, data) as response:
+			json_data = read_json_from_response(response)
+
+		project_ids = {}
+
+		for match in json_data.get('exactMatches', []):
+			for module in match['file'].get('modules', []):
+				project_ids[module['fingerprint']] = match['id']
+
+		identified = []
+
+		for addon in addons:
+			fingerprint = fingerprints.get(addon.name)
+
+			if fingerprint in project_ids:
+				addon.toc.curse_project_id = str(project_ids[fingerprint])
+				identified.append(addon)
+
+		return identified
 
 
 	def createDownloadableFromJsonData(self, json_data):
@@ -132,61 +397,48 @@ class CurseUpdater(IUpdater):
 		if selected_file is not None:
 			file_url = selected_file['downloadUrl']
 
-			downloadable = ZipDownloadable(url=file_url)
+			downloadable = ZipDownloadable(url=file_url, cache=self.config.download_cache, session=self.http)
 			downloadable.name = json_data['name']
 			downloadable.version = selected_file['displayName']
 
 			return downloadable
 
 
-	class CurseRedirectHandler(urllib.request.HTTPRedirectHandler):
-		def __init__(self):
-			pass
+	def httpget(self, url, referer=None, cache=False):
+		return self.httprequest(url, referer=referer, cache=cache)
 
-		def redirect_request(self, req, fp, code, msg, headers, newurl):
-			referer = req.full_url
-			headers['Referer'] = referer
 
-			req = urllib.request.Request(url=newurl, headers=headers)
+	def httppost(self, url, data, content_type='application/json'):
+		return self.httprequest(url, data=data.encode('UTF-8'), content_type=content_type)
 
-			return req
 
+	def httprequest(self, url, referer=None, data=None, content_type=None, cache=False):
+		headers = self.getRequestHeaders(referer, content_type)
 
-	def httpget(self, url, referer=None):
-		headers = {
-			'User-Agent':                'Mozilla/5.0 (Windows NT 10.0; Win64; x64; rv:95.0) Gecko/20100101 Firefox/95.0',
-			'Accept':                    'text/html,application/xhtml+xml,application/xml;q=0.9,image/avif,image/webp,*/*;q=0.8',
-			'Accept-Charset':            'ISO-8859-1,utf-8;q=0.7,*;q=0.3',
-			'Accept-Encoding':           'gzip, deflate, br',
-			'Connection':                'keep-alive',
-		}
+		if data is None:
+			return self.http.get(url, headers=headers, cache=cache)
 
-		if referer is not None:
-			headers['Referer'] = referer
+		return self.http.post(url, data, headers=headers)
 
-		redirect_handler = self.CurseRedirectHandler()
 
-		opener = urllib.request.build_opener(redirect_handler)
-		urllib.request.install_opener(opener)
+	async def httpgetAsync(self, url, referer=None, cache=False):
+		return await self.http.getAsync(url, headers=self.getRequestHeaders(referer, None), cache=cache)
 
-		req = urllib.request.Request(url, headers=headers)
-		response = urllib.request.urlopen(req)
 
-		urllib.request.install_opener(None)
+	async def httppostAsync(self, url, data, content_type='application/json'):
+		return await self.http.postAsync(url, data.encode('UTF-8'), headers=self.getRequestHeaders(None, content_type))
 
-		return response
 
+	def getRequestHeaders(self, referer, content_type):
+		headers = {}
 
-	def readTextFromResponse(self, response):
-		data = response.read()
-
-		if len(data) >= 2 and data[0] == 0x1f and data[1] == 0x8b:
-			gz = gzip.GzipFile(fileobj=io.BytesIO(data))
-			data = gz.read()
+		if referer is not None:
+			headers['Referer'] = referer
 
-		text = data.decode('UTF-8')
+		if content_type is not None:
+			headers['Content-Type'] = content_type
 
-		return text
+		return headers
 
 
 	def createDownloadableFromDownloadPageResponse(self, addon_id, addon_name, response):
@@ -0,0 +1,356 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+
+from time import time
+
+from wowupdate.updater.ResumableDownload import ResumableDownload
+from wowupdate.updater.ResumableDownload import StorageError
+from wowupdate.updater.Updater import run_blocking
+
+# file locks are available on posix systems or on windows
+try:
+	import fcntl
+except ImportError:
+	fcntl = None
+
+try:
+	import msvcrt
+except ImportError:
+	msvcrt = None
+
+
+download_cache_index_filename = 'index.json'
+download_cache_lock_filename  = 'index.lock'
+
+# maximum size of all cached archives in MiB, if not configured otherwise
+default_download_cache_size = 512
+
+# number of times an interrupted download is resumed, if not configured otherwise
+default_download_retries = 3
+
+
+
+def get_user_cache_dir():
+	if 'LOCALAPPDATA' in os.environ:
+		base_dir = os.environ['LOCALAPPDATA']
+	elif 'XDG_CACHE_HOME' in os.environ:
+		base_dir = os.environ['XDG_CACHE_HOME']
+	else:
+		base_dir = os.path.join(os.path.expanduser('~'), '.cache')
+
+	return os.path.join(base_dir, 'wowupdate')
+
+
+
+# A lock shared by the threads of this process and by other processes, which
+# use the same lock file. Other processes may run an update of another game
+# installation at the same time, so changes of a shared index need this lock.
+class InterProcessLock:
+	def __init__(self, path):
+		self.path = path
+		self.lock = threading.Lock()
+		self.file = None
+
+
+	def __enter__(self):
+		self.lock.acquire()
+
+		try:
+			os.makedirs(os.path.dirname(self.path), exist_ok=True)
+			self.file = io.open(self.path, 'a+b')
+
+			if fcntl is not None:
+				fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+			elif msvcrt is not None:
+				self.file.seek(0)
+				msvcrt.locking(self.file.fileno(), msvcrt.LK_LOCK, 1)
+
+		except:
+			if self.file is not None:
+				self.file.close()
+				self.file = None
+
+			self.lock.release()
+			raise
+
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		try:
+			if fcntl is not None:
+				fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+			elif msvcrt is not None:
+				self.file.seek(0)
+				msvcrt.locking(self.file.fileno(), msvcrt.LK_UNLCK, 1)
+
+		finally:
+			self.file.close()
+			self.file = None
+			self.lock.release()
+
+
+
+# Stores downloaded archives by the SHA-256 of their content, shared by all
+# game installations of the current user. Archives are found either by
+# their hash or by the url they were downloaded from. When the cache grows
+# beyond its size limit, the least recently used archives are deleted.
+# The cache is only an optimization: errors of the file system are raised
+# as StorageError, so callers can download without the cache instead.
+class DownloadCache:
+	def __init__(self, config):
+		self.config = config
+		self.locks  = {}
+		self.lock   = threading.Lock()
+
+
+	def getCacheDir(self):
+		cache_dir = self.config.getConfig('download-cache-dir')
+
+		if cache_dir is None:
+			cache_dir = os.path.join(get_user_cache_dir(), 'archives')
+
+		return cache_dir
+
+
+	def getMaxSize(self):
+		return int(self.config.getConfig('download-cache-size', default_download_cache_size)) * 1024 * 1024
+
+
+	def getArchivePath(self, content_hash):
+		return os.path.join(self.getCacheDir(), content_hash + '.zip')
+
+
+	def getIndexLock(self):
+		# the cache directory may be configured differently while running
+		path = os.path.join(self.getCacheDir(), download_cache_lock_filename)
+
+		with self.lock:
+			if path not in self.locks:
+				self.locks[path] = InterProcessLock(path)
+
+			return self.locks[path]
+
+
+	def readIndex(self):
+		# the index is read again for every change, since other processes may use the cache too
+		try:
+			with io.open(os.path.join(self.getCacheDir(), download_cache_index_filename), 'r') as input:
+				index = json.load(input)
+
+		except (OSError, ValueError):
+			index = {}
+
+		index.setdefault('urls', {})
+		index.setdefault('archives', {})
+
+		return index
+
+
+	def writeIndex(self, index):
+		path = os.path.join(self.getCacheDir(), download_cache_index_filename)
+		tmp_path = path + '.tmp'
+
+		with io.open(tmp_path, 'w') as output:
+			json.dump(index, output, sort_keys=True, indent=2)
+
+		os.replace(tmp_path, path)
+
+
+	def lookup(self, url=None, content_hash=None):
+		with self.getIndexLock():
+			index = self.readIndex()
+
+			if content_hash is None and url is not None:
+				content_hash = index['urls'].get(url)
+
+			if content_hash is None or content_hash not in index['archives']:
+				return None
+
+			path = self.getArchivePath(content_hash)
+
+			if not os.path.exists(path):
+				return None
+
+			index['archives'][content_hash]['last-used'] = int(time())
+			self.writeIndex(index)
+
+			return path
+
+
+	def getPartialDir(self):
+		return os.path.join(self.getCacheDir(), 'partial')
+
+
+	def createDownload(self, url):
+		retries = int(self.config.getConfig('download-retries', default_download_retries))
+
+		return ResumableDownload(self.config.http, url, self.getPartialDir(), retries=retries)
+
+
+	def download(self, url, cache_url=True):
+		# downloads into the cache, resuming a previously interrupted download
+		download = self.createDownload(url)
+		partial_path = download.download()
+
+		return self.storeDownload(download, partial_path, url, cache_url)
+
+
+	async def downloadAsync(self, url, cache_url=True):
+		download = self.createDownload(url)
+		partial_path = await download.downloadAsync()
+
+		# hashing and moving the file is left to a thread, the archive may be large
+		return await run_blocking(self.storeDownload, download, partial_path, url, cache_url)
+
+
+	def storeDownload(self, download, partial_path, url, cache_url):
+		try:
+			content_hash = self.storeFile(partial_path, url=(url if cache_url else None))
+
+		except OSError as exc:
+			download.discard()
+			raise StorageError(exc)
+
+		download.discard()
+
+		return self.getArchivePath(content_hash), content_hash
+
+
+	def store(self, fileobj, url=None):
+		cache_dir = self.getCacheDir()
+		os.makedirs(cache_dir, exist_ok=True)
+
+		fileobj.seek(0)
+
+		with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as output:
+			tmp_path = output.name
+
+			while True:
+				chunk = fileobj.read(64 * 1024)
+
+				if not chunk:
+					break
+
+				output.write(chunk)
+
+		fileobj.seek(0)
+
+		return self.storeFile(tmp_path, url=url)
+
+
+	def storeFile(self, path, url=None):
+		# moves the file into the cache
+		sha256 = hashlib.sha256()
+		size = 0
+
+		with io.open(path, 'rb') as input:
+			while True:
+				chunk = input.read(64 * 1024)
+
+				if not chunk:
+					break
+
+				sha256.update(chunk)
+				size += len(chunk)
+
+		content_hash = sha256.hexdigest()
+
+		os.makedirs(self.getCacheDir(), exist_ok=True)
+		os.replace(path, self.getArchivePath(content_hash))
+
+		with self.getIndexLock():
+			index = self.readIndex()
+
+			index['archives'][content_hash] = {
+				'size':      size,
+				'last-used': int(time()),
+			}
+
+			if url is not None:
+				index['urls'][url] = content_hash
+
+			self.pruneIndex(index, self.getMaxSize(), keep=content_hash)
+			self.writeIndex(index)
+
+		return content_hash
+
+
+	def prune(self, max_size=None):
+		if max_size is None:
+			max_size = self.getMaxSize()
+
+		with self.getIndexLock():
+			index = self.readIndex()
+			removed = self.pruneIndex(index, max_size)
+
+			if os.path.isdir(self.getCacheDir()):
+				self.writeIndex(index)
+
+		return removed
+
+
+	def pruneIndex(self, index, max_size, keep=None):
+		archives = index['archives']
+		removed = 0
+
+		# forget archives which were deleted from the cache directory
+		for content_hash in list(archives.keys()):
+			if not os.path.exists(self.getArchivePath(content_hash)):
+				del archives[content_hash]
+
+		total_size = sum([archive['size'] for archive in archives.values()])
+
+		# delete the least recently used archives first
+		for content_hash in sorted(archives.keys(), key=lambda content_hash: archives[content_hash]['last-used']):
+			if total_size <= max_size:
+				break
+
+			if content_hash == keep:
+				continue
+
+			total_size -= archives[content_hash]['size']
+			del archives[content_hash]
+			removed += 1
+
+			try:
+				os.remove(self.getArchivePath(content_hash))
+			except OSError:
+				pass
+
+		for url in list(index['urls'].keys()):
+			if index['urls'][url] not in archives:
+				del index['urls'][url]
+
+		return removed
+
+
+	def getStats(self):
+		# the index is replaced as a whole, so it can be read without the lock
+		index = self.readIndex()
+
+		return {
+			'archives': len(index['archives']),
+			'urls':     len(index['urls']),
+			'size':     sum([archive['size'] for archive in index['archives'].values()]),
+			'max-size': self.getMaxSize(),
+		}
@@ -0,0 +1,295 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import re
+import struct
+
+from concurrent.futures import ProcessPoolExecutor
+from time import time
+
+
+fingerprint_cache_filename = 'addons.fingerprints.json'
+
+# hours until a fingerprint without a match is looked up again, if not configured otherwise
+default_fingerprint_retry = 7 * 24
+
+# whitespace is removed from files before calculating their fingerprint
+fingerprint_whitespace = b'\t\n\r '
+
+# the toc files of a folder, including the ones for other game flavors
+regex_toc_filename = re.compile(r'^(.+?)([-_](mainline|bcc|tbc|classic|vanilla|wotlkc|wrath|cata))?\.toc$', re.IGNORECASE)
+
+# files loaded by toc files and xml files, paths containing '..' are ignored
+regex_toc_include = re.compile(r'^\s*((?:(?<!\.\.).)+\.(?:xml|lua))\s*$', re.IGNORECASE | re.MULTILINE)
+regex_xml_include = re.compile(r'<(?:Include|Script)\s+file=["\']((?:(?<!\.\.).)+)["\']\s*/>', re.IGNORECASE)
+
+regex_toc_comment = re.compile(r'#.*$', re.MULTILINE)
+regex_xml_comment = re.compile(r'<!--.*?-->', re.DOTALL)
+
+
+def murmurhash2(data, seed=1):
+	m    = 0x5bd1e995
+	mask = 0xffffffff
+	length = len(data)
+	h = (seed ^ length) & mask
+
+	blocks = length // 4
+
+	if blocks > 0:
+		for k in struct.unpack('<%iI' % blocks, data[:blocks * 4]):
+			k = (k * m) & mask
+			k ^= k >> 24
+			k = (k * m) & mask
+
+			h = (h * m) & mask
+			h ^= k
+
+	tail = data[blocks * 4:]
+
+	if len(tail) == 3:
+		h ^= tail[2] << 16
+
+	if len(tail) >= 2:
+		h ^= tail[1] << 8
+
+	if len(tail) >= 1:
+		h ^= tail[0]
+		h = (h * m) & mask
+
+	h ^= h >> 13
+	h = (h * m) & mask
+	h ^= h >> 15
+
+	return h
+
+
+def file_fingerprint(path):
+	with io.open(path, 'rb') as input:
+		data = input.read()
+
+	return murmurhash2(data.translate(None, fingerprint_whitespace), 1)
+
+
+def get_included_files(path, data):
+	text = data.decode('utf-8', errors='replace')
+	extension = os.path.splitext(path)[1].lower()
+
+	if extension == '.toc':
+		return regex_toc_include.findall(regex_toc_comment.sub('', text))
+
+	if extension == '.xml':
+		return regex_xml_include.findall(regex_xml_comment.sub('', text))
+
+	return []
+
+
+def find_file(directory, relative_path, listings):
+	# files are loaded by the game without regard to their case, so a path
+	# is matched case insensitive, if there is no exact match
+	path = directory
+
+	for name in re.split(r'[\\/]', relative_path.strip()):
+		if name in ('', '.'):
+			continue
+
+		if path not in listings:
+			try:
+				listings[path] = os.listdir(path)
+			except OSError:
+				listings[path] = []
+
+		names = listings[path]
+
+		if name not in names:
+			matches = [other for other in names if other.lower() == name.lower()]
+
+			if len(matches) == 0:
+				return None
+
+			name = matches[0]
+
+		path = os.path.join(path, name)
+
+	if not os.path.isfile(path):
+		return None
+
+	return path
+
+
+def get_fingerprint_files(folder_path):
+	# like the Curse client, only the toc files, Bindings.xml and all files
+	# loaded through them are part of the fingerprint, any other files
+	# like textures or readme files are not
+	folder = os.path.basename(folder_path)
+	listings = {}
+	pending = []
+	files = []
+
+	try:
+		names = sorted(os.listdir(folder_path))
+	except OSError:
+		return files
+
+	listings[folder_path] = names
+
+	for name in names:
+		m = regex_toc_filename.match(name)
+
+		if m is not None and m.group(1).lower() == folder.lower():
+			pending.append(os.path.join(folder_path, name))
+
+		elif name.lower() == 'bindings.xml':
+			files.append(os.path.join(folder_path, name))
+
+	while len(pending) > 0:
+		path = pending.pop(0)
+
+		if path in files or not os.path.isfile(path):
+			continue
+
+		files.append(path)
+
+		with io.open(path, 'rb') as input:
+			data = input.read()
+
+		for include in get_included_files(path, data):
+			include_path = find_file(os.path.dirname(path), include, listings)
+
+			if include_path is not None:
+				pending.append(include_path)
+
+	return files
+
+
+def folder_fingerprint(file_fingerprints):
+	# the fingerprint of a folder is built from the sorted fingerprints of its files
+	data = ''.join([str(fingerprint) for fingerprint in sorted(file_fingerprints)])
+
+	return murmurhash2(data.encode('ascii'), 1)
+
+
+
+# Calculates fingerprints of addon folders in the same way as the Curse
+# client, so installed addons can be identified without knowing their name.
+# Only the files loaded by the game are hashed, see get_fingerprint_files.
+# The fingerprints of files are calculated on all cores and are stored
+# together with the file's size and mtime, so unchanged files don't need
+# to be read again. Fingerprints, which did not match any project, are
+# remembered, so they are not looked up again on every run.
+class FolderFingerprinter:
+	def __init__(self, config):
+		self.config  = config
+		self.files   = {}
+		self.lookups = {}
+
+
+	def getFilename(self):
+		return os.path.join(self.config.addons_dir, fingerprint_cache_filename)
+
+
+	def open(self):
+		try:
+			with io.open(self.getFilename(), 'r') as input:
+				data = json.load(input)
+
+				if 'files' in data:
+					self.files = data['files']
+
+				if 'lookups' in data:
+					self.lookups = data['lookups']
+
+		except (OSError, ValueError):
+			self.files   = {}
+			self.lookups = {}
+
+
+	def save(self):
+		with io.open(self.getFilename(), 'w') as output:
+			json.dump({'files': self.files, 'lookups': self.lookups}, output, sort_keys=True)
+
+
+	def isLookupDue(self, folder, fingerprint):
+		entry = self.lookups.get(folder)
+
+		# a changed fingerprint may match a project now
+		if entry is None or entry[0] != fingerprint:
+			return True
+
+		retry = float(self.config.getConfig('fingerprint-retry', default_fingerprint_retry))
+
+		return time() - entry[1] > retry * 3600
+
+
+	def recordLookup(self, folder, fingerprint, matched):
+		if matched:
+			self.lookups.pop(folder, None)
+		else:
+			self.lookups[folder] = [fingerprint, time()]
+
+
+	def getFingerprints(self, folders):
+		files_by_folder = {}
+		files = {}
+		missing = []
+
+		for folder in folders:
+			folder_path = os.path.join(self.config.addons_dir, folder)
+			folder_files = []
+
+			for path in get_fingerprint_files(folder_path):
+				relative_path = os.path.relpath(path, self.config.addons_dir).replace(os.sep, '/')
+				stat = os.stat(path)
+
+				entry = self.files.get(relative_path)
+
+				if entry is None or entry[0] != stat.st_size or entry[1] != stat.st_mtime_ns:
+					entry = [stat.st_size, stat.st_mtime_ns, None]
+					missing.append((relative_path, path))
+
+				files[relative_path] = entry
+				folder_files.append(relative_path)
+
+			if len(folder_files) > 0:
+				files_by_folder[folder] = folder_files
+
+		if len(missing) > 0:
+			workers = max(1, int(self.config.getConfig('fingerprint-workers', os.cpu_count() or 1)))
+
+			with ProcessPoolExecutor(max_workers=workers) as executor:
+				paths = [path for _, path in missing]
+				chunksize = max(1, len(paths) // (4 * workers))
+
+				for (relative_path, _), fingerprint in zip(missing, executor.map(file_fingerprint, paths, chunksize=chunksize)):
+					files[relative_path][2] = fingerprint
+
+		# forget files of the scanned folders which do not exist anymore,
+		# but keep cached fingerprints of other folders
+		prefixes = tuple([folder + '/' for folder in folders])
+
+		for relative_path in list(self.files.keys()):
+			if relative_path.startswith(prefixes) and relative_path not in files:
+				del self.files[relative_path]
+
+		self.files.update(files)
+
+		fingerprints = {}
+
+		for folder, folder_files in files_by_folder.items():
+			fingerprints[folder] = folder_fingerprint([files[relative_path][2] for relative_path in folder_files])
+
+		return fingerprints
@@ -29,11 +29,12 @@
 
 import re
 import urllib.error
-import urllib.request
 
 from wowupdate.updater.Updater import IUpdater
 from wowupdate.updater.Updater import DownloadableWrapper
+from wowupdate.updater.Updater import run_blocking
 from wowupdate.updater.ZipInstaller import downloadZipFromResponse
+from wowupdate.updater.ZipInstaller import ZipDownloadable
 
 
 regex_github_url = re.compile('^https://github.com/(.*?)/(.*?)/?$')
@@ -55,11 +56,48 @@ class GithubUpdater(IUpdater):
 		return None
 
 
+	async def findUpdateForAsync(self, addon):
+		if addon.toc.git_url is not None:
+			return await self.findDownloadByGitRepoAsync(addon.name, addon.toc.git_url)
+
+		return None
+
+
 	def findDownloadByName(self, addon_name):
 		return None
 
 
-	def findDownloadByGitRepo(self, addon_name, git_url, branch='master'):
+	def getCacheKey(self, addon):
+		if addon.toc.git_url is not None:
+			return 'github:%s' % addon.toc.git_url
+
+		return None
+
+
+	def createCacheEntry(self, downloadable):
+		entry = IUpdater.createCacheEntry(self, downloadable)
+		entry['name']     = downloadable.name
+		entry['zip_root'] = downloadable.zip_root
+		entry['sha256']   = downloadable.content_hash
+
+		return entry
+
+
+	def createDownloadableFromCache(self, addon, entry):
+		downloadable = ZipDownloadable(url=entry['url'], zip_root=entry['zip_root'], cache=self.config.download_cache, session=self.config.http)
+		downloadable.name = entry['name']
+		downloadable.version = entry['version']
+
+		# the branch archive's url always returns the latest content,
+		# so it can only be taken from the download cache by its hash
+		downloadable.immutable_url = False
+		downloadable.content_hash  = entry.get('sha256')
+
+		return downloadable
+
+
+	def getArchiveLocation(self, git_url, branch):
+		# returns the url of the branch's archive and the name of its root directory
 		url = ('%s/archive/%s.zip' % (git_url, branch))
 		repo_owner = None
 		repo_name = None
@@ -69,21 +107,52 @@ class GithubUpdater(IUpdater):
 			repo_owner = m.group(1).strip()
 			repo_name  = m.group(2).strip()
 
+		zip_root = ('%s-%s' % (repo_name, branch))
+
+		return url, zip_root
+
+
+	def findDownloadByGitRepo(self, addon_name, git_url, branch='master'):
+		url, zip_root = self.getArchiveLocation(git_url, branch)
+
 		try:
+			# the archive is kept by the download cache, storing it in the http cache too would only double its size on disk
 			with self.httpget(url) as response:
-				return self.createDownloadableFromResponse(
-					response,
-					addon_name=addon_name,
-					zip_root=('%s-%s' % (repo_name, branch))
-				)
+				return self.createDownloadableFromArchive(response, url, addon_name, zip_root)
 
 		except urllib.error.HTTPError:
 			pass
 
 
-	def httpget(self, url):
-		req = urllib.request.Request(url)
-		return urllib.request.urlopen(req)
+	async def findDownloadByGitRepoAsync(self, addon_name, git_url, branch='master'):
+		url, zip_root = self.getArchiveLocation(git_url, branch)
+
+		try:
+			with await self.config.http.getAsync(url) as response:
+				return await run_blocking(self.createDownloadableFromArchive, response, url, addon_name, zip_root)
+
+		except urllib.error.HTTPError:
+			pass
+
+
+	def createDownloadableFromArchive(self, response, url, addon_name, zip_root):
+		downloadable = self.createDownloadableFromResponse(
+			response,
+			addon_name=addon_name,
+			zip_root=zip_root
+		)
+
+		# remember where the archive came from, so it can be downloaded again
+		downloadable.url          = url
+		downloadable.name         = addon_name
+		downloadable.zip_root     = zip_root
+		downloadable.content_hash = downloadable.installable.content_hash
+
+		return downloadable
+
+
+	def httpget(self, url, cache=False):
+		return self.config.http.get(url, cache=cache)
 
 
 	def createDownloadableFromResponse(self, response, addon_name=None, zip_root=None):
@@ -93,7 +162,8 @@ class GithubUpdater(IUpdater):
 			response,
 			name=addon_name,
 			source=url,
-			zip_root=zip_root
+			zip_root=zip_root,
+			cache=self.config.download_cache
 		)
 
 		return DownloadableWrapper(installable)
@@ -0,0 +1,438 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import email.utils
+import hashlib
+import http.client
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from time import time
+
+from wowupdate.updater.DownloadCache import get_user_cache_dir
+
+
+# maximum size of all cached responses in MiB, if not configured otherwise
+default_http_cache_size = 64
+
+# headers stored together with a response
+stored_headers = [
+	'Age',
+	'Cache-Control',
+	'Content-Encoding',
+	'Content-Length',
+	'Content-Type',
+	'Date',
+	'ETag',
+	'Expires',
+	'Last-Modified',
+	'Vary',
+]
+
+
+
+def parse_cache_control(value):
+	directives = {}
+
+	for directive in (value or '').split(','):
+		name, _, argument = directive.strip().partition('=')
+
+		if name != '':
+			directives[name.lower()] = argument.strip('"')
+
+	return directives
+
+
+def get_freshness_lifetime(headers):
+	directives = parse_cache_control(headers.get('Cache-Control'))
+
+	if 'no-cache' in directives:
+		return 0
+
+	if 'max-age' in directives:
+		try:
+			return int(directives['max-age'])
+		except ValueError:
+			return 0
+
+	if headers.get('Expires') is not None and headers.get('Date') is not None:
+		try:
+			expires = email.utils.parsedate_to_datetime(headers['Expires'])
+			date    = email.utils.parsedate_to_datetime(headers['Date'])
+
+			return max(0, (expires - date).total_seconds())
+
+		except (TypeError, ValueError):
+			return 0
+
+	# no heuristic freshness, responses without an explicit lifetime are always revalidated
+	return 0
+
+
+def get_age(headers):
+	# seconds the response was already stored by other caches on its way
+	try:
+		return max(0, int(headers.get('Age', 0)))
+	except ValueError:
+		return 0
+
+
+def get_vary_names(headers):
+	return [name.strip().lower() for name in (headers.get('Vary') or '').split(',') if name.strip() != '']
+
+
+def get_vary_values(response_headers, request_headers):
+	# values of the request headers, which the response depends on
+	request_headers = dict([(name.lower(), value) for name, value in request_headers.items()])
+
+	return dict([(name, request_headers.get(name)) for name in get_vary_names(response_headers)])
+
+
+def is_storable(response):
+	if response.status != 200:
+		return False
+
+	if 'no-store' in parse_cache_control(response.headers.get('Cache-Control')):
+		return False
+
+	# the response may differ for any request
+	if '*' in get_vary_names(response.headers):
+		return False
+
+	# without a validator or a lifetime, a stored response could never be used
+	if response.headers.get('ETag') is None and response.headers.get('Last-Modified') is None:
+		return get_freshness_lifetime(response.headers) > 0
+
+	return True
+
+
+
+# A response read from the cache.
+class CachedResponse:
+	def __init__(self, url, headers, body_path):
+		self.url     = url
+		self.status  = 200
+		self.reason  = 'OK'
+		self.headers = http.client.HTTPMessage()
+		self.body    = io.open(body_path, 'rb')
+
+		for name, value in headers.items():
+			self.headers[name] = value
+
+
+	def read(self, size=None):
+		if size is None or size < 0:
+			return self.body.read()
+
+		return self.body.read(size)
+
+
+	def readinto(self, buffer):
+		return self.body.readinto(buffer)
+
+
+	def geturl(self):
+		return self.url
+
+
+	def close(self):
+		self.body.close()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+
+# Passes a response through and writes its body into the cache. The entry
+# is only stored, when the body was read completely.
+class CachingResponse:
+	def __init__(self, cache, key, response, vary=None):
+		self.cache    = cache
+		self.key      = key
+		self.vary     = vary
+		self.response = response
+		self.url      = response.url
+		self.status   = response.status
+		self.reason   = response.reason
+		self.headers  = response.headers
+		self.complete = False
+
+		cache_dir = cache.getCacheDir()
+		os.makedirs(cache_dir, exist_ok=True)
+
+		self.body_file = tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False)
+
+
+	def read(self, size=None):
+		data = self.response.read(size)
+		self.body_file.write(data)
+
+		if len(data) == 0 or size is None or size < 0 or self.response.response.isclosed():
+			self.complete = True
+
+		return data
+
+
+	def readinto(self, buffer):
+		data = self.read(len(buffer))
+		buffer[:len(data)] = data
+
+		return len(data)
+
+
+	def geturl(self):
+		return self.url
+
+
+	def close(self):
+		if self.body_file is None:
+			return
+
+		self.body_file.close()
+
+		if self.complete:
+			self.cache.store(self.key, self.url, self.headers, self.body_file.name, vary=self.vary)
+		else:
+			os.remove(self.body_file.name)
+
+		self.body_file = None
+		self.response.close()
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+
+# Stores responses on disk together with their validators, so a request
+# for an unchanged resource is answered either without any request, while
+# the response is fresh, or by a conditional request, which the server
+# answers with '304 Not Modified' and no body.
+class HttpCache:
+	def __init__(self, config):
+		self.config = config
+		self.lock   = threading.Lock()
+
+		# statistics of this run
+		self.hits          = 0
+		self.misses        = 0
+		self.revalidations = 0
+
+
+	def getCacheDir(self):
+		cache_dir = self.config.getConfig('http-cache-dir')
+
+		if cache_dir is None:
+			cache_dir = os.path.join(get_user_cache_dir(), 'http')
+
+		return cache_dir
+
+
+	def getMaxSize(self):
+		return int(self.config.getConfig('http-cache-size', default_http_cache_size)) * 1024 * 1024
+
+
+	def getPaths(self, key):
+		name = hashlib.sha1(key.encode('utf-8')).hexdigest()
+		path = os.path.join(self.getCacheDir(), name)
+
+		return path + '.json', path + '.body'
+
+
+	def lookup(self, key, request_headers=None):
+		meta_path, body_path = self.getPaths(key)
+
+		try:
+			with io.open(meta_path, 'r') as input:
+				entry = json.load(input)
+
+		except (OSError, ValueError):
+			return None
+
+		if entry.get('key') != key or not os.path.exists(body_path):
+			return None
+
+		# the stored response can only be used for requests with the same headers it varies by
+		if request_headers is not None and entry.get('vary', {}) != get_vary_values(entry['headers'], request_headers):
+			return None
+
+		return entry
+
+
+	def isFresh(self, entry):
+		age = get_age(entry['headers']) + time() - entry['stored']
+
+		return age < get_freshness_lifetime(entry['headers'])
+
+
+	def getConditionalHeaders(self, entry):
+		headers = {}
+
+		if entry['headers'].get('ETag') is not None:
+			headers['If-None-Match'] = entry['headers']['ETag']
+
+		if entry['headers'].get('Last-Modified') is not None:
+			headers['If-Modified-Since'] = entry['headers']['Last-Modified']
+
+		return headers
+
+
+	def openEntry(self, key, entry):
+		meta_path, body_path = self.getPaths(key)
+		response = CachedResponse(entry['url'], entry['headers'], body_path)
+
+		# keep recently used responses when pruning the cache
+		os.utime(body_path)
+
+		return response
+
+
+	def writeEntry(self, key, entry):
+		meta_path, body_path = self.getPaths(key)
+		tmp_path = meta_path + '.tmp'
+
+		with io.open(tmp_path, 'w') as output:
+			json.dump(entry, output, sort_keys=True)
+
+		os.replace(tmp_path, meta_path)
+
+
+	def refresh(self, key, entry, headers):
+		# a 304 response may update the lifetime or the validators of the stored response
+		for name in stored_headers:
+			if name != 'Content-Length' and headers.get(name) is not None:
+				entry['headers'][name] = headers[name]
+
+		# the age of the stored response starts again with the age of the 304 response
+		if headers.get('Age') is None:
+			entry['headers'].pop('Age', None)
+
+		entry['stored'] = time()
+
+		with self.lock:
+			self.writeEntry(key, entry)
+
+
+	def store(self, key, url, headers, body_path, vary=None):
+		entry = {
+			'key':     key,
+			'url':     url,
+			'stored':  time(),
+			'headers': {},
+			'vary':    vary or {},
+		}
+
+		for name in stored_headers:
+			if headers.get(name) is not None:
+				entry['headers'][name] = headers[name]
+
+		meta_path, cached_body_path = self.getPaths(key)
+
+		with self.lock:
+			os.replace(body_path, cached_body_path)
+			self.writeEntry(key, entry)
+			self.prune(self.getMaxSize(), keep=cached_body_path)
+
+
+	def storeResponse(self, key, response, vary=None):
+		# stores a response, which was already read completely, and rewinds its body
+		cache_dir = self.getCacheDir()
+		os.makedirs(cache_dir, exist_ok=True)
+
+		with tempfile.NamedTemporaryFile(dir=cache_dir, suffix='.tmp', delete=False) as output:
+			shutil.copyfileobj(response.body, output)
+
+		response.body.seek(0)
+
+		self.store(key, response.url, response.headers, output.name, vary=vary)
+
+
+	def listBodies(self):
+		bodies = []
+
+		if not os.path.isdir(self.getCacheDir()):
+			return bodies
+
+		for entry in os.scandir(self.getCacheDir()):
+			if entry.name.endswith('.body'):
+				stat = entry.stat()
+				bodies.append((stat.st_mtime, stat.st_size, entry.path))
+
+		return bodies
+
+
+	def prune(self, max_size=None, keep=None):
+		if max_size is None:
+			max_size = self.getMaxSize()
+
+		bodies = self.listBodies()
+		removed = 0
+
+		total_size = sum([size for _, size, _ in bodies])
+
+		# delete the least recently used responses first
+		for mtime, size, path in sorted(bodies):
+			if total_size <= max_size:
+				break
+
+			if path == keep:
+				continue
+
+			total_size -= size
+			removed += 1
+
+			for remove_path in [path, path[:-len('.body')] + '.json']:
+				try:
+					os.remove(remove_path)
+				except OSError:
+					pass
+
+		return removed
+
+
+	def getStats(self):
+		bodies = self.listBodies()
+
+		return {
+			'responses': len(bodies),
+			'size':      sum([size for _, size, _ in bodies]),
+			'max-size':  self.getMaxSize(),
+		}
+
+
+	def count(self, name):
+		with self.lock:
+			setattr(self, name, getattr(self, name) + 1)
+
+
+	def to_string(self):
+		return "http cache %4i hits, %4i revalidated, %4i misses" % (
+			self.hits,
+			self.revalidations,
+			self.misses
+		)
@@ -0,0 +1,559 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import http.client
+import io
+import ssl
+import threading
+import urllib.error
+import urllib.parse
+import urllib.request
+
+from wowupdate.updater.AsyncHttp import AsyncHttpConnectionPool
+from wowupdate.updater.AsyncHttp import AsyncHttpResponse
+from wowupdate.updater.AsyncHttp import buffer_response
+from wowupdate.updater.HttpCache import CachingResponse
+from wowupdate.updater.HttpCache import get_vary_values
+from wowupdate.updater.HttpCache import is_storable
+
+
+# number of idle connections kept open for each host, if not configured otherwise
+default_http_pool_size = 4
+
+# seconds to wait for a connection or a response, if not configured otherwise
+default_http_timeout = 60
+
+max_redirects = 10
+
+# sent with all requests, unless a session uses its own
+default_user_agent = 'wowupdate'
+
+redirect_codes = (301, 302, 303, 307, 308)
+
+# headers of a conditional request, which are set by the http cache
+conditional_headers = ('if-none-match', 'if-modified-since')
+
+# errors of a kept-alive connection, which was closed by the server in the meantime
+stale_connection_errors = (
+	http.client.RemoteDisconnected,
+	http.client.BadStatusLine,
+	BrokenPipeError,
+	ConnectionResetError,
+	ConnectionAbortedError,
+)
+
+
+
+# Keeps connections open after a response was read completely, so following
+# requests to the same host don't need another TCP and TLS handshake. Each
+# connection is used by a single request at a time, which makes the pool safe
+# to be shared by all threads. Requests of coroutines use the connections of
+# async_pool, which are kept open in the same way.
+class HttpConnectionPool:
+	def __init__(self, config):
+		self.config      = config
+		self.lock        = threading.Lock()
+		self.connections = {}
+		self.ssl_context = ssl.create_default_context()
+		self.async_pool  = AsyncHttpConnectionPool(self)
+
+
+	def getPoolSize(self):
+		return max(0, int(self.config.getConfig('http-pool-size', default_http_pool_size)))
+
+
+	def getTimeout(self):
+		return float(self.config.getConfig('http-timeout', default_http_timeout))
+
+
+	def acquire(self, scheme, host, port):
+		key = (scheme, host, port)
+
+		with self.lock:
+			idle = self.connections.get(key)
+
+			if idle:
+				return idle.pop(), True
+
+		return self.createConnection(scheme, host, port), False
+
+
+	def release(self, scheme, host, port, connection):
+		key = (scheme, host, port)
+
+		with self.lock:
+			idle = self.connections.setdefault(key, [])
+
+			if len(idle) < self.getPoolSize():
+				idle.append(connection)
+				return
+
+		connection.close()
+
+
+	def createConnection(self, scheme, host, port):
+		timeout = self.getTimeout()
+		proxy = urllib.request.getproxies().get(scheme)
+
+		if proxy is not None and not urllib.request.proxy_bypass(host):
+			proxy_url = urllib.parse.urlsplit(proxy)
+
+			if scheme == 'https':
+				connection = http.client.HTTPSConnection(proxy_url.hostname, proxy_url.port or 80, timeout=timeout, context=self.ssl_context)
+				connection.set_tunnel(host, port)
+			else:
+				connection = http.client.HTTPConnection(proxy_url.hostname, proxy_url.port or 80, timeout=timeout)
+
+				# requests through a plain http proxy contain the whole url
+				connection.absolute_urls = True
+
+			return connection
+
+		if scheme == 'https':
+			return http.client.HTTPSConnection(host, port, timeout=timeout, context=self.ssl_context)
+
+		return http.client.HTTPConnection(host, port, timeout=timeout)
+
+
+	def close(self):
+		with self.lock:
+			connections = self.connections
+			self.connections = {}
+
+		for idle in connections.values():
+			for connection in idle:
+				connection.close()
+
+
+
+# The response of a HttpSession. The connection goes back into the pool when
+# the response is closed after its body was read completely.
+class HttpResponse:
+	def __init__(self, pool, address, connection, response, url):
+		self.pool       = pool
+		self.address    = address
+		self.connection = connection
+		self.response   = response
+		self.url        = url
+		self.status     = response.status
+		self.reason     = response.reason
+		self.headers    = response.headers
+
+
+	def read(self, size=None):
+		if size is not None and size < 0:
+			size = None
+
+		return self.response.read(size)
+
+
+	def readinto(self, buffer):
+		return self.response.readinto(buffer)
+
+
+	def geturl(self):
+		return self.url
+
+
+	def close(self):
+		if self.connection is None:
+			return
+
+		if self.response.isclosed() and not self.response.will_close:
+			self.pool.release(*self.address, self.connection)
+		else:
+			self.response.close()
+			self.connection.close()
+
+		self.connection = None
+
+
+	def __enter__(self):
+		return self
+
+
+	def __exit__(self, exc_type, exc_value, traceback):
+		self.close()
+
+
+
+# Sends requests through a shared connection pool. Each session has its own
+# default headers and its own way to follow redirects, so updaters can use
+# different settings without changing any global state. GET requests may
+# use the http cache, if requested.
+#
+# The methods ending with 'Async' send the same requests from a coroutine,
+# without blocking a thread while waiting for the network. Their responses
+# are read completely before they are returned, so they can be used in the
+# same way as the responses of the blocking methods.
+class HttpSession:
+	def __init__(self, pool, headers=None, send_referer=False, cache=None):
+		self.pool         = pool
+		self.cache        = cache
+		self.headers      = {'User-Agent': default_user_agent}
+		self.send_referer = send_referer
+
+		if headers is not None:
+			self.headers.update(headers)
+
+
+	def get(self, url, headers=None, cache=False, cache_key=None):
+		# the cache key replaces the url for urls with changing parameters
+		if cache and cache_key is None:
+			cache_key = url
+
+		return self.request('GET', url, headers=headers, cache_key=cache_key)
+
+
+	def post(self, url, data, headers=None):
+		return self.request('POST', url, data=data, headers=headers)
+
+
+	def request(self, method, url, data=None, headers=None, cache_key=None):
+		if cache_key is not None and self.cache is not None and method == 'GET':
+			return self.requestCached(url, headers, cache_key)
+
+		return self.fetch(method, url, data, headers)
+
+
+	def getRequestHeaders(self, headers):
+		request_headers = dict(self.headers)
+
+		if headers is not None:
+			request_headers.update(headers)
+
+		return request_headers
+
+
+	def lookupCached(self, headers, cache_key):
+		# returns the stored entry and its response, if it's still fresh;
+		# the stored response has to match all headers sent with the request
+		entry = self.cache.lookup(cache_key, self.getRequestHeaders(headers))
+
+		if entry is not None and self.cache.isFresh(entry):
+			try:
+				response = self.cache.openEntry(cache_key, entry)
+				self.cache.count('hits')
+
+				return entry, response
+
+			except OSError:
+				# removed from the cache in the meantime
+				entry = None
+
+		return entry, None
+
+
+	def getConditionalRequestHeaders(self, headers, entry):
+		conditional_request_headers = dict(headers) if headers is not None else {}
+
+		if entry is not None:
+			conditional_request_headers.update(self.cache.getConditionalHeaders(entry))
+
+		return conditional_request_headers
+
+
+	def openRevalidated(self, cache_key, entry, not_modified_response):
+		# returns the stored response confirmed by a 304 response, if there is one
+		if entry is None:
+			return None
+
+		try:
+			cached_response = self.cache.openEntry(cache_key, entry)
+
+		except OSError:
+			# removed from the cache in the meantime
+			return None
+
+		self.cache.refresh(cache_key, entry, not_modified_response.headers)
+		self.cache.count('revalidations')
+
+		return cached_response
+
+
+	def getUnconditionalHeaders(self, headers):
+		if headers is None:
+			return None
+
+		return dict([(name, value) for name, value in headers.items() if name.lower() not in conditional_headers])
+
+
+	def raiseNotModified(self, url, response):
+		raise urllib.error.HTTPError(url, response.status, "not modified without a cached response", response.headers, None)
+
+
+	def requestCached(self, url, headers, cache_key):
+		entry, cached_response = self.lookupCached(headers, cache_key)
+
+		if cached_response is not None:
+			return cached_response
+
+		response = self.fetch('GET', url, None, self.getConditionalRequestHeaders(headers, entry))
+
+		if response.status == 304:
+			response.read()
+			response.close()
+
+			cached_response = self.openRevalidated(cache_key, entry, response)
+
+			if cached_response is None:
+				# there is no body to return, so request it without any conditions
+				return self.requestUncached(url, headers)
+
+			return cached_response
+
+		self.cache.count('misses')
+
+		if is_storable(response):
+			vary = get_vary_values(response.headers, self.getRequestHeaders(headers))
+
+			return CachingResponse(self.cache, cache_key, response, vary=vary)
+
+		return response
+
+
+	def requestUncached(self, url, headers):
+		self.cache.count('misses')
+
+		response = self.fetch('GET', url, None, self.getUnconditionalHeaders(headers))
+
+		if response.status == 304:
+			response.read()
+			response.close()
+
+			self.raiseNotModified(url, response)
+
+		return response
+
+
+	async def getAsync(self, url, headers=None, cache=False, cache_key=None):
+		if cache and cache_key is None:
+			cache_key = url
+
+		return await self.requestAsync('GET', url, headers=headers, cache_key=cache_key)
+
+
+	async def postAsync(self, url, data, headers=None):
+		return await self.requestAsync('POST', url, data=data, headers=headers)
+
+
+	async def requestAsync(self, method, url, data=None, headers=None, cache_key=None):
+		if cache_key is not None and self.cache is not None and method == 'GET':
+			return await self.requestCachedAsync(url, headers, cache_key)
+
+		return await buffer_response(await self.fetchAsync(method, url, data, headers))
+
+
+	async def requestCachedAsync(self, url, headers, cache_key):
+		# the cache is on the local disk and only holds small responses,
+		# so it's used without moving its file operations to a thread
+		entry, cached_response = self.lookupCached(headers, cache_key)
+
+		if cached_response is not None:
+			return cached_response
+
+		response = await buffer_response(await self.fetchAsync('GET', url, None, self.getConditionalRequestHeaders(headers, entry)))
+
+		if response.status == 304:
+			response.close()
+
+			cached_response = self.openRevalidated(cache_key, entry, response)
+
+			if cached_response is None:
+				# there is no body to return, so request it without any conditions
+				return await self.requestUncachedAsync(url, headers)
+
+			return cached_response
+
+		self.cache.count('misses')
+
+		if is_storable(response):
+			vary = get_vary_values(response.headers, self.getRequestHeaders(headers))
+			self.cache.storeResponse(cache_key, response, vary=vary)
+
+		return response
+
+
+	async def requestUncachedAsync(self, url, headers):
+		self.cache.count('misses')
+
+		response = await buffer_response(await self.fetchAsync('GET', url, None, self.getUnconditionalHeaders(headers)))
+
+		if response.status == 304:
+			response.close()
+
+			self.raiseNotModified(url, response)
+
+		return response
+
+
+	def fetch(self, method, url, data, headers):
+		request_headers = self.getRequestHeaders(headers)
+
+		for _ in range(max_redirects + 1):
+			response = self.send(method, url, data, request_headers)
+
+			if response.status not in redirect_codes or response.headers.get('Location') is None:
+				break
+
+			# the body of a redirect is not needed, but has to be read to reuse the connection
+			response.read()
+			response.close()
+
+			if self.send_referer:
+				request_headers['Referer'] = url
+
+			url = urllib.parse.urljoin(url, response.headers.get('Location'))
+
+			if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+				method = 'GET'
+				data = None
+				request_headers.pop('Content-Type', None)
+
+		else:
+			raise urllib.error.HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+		if response.status >= 400:
+			body = response.read()
+			response.close()
+
+			raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+
+		return response
+
+
+	def send(self, method, url, data, headers):
+		parts = urllib.parse.urlsplit(url)
+		scheme = parts.scheme.lower()
+
+		if scheme not in ('http', 'https'):
+			raise urllib.error.URLError("unsupported url: %s" % url)
+
+		port = parts.port or (443 if scheme == 'https' else 80)
+		address = (scheme, parts.hostname, port)
+
+		target = parts.path or '/'
+
+		if parts.query:
+			target += '?' + parts.query
+
+		while True:
+			connection, reused = self.pool.acquire(*address)
+
+			try:
+				if getattr(connection, 'absolute_urls', False):
+					connection.request(method, url, body=data, headers=headers)
+				else:
+					connection.request(method, target, body=data, headers=headers)
+
+				response = connection.getresponse()
+
+			except stale_connection_errors:
+				connection.close()
+
+				# try again with a new connection, if the server closed a kept-alive one
+				if reused:
+					continue
+
+				raise
+
+			except:
+				connection.close()
+				raise
+
+			return HttpResponse(self.pool, address, connection, response, url)
+
+
+	async def fetchAsync(self, method, url, data, headers):
+		# returns the response before its body was read, like fetch
+		request_headers = self.getRequestHeaders(headers)
+
+		for _ in range(max_redirects + 1):
+			response = await self.sendAsync(method, url, data, request_headers)
+
+			if response.status not in redirect_codes or response.headers.get('Location') is None:
+				break
+
+			# the body of a redirect is not needed, but has to be read to reuse the connection
+			await response.read()
+			response.close()
+
+			if self.send_referer:
+				request_headers['Referer'] = url
+
+			url = urllib.parse.urljoin(url, response.headers.get('Location'))
+
+			if response.status == 303 or (response.status in (301, 302) and method == 'POST'):
+				method = 'GET'
+				data = None
+				request_headers.pop('Content-Type', None)
+
+		else:
+			raise urllib.error.HTTPError(url, response.status, "too many redirects", response.headers, None)
+
+		if response.status >= 400:
+			try:
+				body = await response.read()
+
+			finally:
+				response.close()
+
+			raise urllib.error.HTTPError(url, response.status, response.reason, response.headers, io.BytesIO(body))
+
+		return response
+
+
+	async def sendAsync(self, method, url, data, headers):
+		parts = urllib.parse.urlsplit(url)
+		scheme = parts.scheme.lower()
+
+		if scheme not in ('http', 'https'):
+			raise urllib.error.URLError("unsupported url: %s" % url)
+
+		port = parts.port or (443 if scheme == 'https' else 80)
+		address = (scheme, parts.hostname, port)
+		async_pool = self.pool.async_pool
+
+		target = parts.path or '/'
+
+		if parts.query:
+			target += '?' + parts.query
+
+		while True:
+			connection, reused = await async_pool.acquire(*address)
+
+			try:
+				if connection.absolute_urls:
+					await connection.request(method, url, body=data, headers=headers)
+				else:
+					await connection.request(method, target, body=data, headers=headers)
+
+				version, status, reason, response_headers = await connection.getresponse()
+
+			except stale_connection_errors:
+				async_pool.release(*address, connection, reuse=False)
+
+				# try again with a new connection, if the server closed a kept-alive one
+				if reused:
+					continue
+
+				raise
+
+			except:
+				async_pool.release(*address, connection, reuse=False)
+				raise
+
+			return AsyncHttpResponse(async_pool, address, connection, method, version, status, reason, response_headers, url)
+
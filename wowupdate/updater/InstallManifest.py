@@ -0,0 +1,113 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import threading
+import zlib
+
+
+install_manifest_filename = 'addons.manifest.json'
+
+# several installs may update the manifest at the same time
+manifest_lock = threading.Lock()
+
+
+def file_crc32(path, chunk_size=64 * 1024):
+	crc = 0
+
+	with io.open(path, 'rb') as input:
+		while True:
+			chunk = input.read(chunk_size)
+
+			if not chunk:
+				break
+
+			crc = zlib.crc32(chunk, crc)
+
+	return crc
+
+
+# Stores size, CRC32 and mtime of each file installed into an addon folder.
+# As long as size and mtime of a file are unchanged, its CRC32 does not
+# need to be calculated again to compare it with an archive entry.
+class InstallManifest:
+	def __init__(self, addons_dir):
+		self.addons_dir = addons_dir
+		self.folders = {}
+
+
+	def getFilename(self):
+		return os.path.join(self.addons_dir, install_manifest_filename)
+
+
+	def open(self):
+		try:
+			with io.open(self.getFilename(), 'r') as input:
+				data = json.load(input)
+
+				if 'folders' in data:
+					self.folders = data['folders']
+
+		except (OSError, ValueError):
+			self.folders = {}
+
+
+	def save(self):
+		with io.open(self.getFilename(), 'w') as output:
+			json.dump({'folders': self.folders}, output, sort_keys=True)
+
+
+	def getFolder(self, folder):
+		return self.folders.get(folder, {})
+
+
+	def fileMatches(self, folder, file_path, path, size, crc):
+		try:
+			stat = os.stat(path)
+		except OSError:
+			return False
+
+		if stat.st_size != size:
+			return False
+
+		entry = self.getFolder(folder).get(file_path)
+
+		if entry is not None and entry[0] == stat.st_size and entry[2] == stat.st_mtime_ns:
+			file_crc = entry[1]
+		else:
+			file_crc = file_crc32(path)
+
+		return file_crc == crc
+
+
+	def pruneFolders(self):
+		# forget folders, which were deleted from the AddOns directory
+		existing_names = set(os.listdir(self.addons_dir))
+
+		for folder in list(self.folders.keys()):
+			if folder not in existing_names:
+				del self.folders[folder]
+
+
+	@staticmethod
+	def update(addons_dir, folders):
+		with manifest_lock:
+			manifest = InstallManifest(addons_dir)
+			manifest.open()
+			manifest.folders.update(folders)
+			manifest.pruneFolders()
+			manifest.save()
@@ -0,0 +1,115 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import asyncio
+
+from time import time
+
+
+# A stage of a processing pipeline. Items are put into the stage's bounded
+# queue and processed by a number of workers. When the queue is full,
+# putting a new item waits until a worker took one, which limits the number
+# of items held by the pipeline at the same time. An exception raised while
+# processing an item is passed to on_error, so a failing item never stops
+# a worker, which would leave the items behind it waiting forever.
+class PipelineStage:
+
+	def __init__(self, name, process, workers=1, queue_size=1, on_error=None):
+		self.name       = name
+		self.process    = process
+		self.on_error   = on_error
+		self.workers    = max(1, workers)
+		self.queue      = asyncio.Queue(maxsize=max(1, queue_size))
+		self.tasks      = []
+
+		# statistics
+		self.processed  = 0
+		self.failed     = 0
+		self.busy_time  = 0.0
+		self.started    = None
+		self.finished   = None
+
+
+	def start(self):
+		self.started = time()
+		self.tasks = [asyncio.ensure_future(self.run_worker()) for _ in range(self.workers)]
+
+
+	async def put(self, item):
+		await self.queue.put(item)
+
+
+	async def close(self):
+		# one end marker for each worker, then wait for all items to be processed
+		for _ in self.tasks:
+			await self.queue.put(None)
+
+		await asyncio.gather(*self.tasks)
+
+		self.finished = time()
+
+
+	async def run_worker(self):
+		while True:
+			item = await self.queue.get()
+
+			if item is None:
+				break
+
+			item_started = time()
+
+			try:
+				await self.process(item)
+
+			except Exception as exc:
+				self.failed += 1
+
+				if self.on_error is not None:
+					self.on_error(item, exc)
+				else:
+					print("%s: failed to process an item: %s" % (self.name, exc))
+
+			self.busy_time += time() - item_started
+			self.processed += 1
+
+
+	def get_wall_time(self):
+		if self.started is None:
+			return 0.0
+
+		finished = self.finished if self.finished is not None else time()
+
+		return finished - self.started
+
+
+	def get_throughput(self):
+		wall_time = self.get_wall_time()
+
+		if wall_time <= 0:
+			return 0.0
+
+		return self.processed / wall_time
+
+
+	def to_string(self):
+		return "%-10s %4i items, %4i failed, %2i workers, %7.2fs busy, %7.2fs total, %7.2f items/s" % (
+			self.name,
+			self.processed,
+			self.failed,
+			self.workers,
+			self.busy_time,
+			self.get_wall_time(),
+			self.get_throughput()
+		)
@@ -0,0 +1,265 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import hashlib
+import http.client
+import io
+import json
+import os
+import re
+import urllib.error
+
+
+# size of the chunks written into the partial file
+download_chunk_size = 64 * 1024
+
+regex_content_range = re.compile('bytes\\s+(\\d+)-(\\d+)/(\\d+|\\*)')
+
+
+class IncompleteDownloadError(Exception):
+	pass
+
+
+# the downloaded data could not be stored, which is not solved by trying again
+class StorageError(Exception):
+	pass
+
+
+
+# Downloads a file into a partial file on disk. When the connection drops,
+# the download is continued from the last received byte with a Range
+# request, as long as the server's ETag or Last-Modified header shows that
+# the file did not change in the meantime. The partial file is kept across
+# runs, so an interrupted download is resumed next time as well.
+# downloadAsync does the same from a coroutine, without blocking a thread
+# while waiting for the network.
+class ResumableDownload:
+	def __init__(self, session, url, partial_dir, retries=3):
+		self.session     = session
+		self.url         = url
+		self.partial_dir = partial_dir
+		self.retries     = retries
+
+		name = hashlib.sha1(url.encode('utf-8')).hexdigest()
+		self.partial_path = os.path.join(partial_dir, name + '.part')
+		self.meta_path    = os.path.join(partial_dir, name + '.json')
+
+
+	def download(self):
+		self.makePartialDir()
+		attempt = 0
+
+		while True:
+			try:
+				self.transfer()
+				return self.partial_path
+
+			except Exception as exc:
+				self.handleError(exc, attempt)
+
+			attempt += 1
+
+
+	async def downloadAsync(self):
+		self.makePartialDir()
+		attempt = 0
+
+		while True:
+			try:
+				await self.transferAsync()
+				return self.partial_path
+
+			except Exception as exc:
+				self.handleError(exc, attempt)
+
+			attempt += 1
+
+
+	def makePartialDir(self):
+		try:
+			os.makedirs(self.partial_dir, exist_ok=True)
+
+		except OSError as exc:
+			raise StorageError(exc)
+
+
+	def handleError(self, exc, attempt):
+		# raises the error again, unless the download should be tried again
+		if isinstance(exc, urllib.error.HTTPError):
+			# the partial file does not match the file on the server anymore
+			if exc.code == 416 and attempt < self.retries:
+				self.discard()
+				return
+
+			raise exc
+
+		if isinstance(exc, StorageError):
+			raise exc
+
+		if isinstance(exc, (urllib.error.URLError, http.client.HTTPException, OSError, IncompleteDownloadError)):
+			if attempt < self.retries:
+				return
+
+		raise exc
+
+
+	def discard(self):
+		for path in [self.partial_path, self.meta_path]:
+			try:
+				os.remove(path)
+			except OSError:
+				pass
+
+
+	def readMeta(self):
+		try:
+			with io.open(self.meta_path, 'r') as input:
+				return json.load(input)
+
+		except (OSError, ValueError):
+			return {}
+
+
+	def writeMeta(self, meta):
+		try:
+			with io.open(self.meta_path, 'w') as output:
+				json.dump(meta, output)
+
+		except OSError as exc:
+			raise StorageError(exc)
+
+
+	def openPartialFile(self, mode):
+		try:
+			return io.open(self.partial_path, mode)
+
+		except OSError as exc:
+			raise StorageError(exc)
+
+
+	def copyResponse(self, response, output):
+		# errors of the connection are retried, errors of writing are not
+		while True:
+			chunk = response.read(download_chunk_size)
+
+			try:
+				if not chunk:
+					# a full disk may be noticed only when the buffer is written
+					output.flush()
+					break
+
+				output.write(chunk)
+
+			except OSError as exc:
+				raise StorageError(exc)
+
+
+	async def copyResponseAsync(self, response, output):
+		while True:
+			chunk = await response.read(download_chunk_size)
+
+			try:
+				if not chunk:
+					output.flush()
+					break
+
+				output.write(chunk)
+
+			except OSError as exc:
+				raise StorageError(exc)
+
+
+	def getResumeOffset(self, meta):
+		# without a validator, we can't know if the partial file is still valid
+		if meta.get('etag') is None and meta.get('last-modified') is None:
+			return 0
+
+		try:
+			return os.path.getsize(self.partial_path)
+		except OSError:
+			return 0
+
+
+	def getRequestHeaders(self, meta, offset):
+		headers = {}
+
+		if offset > 0:
+			headers['Range'] = 'bytes=%i-' % offset
+			headers['If-Range'] = meta['etag'] if meta.get('etag') is not None else meta['last-modified']
+
+		return headers
+
+
+	def beginTransfer(self, response, offset):
+		# returns the expected size of the file and the mode to open the partial file with
+		if offset > 0 and response.status == 206:
+			m = regex_content_range.match(response.headers.get('Content-Range', ''))
+
+			if m is None or int(m.group(1)) != offset:
+				raise IncompleteDownloadError("unexpected range: %s" % response.headers.get('Content-Range'))
+
+			if m.group(3) != '*':
+				return int(m.group(3)), 'ab'
+
+			return None, 'ab'
+
+		# the server sent the whole file
+		self.writeMeta({
+			'etag':          response.headers.get('ETag'),
+			'last-modified': response.headers.get('Last-Modified'),
+		})
+
+		if response.headers.get('Content-Length') is not None:
+			return int(response.headers.get('Content-Length')), 'wb'
+
+		return None, 'wb'
+
+
+	def checkSize(self, total_size):
+		size = os.path.getsize(self.partial_path)
+
+		if total_size is not None and size != total_size:
+			raise IncompleteDownloadError("received %i of %i bytes" % (size, total_size))
+
+
+	def transfer(self):
+		meta = self.readMeta()
+		offset = self.getResumeOffset(meta)
+
+		with self.session.get(self.url, headers=self.getRequestHeaders(meta, offset)) as response:
+			total_size, mode = self.beginTransfer(response, offset)
+
+			with self.openPartialFile(mode) as output:
+				self.copyResponse(response, output)
+
+		self.checkSize(total_size)
+
+
+	async def transferAsync(self):
+		meta = self.readMeta()
+		offset = self.getResumeOffset(meta)
+
+		response = await self.session.fetchAsync('GET', self.url, None, self.getRequestHeaders(meta, offset))
+
+		try:
+			total_size, mode = self.beginTransfer(response, offset)
+
+			with self.openPartialFile(mode) as output:
+				await self.copyResponseAsync(response, output)
+
+		finally:
+			response.close()
+
+		self.checkSize(total_size)
@@ -0,0 +1,188 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+from time import strftime
+from time import time
+
+from wowupdate.updater.folder_swap import swap_folders
+
+
+rollback_dir_name = os.path.join('.wowupdate', 'snapshots')
+rollback_meta_filename = 'snapshot.json'
+
+# number of snapshots kept for each addon, if not configured otherwise
+default_rollback_snapshots = 3
+
+
+
+def link_tree(src_dir, dst_dir):
+	# recreates the directory tree and links each file instead of copying it,
+	# falling back to a copy on file systems without hardlinks
+	for root, dirnames, filenames in os.walk(src_dir):
+		target_root = os.path.join(dst_dir, os.path.relpath(root, src_dir))
+		os.makedirs(target_root, exist_ok=True)
+
+		for filename in filenames:
+			src_path = os.path.join(root, filename)
+			dst_path = os.path.join(target_root, filename)
+
+			try:
+				os.link(src_path, dst_path)
+			except OSError:
+				shutil.copy2(src_path, dst_path)
+
+
+
+# Keeps the previous versions of updated addons, so an update can be rolled
+# back without downloading the old version again. Snapshots share the files
+# with the installed folders through hardlinks, which is safe because no
+# installable writes into existing files: they are always replaced by new
+# ones, so the linked files of the snapshot keep their content.
+class RollbackStore:
+	def __init__(self, config):
+		self.config = config
+		self.lock   = threading.Lock()
+
+
+	def getRollbackDir(self):
+		return os.path.join(self.config.addons_dir, rollback_dir_name)
+
+
+	def getAddonDir(self, addon_name):
+		return os.path.join(self.getRollbackDir(), addon_name)
+
+
+	def getRetention(self):
+		return max(0, int(self.config.getConfig('rollback-snapshots', default_rollback_snapshots)))
+
+
+	def isEnabled(self):
+		return self.getRetention() > 0
+
+
+	def create(self, addon, folders):
+		folders = sorted([folder for folder in folders if os.path.isdir(os.path.join(self.config.addons_dir, folder))])
+
+		if len(folders) == 0:
+			return None
+
+		addon_dir = self.getAddonDir(addon.name)
+		os.makedirs(addon_dir, exist_ok=True)
+
+		snapshot_dir = tempfile.mkdtemp(prefix=strftime('%Y%m%d-%H%M%S-'), dir=addon_dir)
+
+		try:
+			for folder in folders:
+				link_tree(os.path.join(self.config.addons_dir, folder), os.path.join(snapshot_dir, folder))
+
+			meta = {
+				'addon':   addon.name,
+				'version': addon.version,
+				'folders': folders,
+				'created': time(),
+				'data':    addon.to_json(),
+			}
+
+			with io.open(os.path.join(snapshot_dir, rollback_meta_filename), 'w') as output:
+				json.dump(meta, output, sort_keys=True, indent=2)
+
+		except:
+			shutil.rmtree(snapshot_dir, ignore_errors=True)
+			raise
+
+		self.prune(addon.name)
+
+		return os.path.basename(snapshot_dir)
+
+
+	def getSnapshots(self, addon_name):
+		addon_dir = self.getAddonDir(addon_name)
+		snapshots = []
+
+		if not os.path.isdir(addon_dir):
+			return snapshots
+
+		for entry in os.scandir(addon_dir):
+			if not entry.is_dir():
+				continue
+
+			try:
+				with io.open(os.path.join(entry.path, rollback_meta_filename), 'r') as input:
+					meta = json.load(input)
+
+			except (OSError, ValueError):
+				# incomplete snapshot
+				continue
+
+			meta['id'] = entry.name
+			snapshots.append(meta)
+
+		# most recent first
+		snapshots.sort(key=lambda meta: meta['created'], reverse=True)
+
+		return snapshots
+
+
+	def prune(self, addon_name, keep=None):
+		if keep is None:
+			keep = self.getRetention()
+
+		with self.lock:
+			for meta in self.getSnapshots(addon_name)[keep:]:
+				shutil.rmtree(os.path.join(self.getAddonDir(addon_name), meta['id']), ignore_errors=True)
+
+
+	def restore(self, addon, snapshot_id=None):
+		snapshots = self.getSnapshots(addon.name)
+
+		if snapshot_id is not None:
+			snapshots = [meta for meta in snapshots if meta['id'] == snapshot_id]
+
+		if len(snapshots) == 0:
+			return None
+
+		meta = snapshots[0]
+		snapshot_dir = os.path.join(self.getAddonDir(addon.name), meta['id'])
+
+		# link the snapshot into a staging directory and swap the folders, so
+		# the snapshot stays available and the addon is never half restored
+		staging_dir = tempfile.mkdtemp(prefix='.wowupdate-', dir=self.config.addons_dir)
+
+		try:
+			for folder in meta['folders']:
+				link_tree(os.path.join(snapshot_dir, folder), os.path.join(staging_dir, folder))
+
+		except:
+			shutil.rmtree(staging_dir, ignore_errors=True)
+			raise
+
+		# this includes folders of the current version, which did not exist in the snapshot
+		swap_folders(self.config.addons_dir, staging_dir, meta['folders'], set(addon.folders) | set(meta['folders']))
+
+		data = meta['data']
+
+		addon.folders = set(meta['folders'])
+		addon.version = meta['version']
+		addon.toc.version = meta['version']
+		addon.last_updated = data.get('last-updated', 0)
+
+		return meta
@@ -0,0 +1,124 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+
+from wowupdate.updater.AddOn import Toc
+
+
+scan_snapshot_filename = 'addons.scan.json'
+
+
+# Remembers the state of each folder inside the AddOns directory from the
+# last scan, together with its parsed TOC file. Folders, which were not
+# modified since then, don't need their TOC file to be parsed again.
+class ScanSnapshot:
+	def __init__(self, config):
+		self.config  = config
+		self.dirty   = False
+		self.folders = {}
+		self.existing_names = None
+
+
+	def getFilename(self):
+		return os.path.join(self.config.addons_dir, scan_snapshot_filename)
+
+
+	def open(self):
+		try:
+			with io.open(self.getFilename(), 'r') as input:
+				data = json.load(input)
+
+				if 'folders' in data:
+					self.folders = data['folders']
+
+		except (OSError, ValueError):
+			self.folders = {}
+
+		self.dirty = False
+
+
+	def save(self):
+		with io.open(self.getFilename(), 'w') as output:
+			json.dump({'folders': self.folders}, output, sort_keys=True, indent=2)
+
+			self.dirty = False
+
+
+	def listFolders(self):
+		folders = []
+
+		# lower case names of all entries found, see AddOn.checkIfAnyFolderIn
+		self.existing_names = set()
+
+		with os.scandir(self.config.addons_dir) as entries:
+			for entry in entries:
+				self.existing_names.add(entry.name.lower())
+
+				if entry.name.startswith('.'):
+					continue
+
+				if entry.is_dir():
+					folders.append(entry)
+
+		# forget about folders which do not exist anymore
+		existing = set([entry.name for entry in folders])
+
+		for name in list(self.folders.keys()):
+			if name not in existing:
+				del self.folders[name]
+				self.dirty = True
+
+		return folders
+
+
+	def getToc(self, entry):
+		stat = entry.stat()
+		toc_path = os.path.join(entry.path, entry.name + '.toc')
+
+		try:
+			toc_mtime = os.stat(toc_path).st_mtime_ns
+		except OSError:
+			toc_mtime = None
+
+		state = {
+			'mtime':     stat.st_mtime_ns,
+			'inode':     stat.st_ino,
+			'toc-mtime': toc_mtime,
+		}
+
+		# reuse the TOC of the last scan, if the folder was not modified
+		if entry.name in self.folders:
+			snapshot = self.folders[entry.name]
+
+			if all(snapshot.get(key) == value for key, value in state.items()):
+				if snapshot['toc'] is not None:
+					return Toc.from_json(snapshot['toc'])
+
+				return None
+
+		toc = None
+
+		if toc_mtime is not None:
+			toc = Toc.parseFile(toc_path)
+
+		state['toc'] = toc.to_json() if toc is not None else None
+
+		self.folders[entry.name] = state
+		self.dirty = True
+
+		return toc
@@ -13,21 +13,32 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import datetime
-import gzip
+import functools
 import hashlib
 import io
 import json
 import os
+import shutil
+import tempfile
 import urllib.error
 import urllib.parse
-import urllib.request
 
 from builtins import *
 from time import time
 
 from wowupdate.updater.colors import *
 from wowupdate.updater.Updater import *
+from wowupdate.updater.content_decoding import accept_encoding
+from wowupdate.updater.content_decoding import decode_response
+
+
+# size of the chunks copied while streaming pricing data
+appdata_chunk_size = 64 * 1024
+
+# pricing data larger than this is stored on disk instead of memory
+appdata_spool_size = 4 * 1024 * 1024
 
 
 
@@ -73,18 +84,27 @@ class TSMHelper:
 
 	def getStatusData(self):
 		if self.status_data is None:
-			status = self.tsm_request('status')
+			self.setStatus(self.tsm_request('status', cached=True))
+
+		return self.status_data
 
-			if status is None:
-				self.log_error("Failed to receive status from TSM host")
-				return None
 
-			self.log(formatjson(status))
-			self.status_data = self.parseJsonResponse(status)
+	async def getStatusDataAsync(self):
+		if self.status_data is None:
+			self.setStatus(await self.tsm_requestAsync('status', cached=True))
 
 		return self.status_data
 
 
+	def setStatus(self, status):
+		if status is None:
+			self.log_error("Failed to receive status from TSM host")
+			return
+
+		self.log(formatjson(status))
+		self.status_data = self.parseJsonResponse(status)
+
+
 	@staticmethod
 	def read_last_modified_from(item_data):
 		last_modified = 0
@@ -129,35 +149,78 @@ class TSMHelper:
 
 
 
-	def tsm_request(self, *args):
+	def getCredentials(self):
+		tsm_config = self.config.getConfig("tsm")
+
+		if tsm_config is None:
+			return None
+
+		return tsm_config['account'], tsm_config['password']
+
+
+	def tsm_request(self, *args, cached=False):
 		if self.session_id is None:
-			success = False
-			tsm_config = self.config.getConfig("tsm")
+			credentials = self.getCredentials()
+
+			if credentials is None or self.login(*credentials) is False:
+				return None
 
-			if tsm_config is not None:
-				account  = tsm_config['account']
-				password = tsm_config['password']
+		return self.do_tsm_request(*args, cached=cached)
 
-				success = self.login(account, password)
 
-			if success is False:
+	async def tsm_requestAsync(self, *args, cached=False):
+		if self.session_id is None:
+			credentials = self.getCredentials()
+
+			if credentials is None or (await self.loginAsync(*credentials)) is False:
 				return None
 
-		return self.do_tsm_request(*args)
+		return await self.do_tsm_requestAsync(*args, cached=cached)
 
 
 	def url_request(self, url):
-		return self.do_url_request(url)
+		self.log("open url: %s" % url)
 
+		with self.config.http.get(url, headers={'Accept-Encoding': accept_encoding}, cache_key=url) as response:
+			return self.decode_pricing_data(response)
 
-	def login(self, username, passwd):
+
+	async def url_requestAsync(self, url):
+		self.log("open url: %s" % url)
+
+		# the response is received without a thread, decompressing it may take a while
+		with await self.config.http.getAsync(url, headers={'Accept-Encoding': accept_encoding}, cache_key=url) as response:
+			return await run_blocking(self.decode_pricing_data, response)
+
+
+	def decode_pricing_data(self, response):
+		# pricing data can be several MB, so it is streamed into a temporary file
+		data = tempfile.SpooledTemporaryFile(max_size=appdata_spool_size)
+
+		shutil.copyfileobj(decode_response(response), data, appdata_chunk_size)
+		data.seek(0)
+
+		return data
+
+
+	def get_login_args(self, username, passwd):
 		username_hash = hashlib.sha256(bytearray(username, 'UTF-8')).hexdigest()
 		passwd_hash_1 = hashlib.sha512(bytearray(passwd,   'UTF-8')).hexdigest()
 		passwd_salted = passwd_hash_1 + get_password_salt()
 		passwd_hash_2 = hashlib.sha512(bytearray(passwd_salted, 'UTF-8')).hexdigest()
 
-		result = self.do_tsm_request('login', username_hash, passwd_hash_2)
+		return 'login', username_hash, passwd_hash_2
+
 
+	def login(self, username, passwd):
+		return self.set_login_result(self.do_tsm_request(*self.get_login_args(username, passwd)))
+
+
+	async def loginAsync(self, username, passwd):
+		return self.set_login_result(await self.do_tsm_requestAsync(*self.get_login_args(username, passwd)))
+
+
+	def set_login_result(self, result):
 		if result is not None:
 			userdata = self.parseJsonResponse(result)
 
@@ -171,7 +234,19 @@ class TSMHelper:
 		return False
 
 
-	def do_tsm_request(self, *args):
+	def do_tsm_request(self, *args, cached=False):
+		url, cache_key = self.get_request_url(*args, cached=cached)
+
+		return self.do_url_request(url, cache_key=cache_key)
+
+
+	async def do_tsm_requestAsync(self, *args, cached=False):
+		url, cache_key = self.get_request_url(*args, cached=cached)
+
+		return await self.do_url_requestAsync(url, cache_key=cache_key)
+
+
+	def get_request_url(self, *args, cached=False):
 		current_time = int(time())
 
 		token = ('%i:%i:%s' % (self.version, current_time, get_token_salt()))
@@ -200,31 +275,31 @@ class TSMHelper:
 			urllib.parse.urlencode(query_params),
 		)
 
-		result = self.do_url_request(url)
+		# the url changes with every request, so the cache uses the endpoint instead
+		cache_key = None
 
-		return result
+		if cached:
+			cache_key = 'tsm:%s' % '/'.join(args)
 
+		return url, cache_key
 
-	def do_url_request(self, url):
+
+	def do_url_request(self, url, cache_key=None):
 		self.log("open url: %s" % url)
 
-		with urllib.request.urlopen(url, ) as response:
-			data = response.read()
+		with self.config.http.get(url, headers={'Accept-Encoding': accept_encoding}, cache_key=cache_key) as response:
+			return decode_response(response).read().decode('UTF-8')
 
-			# unzip gzipped data, if found
-			if len(data) >= 2 and data[0] == 0x1f and data[1] == 0x8b:
-				bytes = io.BytesIO(data)
-				gz    = gzip.GzipFile(fileobj=bytes)
-				data  = gz.read()
 
-			# decode
-			data = data.decode('UTF-8')
+	async def do_url_requestAsync(self, url, cache_key=None):
+		self.log("open url: %s" % url)
 
-			return data
+		with await self.config.http.getAsync(url, headers={'Accept-Encoding': accept_encoding}, cache_key=cache_key) as response:
+			return decode_response(response).read().decode('UTF-8')
 
 
 	def parseJsonResponse(self, json_str):
-		json_data = json.loads(json_str, encoding='UTF-8')
+		json_data = json.loads(json_str)
 
 		if 'success' in json_data:
 			if json_data['success'] == False:
@@ -259,28 +334,58 @@ class TSMUpdater(IUpdater):
 		return None
 
 
+	async def findUpdateForAsync(self, addon):
+		if addon.name == "TradeSkillMaster_AppHelper":
+			status_data = await self.tsm.getStatusDataAsync()
+			if status_data is not None:
+				return TSMAppDataDownloader(self.tsm, status_data, addon)
+
+		return None
+
+
+	def getCacheKey(self, addon):
+		if addon.name == "TradeSkillMaster_AppHelper":
+			return 'tsm:status'
+
+		return None
+
+
+	def createDownloadableFromCache(self, addon, entry):
+		return TSMCachedAppDataDownloader(self.tsm, addon, entry['version'])
+
+
 
 class AppData:
 	AUCTIONDB_MARKET_DATA = "AUCTIONDB_MARKET_DATA"
 	APP_INFO              = "APP_INFO"
 
 	def __init__(self):
-		self.content = io.StringIO()
+		self.content = tempfile.SpooledTemporaryFile(max_size=appdata_spool_size)
+
+
+	def write(self, text):
+		self.content.write(text.encode('UTF-8'))
 
 
 	def add(self, type, realm, data, last_modified):
-		self.content.write('select(2, ...).LoadData("%s","%s", [[return ' % (type, realm))
-		self.content.write(data)
-		self.content.write(']])')
-		self.content.write(" --<%s,%s,%s>" % (type, realm, last_modified))
-		self.content.write('\n')
+		self.write('select(2, ...).LoadData("%s","%s", [[return ' % (type, realm))
+
+		# downloaded pricing data is copied from its file, without reading it into memory
+		if isinstance(data, str):
+			self.write(data)
+		else:
+			shutil.copyfileobj(data, self.content, appdata_chunk_size)
+			data.close()
+
+		self.write(']])')
+		self.write(" --<%s,%s,%s>" % (type, realm, last_modified))
+		self.write('\n')
 
 
 	def get_content(self):
-		content_str = self.content.getvalue()
-		self.content.close()
+		self.content.seek(0)
 
-		return content_str
+		return self.content
 
 
 
@@ -310,82 +415,129 @@ class TSMAppDataDownloader(IDownloadable):
 
 
 	def download(self):
-		status_data = self.status_data
 		last_modified = int(time())
+		appdata = AppData()
+
+		for api_type, name, fetch, _, item_last_modified in self.collect_requests():
+			appdata.add(api_type, name, fetch(), item_last_modified)
+
+		return self.create_installable(appdata, last_modified)
 
+
+	async def downloadAsync(self):
+		last_modified = int(time())
 		appdata = AppData()
 
+		# all pricing data is requested concurrently, but added in the original order
+		requests = self.collect_requests()
+		results  = await asyncio.gather(*[fetch_async() for _, _, _, fetch_async, _ in requests])
+
+		for (api_type, name, _, _, item_last_modified), data in zip(requests, results):
+			appdata.add(api_type, name, data, item_last_modified)
+
+		return self.create_installable(appdata, last_modified)
+
+
+	def collect_requests(self):
+		status_data = self.status_data
+		requests = []
+
 		# get region data
 		for region in status_data['regions']:
-			name = region['name']
-			region_id = region['id']
-			region_last_modified = region['lastModified']
+			self.tsm.log("update region #%i: %s" % (region['id'], region['name']))
 
-			self.tsm.log("update region #%i: %s" % (region_id, name))
+			self.collect_item_requests(
+				requests,
+				region,
+				'region',
+				region['id'],
+				TSMAppDataDownloader.API_REGION_ENTRIES
+			)
 
-			if 'pricingStrings' in region:
-				pricing_strings = region['pricingStrings']
+		# get realm data
+		for realm in status_data['realms']:
+			self.tsm.log("update realm #%i: %s" % (realm['masterId'], realm['name']))
 
-				self.download_pricing_strings(
-					name,
-					region_last_modified,
-					appdata,
-					pricing_strings,
-					TSMAppDataDownloader.API_REGION_ENTRIES
-				)
+			self.collect_item_requests(
+				requests,
+				realm,
+				'realm',
+				realm['masterId'],
+				TSMAppDataDownloader.API_REALM_ENTRIES
+			)
 
-			elif 'downloadUrl' in region:
-				download_url = region['downloadUrl']
-				data = self.tsm.url_request(download_url)
+		return requests
 
-				appdata.add(AppData.AUCTIONDB_MARKET_DATA, name, data, region_last_modified)
 
-			else:
-				data = self.tsm.tsm_request('auctiondb', 'region', str(region_id))
-				j = self.tsm.parseJsonResponse(data)
-				data = j['data']
+	def collect_item_requests(self, requests, item, item_type, item_id, entries):
+		name = item['name']
+		last_modified = item['lastModified']
 
-				appdata.add(AppData.AUCTIONDB_MARKET_DATA, name, data, region_last_modified)
+		if 'pricingStrings' in item:
+			pricing_strings = item['pricingStrings']
 
-		# get realm data
-		for realm in status_data['realms']:
-			name = realm['name']
-			realm_id = realm['masterId']
-			realm_last_modified = realm['lastModified']
+			self.collect_pricing_string_requests(
+				requests,
+				name,
+				last_modified,
+				pricing_strings,
+				entries
+			)
+
+		elif 'downloadUrl' in item:
+			download_url = item['downloadUrl']
+			fetch = functools.partial(self.tsm.url_request, download_url)
+			fetch_async = functools.partial(self.tsm.url_requestAsync, download_url)
+
+			requests.append((AppData.AUCTIONDB_MARKET_DATA, name, fetch, fetch_async, last_modified))
+
+		else:
+			fetch = functools.partial(self.request_auctiondb_data, item_type, item_id)
+			fetch_async = functools.partial(self.request_auctiondb_dataAsync, item_type, item_id)
 
-			self.tsm.log("update realm #%i: %s" % (realm_id, name))
+			requests.append((AppData.AUCTIONDB_MARKET_DATA, name, fetch, fetch_async, last_modified))
 
-			if 'pricingStrings' in realm:
-				pricing_strings = realm['pricingStrings']
 
-				self.download_pricing_strings(
-					name,
-					realm_last_modified,
-					appdata,
-					pricing_strings,
-					TSMAppDataDownloader.API_REALM_ENTRIES
-				)
+	def collect_pricing_string_requests(self, requests, name, last_modified, pricing_strings, entries):
+		for api_type, key in entries.items():
+			if key in pricing_strings:
+				pricing_string = pricing_strings[key]
+
+				if 'lastModified' in pricing_string:
+					item_last_modified = pricing_string['lastModified']
+				else:
+					item_last_modified = last_modified
+
+				if 'url' in pricing_string:
+					download_url = pricing_string['url']
+					fetch = functools.partial(self.tsm.url_request, download_url)
+					fetch_async = functools.partial(self.tsm.url_requestAsync, download_url)
 
-			elif 'downloadUrl' in realm:
-				download_url = realm['downloadUrl']
-				data = self.tsm.url_request(download_url)
+					requests.append((api_type, name, fetch, fetch_async, item_last_modified))
 
-				appdata.add(AppData.AUCTIONDB_MARKET_DATA, name, data, realm_last_modified)
 
-			else:
-				data = self.tsm.tsm_request('auctiondb', 'realm', str(realm_id))
-				j = self.tsm.parseJsonResponse(data)
-				data = j['data']
+	def request_auctiondb_data(self, item_type, item_id):
+		data = self.tsm.tsm_request('auctiondb', item_type, str(item_id), cached=True)
+		j = self.tsm.parseJsonResponse(data)
 
-				appdata.add(AppData.AUCTIONDB_MARKET_DATA, name, data, realm_last_modified)
+		return j['data']
 
+
+	async def request_auctiondb_dataAsync(self, item_type, item_id):
+		data = await self.tsm.tsm_requestAsync('auctiondb', item_type, str(item_id), cached=True)
+		j = self.tsm.parseJsonResponse(data)
+
+		return j['data']
+
+
+	def create_installable(self, appdata, last_modified):
 		appdata.add(
 			AppData.APP_INFO,
 			"Global",
 			'{version=%i,lastSync=%i,addonVersions={},message={id=0,msg=""},news=%s}' % (
 				self.tsm.version,
 				last_modified,
-				status_data['addonNews']
+				self.status_data['addonNews']
 			),
 			last_modified
 		)
@@ -395,21 +547,34 @@ class TSMAppDataDownloader(IDownloadable):
 		return TSMAppDataInstallable(appdata_content, self.version)
 
 
-	def download_pricing_strings(self, name, last_modified, appdata, pricing_strings, entries):
-		for api_type, key in entries.items():
-			if key in pricing_strings:
-				pricing_string = pricing_strings[key]
 
-				if 'lastModified' in pricing_string:
-					item_last_modified = pricing_string['lastModified']
-				else:
-					item_last_modified = last_modified
+class TSMCachedAppDataDownloader(IDownloadable):
+
+	def __init__(self, tsm, appdata_addon, version):
+		IDownloadable.__init__(self)
+
+		self.tsm           = tsm
+		self.appdata_addon = appdata_addon
+		self.version       = version
+
+
+	def download(self):
+		# the version was taken from the cache, the status is received only when downloading
+		status_data = self.tsm.getStatusData()
+
+		if status_data is None:
+			return None
+
+		return TSMAppDataDownloader(self.tsm, status_data, self.appdata_addon).download()
 
-				if 'url' in pricing_string:
-					download_url = pricing_string['url']
-					data = self.tsm.url_request(download_url)
 
-					appdata.add(api_type, name, data, item_last_modified)
+	async def downloadAsync(self):
+		status_data = await self.tsm.getStatusDataAsync()
+
+		if status_data is None:
+			return None
+
+		return await TSMAppDataDownloader(self.tsm, status_data, self.appdata_addon).downloadAsync()
 
 
 
@@ -422,9 +587,25 @@ class TSMAppDataInstallable(IInstallable):
 
 
 	def install(self, path):
-		out = io.open(os.path.join(path, 'TradeSkillMaster_AppHelper', 'AppData.lua'), 'w')
-		out.write(self.appdata_content)
-		out.close()
+		appdata_path = os.path.join(path, 'TradeSkillMaster_AppHelper', 'AppData.lua')
+		tmp_path = appdata_path + '.wowupdate-tmp'
+
+		# write a new file instead of overwriting the existing one, which may
+		# be shared with a rollback snapshot through a hardlink
+		try:
+			with io.open(tmp_path, 'wb') as out:
+				shutil.copyfileobj(self.appdata_content, out, appdata_chunk_size)
+
+			os.replace(tmp_path, appdata_path)
+
+		except:
+			if os.path.exists(tmp_path):
+				os.remove(tmp_path)
+
+			raise
+
+		finally:
+			self.appdata_content.close()
 
 
 	def updateAddonInfo(self, addon):
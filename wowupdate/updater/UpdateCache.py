@@ -0,0 +1,104 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import io
+import json
+import os
+import threading
+
+from time import time
+
+
+update_cache_filename = 'addons.updatecache.json'
+
+# seconds until a cached update check is checked again, if not configured otherwise
+default_update_cache_ttl = 900
+
+
+# Stores the results of update checks on disk, so repeated runs within
+# a short time don't need to ask the servers again. Each entry contains
+# the resolved version and the download url of an update.
+class UpdateCheckCache:
+	def __init__(self, config, refresh=False):
+		self.config  = config
+		self.refresh = refresh
+		self.ttl     = int(config.getConfig('update-cache-ttl', default_update_cache_ttl))
+		self.entries = {}
+		self.dirty   = False
+		self.lock    = threading.Lock()
+
+
+	def getFilename(self):
+		return os.path.join(self.config.addons_dir, update_cache_filename)
+
+
+	def open(self):
+		try:
+			with io.open(self.getFilename(), 'r') as input:
+				data = json.load(input)
+
+				if 'entries' in data:
+					self.entries = data['entries']
+
+		except (OSError, ValueError):
+			self.entries = {}
+
+		self.dirty = False
+
+
+	def save(self):
+		now = time()
+
+		with self.lock:
+			# drop expired entries
+			entries = {}
+
+			for key, entry in self.entries.items():
+				if self.isFresh(entry, now):
+					entries[key] = entry
+
+			self.entries = entries
+
+			with io.open(self.getFilename(), 'w') as output:
+				json.dump({'entries': self.entries}, output, sort_keys=True, indent=2)
+
+			self.dirty = False
+
+
+	def isFresh(self, entry, now):
+		return (now - entry.get('time', 0)) < self.ttl
+
+
+	def get(self, key):
+		# when refreshing, all checks are done again, but their results are still stored
+		if self.refresh:
+			return None
+
+		with self.lock:
+			entry = self.entries.get(key)
+
+			if entry is not None and self.isFresh(entry, time()):
+				return entry
+
+		return None
+
+
+	def put(self, key, entry):
+		entry = dict(entry)
+		entry['time'] = int(time())
+
+		with self.lock:
+			self.entries[key] = entry
+			self.dirty = True
@@ -13,10 +13,25 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
+
 from builtins import Exception
 from builtins import set
 
 
+# The update engine schedules checks, downloads and installs as coroutines.
+# Requests of the updaters are sent by the 'Async' methods of HttpSession,
+# so waiting for the network doesn't need a thread, no matter how many
+# requests are in flight. Work, which can't be done without blocking, like
+# extracting archives or hashing files, runs on the default executor of the
+# event loop, as do the methods of updaters without an async implementation.
+async def run_blocking(function, *args):
+	# runs a blocking call on the default executor of the running event loop
+	loop = asyncio.get_running_loop()
+	return await loop.run_in_executor(None, function, *args)
+
+
+
 class IDownloadable:
 	def __init__(self):
 		self.url     = None
@@ -25,6 +40,9 @@ class IDownloadable:
 	def download(self):
 		raise Exception('Implement me')
 
+	async def downloadAsync(self):
+		return await run_blocking(self.download)
+
 
 
 class IInstallable:
@@ -33,9 +51,15 @@ class IInstallable:
 		self.version = None
 		self.folders = set()
 
+	def configure(self, config):
+		pass
+
 	def install(self, path):
 		raise Exception('Implement me')
 
+	async def installAsync(self, path):
+		return await run_blocking(self.install, path)
+
 	def updateAddonInfo(self, addon):
 		raise Exception('Implement me')
 
@@ -50,6 +74,9 @@ class DownloadableWrapper(IDownloadable):
 	def download(self):
 		return self.installable
 
+	async def downloadAsync(self):
+		return self.installable
+
 
 
 class IUpdater:
@@ -74,3 +101,44 @@ class IUpdater:
 		return None
 
 
+	def identifyAddons(self, addons, fingerprints):
+		return []
+
+
+	def identifyAddonsByName(self, addons):
+		# may find out where to get updates from without any request
+		return []
+
+
+	def prefetchUpdatesFor(self, addons):
+		# may request the updates of many addons at once, before they are checked one by one
+		pass
+
+
+	def getCacheKey(self, addon):
+		return None
+
+
+	def createCacheEntry(self, downloadable):
+		return {
+			'version': downloadable.version,
+			'url':     downloadable.url,
+		}
+
+
+	def createDownloadableFromCache(self, addon, entry):
+		return None
+
+
+	async def prefetchUpdatesForAsync(self, addons):
+		await run_blocking(self.prefetchUpdatesFor, addons)
+
+
+	async def findUpdateForAsync(self, addon):
+		return await run_blocking(self.findUpdateFor, addon)
+
+
+	async def findDownloadByNameAsync(self, addon_name):
+		return await run_blocking(self.findDownloadByName, addon_name)
+
+
@@ -17,17 +17,43 @@ import io
 import os
 import re
 import shutil
+import tempfile
 import time
-import urllib.request
 
+from concurrent.futures import ThreadPoolExecutor
 from zipfile import ZipFile
 
 from builtins import AttributeError
 from builtins import Exception
 
+from wowupdate.updater.colors import *
+
 from wowupdate.updater.AddOn import Toc
+from wowupdate.updater.InstallManifest import InstallManifest
+from wowupdate.updater.ResumableDownload import StorageError
 from wowupdate.updater.Updater import IDownloadable
 from wowupdate.updater.Updater import IInstallable
+from wowupdate.updater.Updater import run_blocking
+from wowupdate.updater.content_decoding import decode_response
+from wowupdate.updater.folder_swap import swap_folders
+
+
+# size of the chunks read while downloading an archive
+download_chunk_size = 64 * 1024
+
+# downloaded archives larger than this are stored on disk instead of memory
+download_spool_size = 4 * 1024 * 1024
+
+# number of files extracted in parallel, if not configured otherwise
+default_extract_workers = 4
+
+# 'staged' extracts into a temporary directory and swaps the folders afterwards,
+# 'direct' deletes the folders and extracts into the AddOns directory,
+# 'differential' only writes files which differ from the installed ones
+install_mode_staged       = 'staged'
+install_mode_direct       = 'direct'
+install_mode_differential = 'differential'
+default_install_mode      = install_mode_staged
 
 
 class ZipInstallable(IInstallable):
@@ -35,8 +61,13 @@ class ZipInstallable(IInstallable):
 	def __init__(self, zipfl, root_dir=None):
 		IInstallable.__init__(self)
 		self.zipfl = zipfl
+		self.zipdata = None
+		self.files_by_name = None
+		self.content_hash = None
 		self.subdir_prefix = ''
 		self.toc = None
+		self.extract_workers = default_extract_workers
+		self.install_mode = default_install_mode
 
 		if root_dir is not None:
 			self.subdir_prefix = root_dir + '/'
@@ -44,6 +75,7 @@ class ZipInstallable(IInstallable):
 
 	def parseZipInfo(self):
 		self.folders.clear()
+		self.indexFiles()
 
 		pattern_dir = re.compile("%s(.*?)/.*" % self.subdir_prefix)
 
@@ -56,10 +88,34 @@ class ZipInstallable(IInstallable):
 					self.folders.add(folder)
 
 
+	def configure(self, config):
+		self.extract_workers = max(1, int(config.getConfig('extract-workers', default_extract_workers)))
+		self.install_mode    = config.getConfig('install-mode', default_install_mode)
+
+
 	def install(self, addons_dir):
 		if not os.path.exists(addons_dir):
 			raise AttributeError("addons_dir does not exist: %s" % addons_dir)
 
+		if self.install_mode == install_mode_direct:
+			self.installDirect(addons_dir)
+		elif self.install_mode == install_mode_differential:
+			self.installDifferential(addons_dir)
+		else:
+			self.installStaged(addons_dir)
+
+		# the manifest is kept up to date by all install modes, so a following
+		# differential install does not need to read all files again
+		try:
+			self.updateManifest(addons_dir)
+
+		except OSError as exc:
+			print("%swarning: install manifest not updated: %s%s" % (YELLOW, exc, NO_COLOR))
+
+		self.close()
+
+
+	def installDirect(self, addons_dir):
 		for root_dir in self.folders:
 			path = os.path.join(addons_dir, root_dir)
 
@@ -75,32 +131,168 @@ class ZipInstallable(IInstallable):
 		# some delay to ensure the directory is deleted
 		time.sleep(0.100)
 
-		# self.zipfl.extractall(addons_dir)
+		self.extractFolders(addons_dir)
+
+
+	def installStaged(self, addons_dir):
+		# extract into a hidden directory next to the addons, so the folders
+		# can be moved into place by renaming them on the same file system
+		staging_dir = tempfile.mkdtemp(prefix='.wowupdate-', dir=addons_dir)
+
+		try:
+			self.extractFolders(staging_dir)
+
+		except:
+			shutil.rmtree(staging_dir, ignore_errors=True)
+			raise
+
+		# either all folders are replaced or all of them keep their previous version
+		swap_folders(addons_dir, staging_dir, self.folders, self.folders)
+
+
+	def installDifferential(self, addons_dir):
+		manifest = InstallManifest(addons_dir)
+		manifest.open()
+
+		entries_by_folder = {}
+
+		for info, folder, file_path in self.getFolderEntries():
+			entries_by_folder.setdefault(folder, []).append((info, file_path))
+
+		for folder, entries in entries_by_folder.items():
+			folder_path = os.path.join(addons_dir, folder)
+			directories = set([folder_path])
+			files = {}
+			changed = []
+
+			for info, file_path in entries:
+				dst_path = os.path.join(folder_path, *file_path.split('/'))
+
+				if info.is_dir():
+					directories.add(dst_path)
+					continue
+
+				directories.add(os.path.dirname(dst_path))
+				files[os.path.normcase(dst_path)] = (info, file_path, dst_path)
+
+				# only write files, which are new or have a different content
+				if not manifest.fileMatches(folder, file_path, dst_path, info.file_size, info.CRC):
+					changed.append((info, dst_path))
+
+			self.removeObsoleteFiles(folder_path, files, directories)
+
+			for directory in sorted(directories):
+				os.makedirs(directory, exist_ok=True)
+
+			self.extractFiles(changed, replace=True)
+
+
+	def updateManifest(self, addons_dir):
+		folder_manifests = dict([(folder, {}) for folder in self.folders])
+
+		for info, folder, file_path in self.getFolderEntries():
+			if info.is_dir():
+				continue
+
+			dst_path = os.path.join(addons_dir, folder, *file_path.split('/'))
+			folder_manifests[folder][file_path] = [info.file_size, info.CRC, os.stat(dst_path).st_mtime_ns]
+
+		InstallManifest.update(addons_dir, folder_manifests)
+
+
+	def removeObsoleteFiles(self, folder_path, files, directories):
+		if not os.path.isdir(folder_path):
+			return
+
+		directories = set([os.path.normcase(directory) for directory in directories])
+
+		for root, dirnames, filenames in os.walk(folder_path, topdown=False):
+			for filename in filenames:
+				path = os.path.join(root, filename)
+
+				if os.path.normcase(path) not in files:
+					os.remove(path)
+
+			if os.path.normcase(root) not in directories and len(os.listdir(root)) == 0:
+				os.rmdir(root)
+
+
+	def getFolderEntries(self):
+		# maps each entry of the archive to the folder it will be installed into
+		entries = []
 
 		for info in self.zipfl.infolist():
-			for folder in self.folders:
-				folder_path = self.subdir_prefix + folder + '/'
-				if info.filename.startswith(folder_path):
-					file_path = os.path.relpath(info.filename, folder_path)
-					src_file = self.zipfl.open(info)
-					dst_path = os.path.join(addons_dir, folder, file_path)
-
-					if ".." in dst_path:
-						print("lala")
-						pass
-
-					if info.is_dir():
-						os.makedirs(dst_path, exist_ok=False)
-					else:
-						parent_path = os.path.dirname(dst_path)
-						os.makedirs(parent_path, exist_ok=True)
-
-						with io.open(dst_path, 'wb') as dst_file:
-							shutil.copyfileobj(src_file, dst_file)
-							dst_file.close()
+			if not info.filename.startswith(self.subdir_prefix):
+				continue
+
+			folder, separator, file_path = info.filename[len(self.subdir_prefix):].partition('/')
+
+			if separator == '' or folder not in self.folders:
+				continue
+
+			# never write outside of the addon folder
+			if '..' in file_path.split('/'):
+				continue
+
+			entries.append((info, folder, file_path))
+
+		return entries
+
+
+	def extractFolders(self, target_dir):
+		directories = set()
+		files = []
+
+		for info, folder, file_path in self.getFolderEntries():
+			dst_path = os.path.join(target_dir, folder, *file_path.split('/'))
+
+			if info.is_dir():
+				directories.add(dst_path)
+			else:
+				directories.add(os.path.dirname(dst_path))
+				files.append((info, dst_path))
+
+		# create all directories first, so the files can be written in any order
+		for directory in sorted(directories):
+			os.makedirs(directory, exist_ok=True)
 
+		self.extractFiles(files)
+
+
+	def extractFiles(self, files, replace=False):
+		extract = self.extractFileReplacing if replace else self.extractFile
+
+		# decompressing releases the GIL, so files are extracted in parallel
+		with ThreadPoolExecutor(max_workers=self.extract_workers) as executor:
+			for _ in executor.map(extract, files):
+				pass
+
+
+	def extractFile(self, entry):
+		info, dst_path = entry
+
+		with self.zipfl.open(info) as src_file:
+			with io.open(dst_path, 'wb') as dst_file:
+				shutil.copyfileobj(src_file, dst_file)
+
+
+	def extractFileReplacing(self, entry):
+		info, dst_path = entry
+		tmp_path = dst_path + '.wowupdate-tmp'
+
+		# write a new file instead of overwriting the existing one
+		self.extractFile((info, tmp_path))
+		os.replace(tmp_path, dst_path)
+
+
+	def close(self):
 		self.zipfl.close()
 
+		# the file of the downloaded archive is not closed by ZipFile
+		if self.zipdata is not None:
+			self.zipdata.close()
+			self.zipdata = None
+
 
 	def updateAddonInfo(self, addon):
 		#addon.updateToc(self.toc)
@@ -108,24 +300,57 @@ class ZipInstallable(IInstallable):
 		addon.version = self.version
 
 
+	def indexFiles(self):
+		# the first entry wins, if an archive contains names differing only in case
+		self.files_by_name = {}
+
+		for info in self.zipfl.infolist():
+			self.files_by_name.setdefault(info.filename.lower(), info)
+
+
 	def findFileInZip(self, file):
-		lower_filename = (self.subdir_prefix + file).lower()
+		if self.files_by_name is None:
+			self.indexFiles()
 
-		for fileinfo in self.zipfl.infolist():
-			if fileinfo.filename.lower() == lower_filename:
-				return fileinfo
+		return self.files_by_name.get((self.subdir_prefix + file).lower())
+
+
+
+def downloadZipFromResponse(response, name=None, source=None, version=None, zip_root=None, cache=None, cache_url=None):
+	# the archive is streamed into a temporary file, which is kept in memory
+	# for small archives and moved to disk when exceeding the spool size
+	zipdata = tempfile.SpooledTemporaryFile(max_size=download_spool_size)
+	shutil.copyfileobj(decode_response(response), zipdata, download_chunk_size)
+	zipdata.seek(0)
+
+	content_hash = None
+
+	if cache is not None:
+		try:
+			content_hash = cache.store(zipdata, url=cache_url)
+
+		except OSError as exc:
+			# the cache is only an optimization, the archive is still usable
+			print_cache_warning(exc)
+			zipdata.seek(0)
+
+	installable = createZipInstallable(zipdata, name=name, source=source, version=version, zip_root=zip_root)
+	installable.content_hash = content_hash
+
+	return installable
 
-		return None
 
 
+def print_cache_warning(exc):
+	print("%swarning: download cache not available: %s%s" % (YELLOW, exc, NO_COLOR))
 
-def downloadZipFromResponse(response, name=None, source=None, version=None, zip_root=None):
-	zipdata_bytes = response.read()
-	zipdata = io.BytesIO(zipdata_bytes)
 
+
+def createZipInstallable(zipdata, name=None, source=None, version=None, zip_root=None):
 	zipfl = ZipFile(zipdata, 'r')
 
 	installable = ZipInstallable(zipfl, root_dir=zip_root)
+	installable.zipdata = zipdata
 	installable.parseZipInfo()
 	installable.source  = source
 	installable.version = version
@@ -151,11 +376,20 @@ def downloadZipFromResponse(response, name=None, source=None, version=None, zip_
 
 
 class ZipDownloadable(IDownloadable):
-	def __init__(self, url=None, response=None):
+	def __init__(self, session, url=None, response=None, zip_root=None, cache=None):
 		IDownloadable.__init__(self)
 		self.name     = None
 		self.url      = url
 		self.response = response
+		self.zip_root = zip_root
+		self.cache    = cache
+		self.session  = session
+
+		# hash of the archive's content, if known in advance
+		self.content_hash = None
+
+		# only archives of urls which never change their content can be found by their url
+		self.immutable_url = True
 
 	def download(self):
 		if self.response is not None:
@@ -163,16 +397,101 @@ class ZipDownloadable(IDownloadable):
 				self.response,
 				source=self.url,
 				name=self.name,
-				version=self.version
+				version=self.version,
+				zip_root=self.zip_root
 			)
 
 		if self.url is not None:
-			with urllib.request.urlopen(self.url) as response:
-				return downloadZipFromResponse(
-					response,
-					source=self.url,
-					name=self.name,
-					version=self.version
-				)
+			installable = self.loadFromCache()
+
+			if installable is not None:
+				return installable
+
+			# download resumable into the cache and open the archive from there
+			if self.cache is not None:
+				try:
+					path, content_hash = self.cache.download(self.url, cache_url=self.immutable_url)
+
+					return self.openArchive(path, content_hash)
+
+				except StorageError as exc:
+					# download without the cache instead
+					print_cache_warning(exc)
+
+			with self.session.get(self.url) as response:
+				return self.createInstallableFromResponse(response)
 
 		return None
+
+	async def downloadAsync(self):
+		if self.response is not None or self.url is None:
+			return await run_blocking(self.download)
+
+		# reading the cache and opening archives is done by a thread, only the network is awaited
+		installable = await run_blocking(self.loadFromCache)
+
+		if installable is not None:
+			return installable
+
+		if self.cache is not None:
+			try:
+				path, content_hash = await self.cache.downloadAsync(self.url, cache_url=self.immutable_url)
+
+				return await run_blocking(self.openArchive, path, content_hash)
+
+			except StorageError as exc:
+				# download without the cache instead
+				print_cache_warning(exc)
+
+		with await self.session.getAsync(self.url) as response:
+			return await run_blocking(self.createInstallableFromResponse, response)
+
+	def createInstallableFromResponse(self, response):
+		return downloadZipFromResponse(
+			response,
+			source=self.url,
+			name=self.name,
+			version=self.version,
+			zip_root=self.zip_root
+		)
+
+	def loadFromCache(self):
+		if self.cache is None:
+			return None
+
+		try:
+			if self.content_hash is not None:
+				path = self.cache.lookup(content_hash=self.content_hash)
+			elif self.immutable_url:
+				path = self.cache.lookup(url=self.url)
+			else:
+				path = None
+
+		except OSError as exc:
+			print_cache_warning(exc)
+			return None
+
+		if path is None:
+			return None
+
+		try:
+			return self.openArchive(path, os.path.splitext(os.path.basename(path))[0])
+
+		except OSError:
+			# the archive was removed from the cache in the meantime
+			return None
+
+	def openArchive(self, path, content_hash):
+		zipdata = io.open(path, 'rb')
+
+		installable = createZipInstallable(
+			zipdata,
+			source=self.url,
+			name=self.name,
+			version=self.version,
+			zip_root=self.zip_root
+		)
+
+		installable.content_hash = content_hash
+
+		return installable
@@ -13,22 +13,45 @@
 # You should have received a copy of the GNU General Public License
 # along with this program. If not, see <http://www.gnu.org/licenses/>.
 
+import asyncio
 import os
 import re
 import urllib.error
 
 from builtins import *
+from concurrent.futures import ThreadPoolExecutor
 from time import time
 
 from wowupdate.updater.colors import *
 
 from wowupdate.updater.AddOn import AddOn
+from wowupdate.updater.Fingerprint import FolderFingerprinter
+from wowupdate.updater.Updater import run_blocking
+from wowupdate.updater.check_scheduler import is_check_due
+from wowupdate.updater.check_scheduler import record_check
+from wowupdate.updater.Pipeline import PipelineStage
+from wowupdate.updater.RollbackStore import RollbackStore
+from wowupdate.updater.ScanSnapshot import ScanSnapshot
+from wowupdate.updater.UpdateCache import UpdateCheckCache
 
 
 
 pattern_dir = re.compile("(.*?)/.*")
 
 
+# number of workers per stage and the size of the queues between the stages,
+# if not configured otherwise. Update checks only wait for the network, so
+# many of them can run at the same time without any additional thread.
+default_check_workers    = 32
+default_download_workers = 4
+default_install_workers  = 1
+default_queue_size       = 4
+
+# number of threads for blocking work of the check stage, like reading the
+# caches or updaters without an async implementation, if not configured otherwise
+default_blocking_workers = 4
+
+
 
 def get_update_generation(addon):
 	last_updated = addon.last_updated
@@ -63,123 +86,485 @@ def get_update_generation(addon):
 
 
 
-def update_all(addondb, config, dry_run=False, scan_all=True):
+def get_worker_count(config, key, default, workers=None):
+	if workers is None:
+		workers = config.getConfig(key, default)
+
+	return max(1, int(workers))
+
+
+
+def get_check_workers(config, check_workers=None):
+	return get_worker_count(config, 'check-workers', default_check_workers, check_workers)
+
+
+
+class AddOnUpdateJob:
+	def __init__(self, index, addon):
+		self.index        = index
+		self.addon        = addon
+		self.downloadable = None
+		self.installable  = None
+		self.error        = None
+		self.output       = []
+		self.finished     = False
+
+
+
+def update_all(addondb, config, dry_run=False, scan_all=True, check_workers=None, show_stats=False, refresh=False, full=False):
+	# requests don't need a thread, so the number of threads doesn't depend
+	# on the number of update checks running at the same time
+	workers = (
+			get_worker_count(config, 'blocking-workers', default_blocking_workers)
+		+	get_worker_count(config, 'download-workers', default_download_workers)
+		+	get_worker_count(config, 'install-workers', default_install_workers)
+	)
+
+	async def run():
+		# extracting, installing and other blocking work runs on the default executor
+		asyncio.get_running_loop().set_default_executor(ThreadPoolExecutor(max_workers=workers))
+
+		try:
+			await update_all_async(
+				addondb,
+				config,
+				dry_run=dry_run,
+				scan_all=scan_all,
+				check_workers=check_workers,
+				show_stats=show_stats,
+				refresh=refresh,
+				full=full
+			)
+
+		finally:
+			# kept-alive connections belong to this event loop
+			await config.http_pool.async_pool.close()
+
+	asyncio.run(run())
+
+
+
+def scan_unknown_addons(addondb, snapshot):
+	addons = []
+
+	for entry in snapshot.listFolders():
+		# check if this folder is already known by ano other addon
+		if addondb.isFolderKnown(entry.name):
+			continue
+
+		try:
+			# read the addon's metadata, unless it's unchanged since the last scan
+			toc = snapshot.getToc(entry)
+
+			if toc is not None:
+				addons += [AddOn.fromToc(entry.name, toc)]
+
+		except:
+			print("%serror reading folder %s%s" % (RED, entry.name, NO_COLOR))
+
+	return addons
+
+
+
+def remove_sub_addons(addons):
+	# a sub addon depends on its parent addon, so only the addons named
+	# in its dependencies need to be checked
+	addons_by_name = {}
+
+	for addon in addons:
+		addons_by_name[addon.name] = addon
+
+	def is_sub_addon(addon):
+		for dependency in addon.toc.dependencies:
+			maybe_parent = addons_by_name.get(dependency)
+
+			if maybe_parent is not None and maybe_parent is not addon:
+				if addon.dependsOn(maybe_parent):
+					return True
+
+		return False
+
+	return [addon for addon in addons if not is_sub_addon(addon)]
+
+
+
+def list_existing_names(addons_dir):
+	with os.scandir(addons_dir) as entries:
+		return set([entry.name.lower() for entry in entries])
+
+
+
+def split_abandoned_addons(addons, existing_names):
+	addons_existing  = []
+	addons_abandoned = []
+
+	for addon in addons:
+		if addon.checkIfAnyFolderIn(existing_names):
+			addons_existing.append(addon)
+		else:
+			addons_abandoned.append(addon)
+
+	return addons_existing, addons_abandoned
+
+
+
+def is_unidentified(addon, config):
+	if addon.toc.curse_project_id is not None or addon.toc.git_url is not None:
+		return False
+
+	for updater in config.updaters:
+		if updater.isPreferredUpdaterFor(addon):
+			return False
+
+	return True
+
+
+
+async def identify_addons_by_fingerprint(addons, addondb, config, full=False, retry_not_found=False):
+	candidates = [
+		addon for addon in addons
+		if is_unidentified(addon, config)
+		and (full or is_check_due(addon))
+		and (retry_not_found or addondb.isNotFoundRetryDue(addon.name))
+	]
+
+	if len(candidates) == 0:
+		return
+
+	fingerprinter = FolderFingerprinter(config)
+	fingerprinter.open()
+
+	try:
+		fingerprints = await run_blocking(fingerprinter.getFingerprints, [addon.name for addon in candidates])
+
+		# fingerprints, which recently did not match any project, are not looked up again
+		fingerprints = {
+			folder: fingerprint for folder, fingerprint in fingerprints.items()
+			if full or fingerprinter.isLookupDue(folder, fingerprint)
+		}
+
+		candidates = [addon for addon in candidates if addon.name in fingerprints]
+
+		for updater in config.updaters:
+			if len(candidates) == 0:
+				break
+
+			identified = await run_blocking(updater.identifyAddons, candidates, fingerprints)
+
+			for addon in identified:
+				fingerprinter.recordLookup(addon.name, fingerprints[addon.name], True)
+
+				if addon.name in addondb.addons:
+					addondb.dirty = True
+
+			candidates = [addon for addon in candidates if addon not in identified]
+
+		for addon in candidates:
+			fingerprinter.recordLookup(addon.name, fingerprints[addon.name], False)
+
+	except Exception as exc:
+		print("%sfailed to identify addons by their fingerprints: %s%s" % (RED, exc, NO_COLOR))
+
+	fingerprinter.save()
+
+
+
+async def identify_addons_by_name(addons, addondb, config, full=False):
+	candidates = [addon for addon in addons if is_unidentified(addon, config) and (full or is_check_due(addon))]
+
+	for updater in config.updaters:
+		if len(candidates) == 0:
+			break
+
+		identified = await run_blocking(updater.identifyAddonsByName, candidates)
+
+		for addon in identified:
+			addondb.clearNotFound(addon.name)
+
+			if addon.name in addondb.addons:
+				addondb.dirty = True
+
+		candidates = [addon for addon in candidates if addon not in identified]
+
+
+
+def is_update_cached(updater, addon, cache):
+	key = updater.getCacheKey(addon)
+
+	return key is not None and cache.get(key) is not None
+
+
+
+async def prefetch_updates(addons, config, cache, full=False):
+	# only addons, which will be checked and can't be answered from the cache
+	candidates = [addon for addon in addons if full or is_check_due(addon)]
+
+	for updater in config.updaters:
+		pending = [
+			addon for addon in candidates
+			if (updater.isPreferredUpdaterFor(addon) or updater.canHandle(addon)) and not is_update_cached(updater, addon, cache)
+		]
+
+		if len(pending) == 0:
+			continue
+
+		try:
+			await updater.prefetchUpdatesForAsync(pending)
+
+		except Exception as exc:
+			# the addons are checked one by one instead
+			print("%sfailed to request updates in bulk: %s%s" % (RED, exc, NO_COLOR))
+
+
+
+async def update_all_async(addondb, config, dry_run=False, scan_all=True, check_workers=None, show_stats=False, refresh=False, full=False):
 	# get the list of all known addons
 	addons = addondb.getAddons()
 
 	# store a list of updated addons
 	addons_updated = []
 
-	# store list of abandoned addons
-	addons_abandoned = []
-
 	# if enabled, search for currently unknown addons
 	if scan_all:
-		for subdir in os.listdir(config.addons_dir):
-			addonpath = os.path.join(config.addons_dir, subdir)
+		snapshot = ScanSnapshot(config)
+		snapshot.open()
 
-			# check if this folder is already known by ano other addon
-			if addondb.isFolderKnown(subdir):
-				continue
+		addons += scan_unknown_addons(addondb, snapshot)
 
-			try:
-				# read the addon's metadata
-				addon = AddOn.parse(addonpath, subdir)
-
-				if addon is not None:
-					addons += [addon]
-
-			except:
-				print("%serror reading folder %s%s" % (RED, subdir, NO_COLOR))
+		if snapshot.dirty:
+			snapshot.save()
 
 	# find addons, which are part of another addon package and remove them
-	for addon_index in range(len(addons) - 1, 0, -1):
-		addon = addons[addon_index]
-
-		for maybe_parent in addons:
-			if addon.dependsOn(maybe_parent):
-				addons.remove(addon)
-				break
+	addons = remove_sub_addons(addons)
 
 	# find addons, which folders does not exist anymore and probably were deleted manually
-	for addon_index in range(len(addons) - 1, 0, -1):
-		addon = addons[addon_index]
+	if scan_all:
+		existing_names = snapshot.existing_names
+	else:
+		existing_names = list_existing_names(config.addons_dir)
 
-		if not addon.checkIfAnyFolderExists(config.addons_dir):
-			addons_abandoned.append(addon)
-			addons.remove(addon)
-			addondb.remove(addon)
+	addons, addons_abandoned = split_abandoned_addons(addons, existing_names)
+
+	for addon in addons_abandoned:
+		addondb.remove(addon)
 
 	# sort by addon name (case insensitive)
 	# and their time last updated
 	addons.sort(key=lambda addon: (get_update_generation(addon), addon.name.lower()))
 
-	for addon in addons:
+	# find out where to get updates for addons without any information about it
+	if config.getConfig('fingerprint-matching', True):
+		await identify_addons_by_fingerprint(addons, addondb, config, full=full, retry_not_found=refresh)
+
+	# names of the remaining addons are looked up in local catalogs, so the
+	# identified ones are requested together with all others by prefetch_updates
+	await identify_addons_by_name(addons, addondb, config, full=full)
+
+	# results of recent update checks are reused, unless a refresh was requested
+	update_cache = UpdateCheckCache(config, refresh=refresh)
+	update_cache.open()
+
+	await prefetch_updates(addons, config, update_cache, full=full)
+
+	# previous versions of updated addons are kept for a rollback
+	rollback_store = RollbackStore(config)
+
+	# each addon passes the stages check -> download -> install, which are
+	# running concurrently and are connected by bounded queues.
+	queue_size = get_worker_count(config, 'queue-size', default_queue_size)
+
+	# results are printed in the sorted order, as soon as an addon
+	# and all addons before it have passed the pipeline
+	finished_jobs = {}
+	next_job_index = 0
+
+	def finish(job):
+		nonlocal next_job_index
+
+		job.finished = True
+		finished_jobs[job.index] = job
+
+		while next_job_index in finished_jobs:
+			for line in finished_jobs.pop(next_job_index).output:
+				print(line)
+
+			next_job_index += 1
+
+	def finish_with_error(job, exc):
+		job.error = exc
+
+		if isinstance(exc, urllib.error.HTTPError):
+			status = ("%d: %s" % (exc.code, exc.msg))
+		else:
+			status = exc
+
+		job.output.append("%s%-55s%s%25s%s" % (NO_COLOR, job.addon.to_string(), RED, status, NO_COLOR))
+		finish(job)
+
+	def on_stage_error(job, exc):
+		# an unexpected error of a stage, the job is finished unless it already was
+		if job.finished:
+			job.error = exc
+			print("%s%s: %s%s" % (RED, job.addon.name, exc, NO_COLOR))
+		else:
+			finish_with_error(job, exc)
+
+	async def check(job):
+		addon = job.addon
+
+		# skip addons, which are unlikely to have a new release since their last check
+		if not full and not is_check_due(addon):
+			job.output.append("%s%-55s%s%25s%s" % (GRAY, addon.to_string(), GRAY, "[skip]", NO_COLOR))
+			finish(job)
+			return
+
+		try:
+			job.downloadable = await findUpdateForAsync(addon, config, cache=update_cache, addondb=addondb, retry_not_found=refresh)
+
+		except Exception as exc:
+			finish_with_error(job, exc)
+			return
+
+		if job.downloadable is not None:
+			record_check(addon, job.downloadable.version)
+
+			if addon.name in addondb.addons:
+				addondb.dirty = True
+
+		await download_stage.put(job)
+
+	async def download(job):
+		addon = job.addon
+		downloadable = job.downloadable
 		addon_color = NO_COLOR
 		status_color = NO_COLOR
 		status = ""
 
-		installable = None
-
 		try:
-			downloadable = findUpdateFor(addon, config)
-
 			if downloadable is not None:
 				status = downloadable.version
 				status_color = GRAY
 
 				if addon.isVersionUpgrade(downloadable.version):
-					installable = downloadable.download()
+					job.installable = await downloadable.downloadAsync()
 
-					if installable is not None:
-						if addon.isVersionUpgrade(installable.version):
+					if job.installable is not None:
+						if addon.isVersionUpgrade(job.installable.version):
 							if addon.ignore_updates:
-								status = "[ign] %s" % installable.version
+								status = "[ign] %s" % job.installable.version
 								status_color = YELLOW
-								installable = None
+								job.installable = None
 							else:
-								status = "=> %s" % installable.version
+								status = "=> %s" % job.installable.version
 								status_color = GREEN
 			else:
 				addon_color = GRAY
 
-		except urllib.error.HTTPError as exc:
-			status = ("%d: %s" % (exc.code, exc.msg))
-			status_color = RED
+		except Exception as exc:
+			finish_with_error(job, exc)
+			return
 
-		except BaseException as exc:
-			status = exc
-			status_color = RED
+		job.output.append("%s%-55s%s%25s%s" % (addon_color, addon.to_string(), status_color, status, NO_COLOR))
 
-		print("%s%-55s%s%25s%s" % (addon_color, addon.to_string(), status_color, status, NO_COLOR))
+		if not dry_run and job.installable is not None and addon.isVersionUpgrade(job.installable.version):
+			await install_stage.put(job)
+		else:
+			finish(job)
 
-		if not dry_run:
-			if installable is not None:
-				if addon.isVersionUpgrade(installable.version):
-					if installable.source is not None:
-						print("  installing %s" % installable.source)
+	async def install(job):
+		addon = job.addon
+		installable = job.installable
 
-					old_version = addon.version
+		if installable.source is not None:
+			job.output.append("  installing %s" % installable.source)
 
-					installable.install(config.addons_dir)
-					installable.updateAddonInfo(addon)
+		old_version = addon.version
 
-					# update timestamp
-					addon.last_updated = int(time())
+		if rollback_store.isEnabled():
+			try:
+				await run_blocking(rollback_store.create, addon, addon.folders | installable.folders)
 
-					# store downloaded addon into addondb
-					addondb.add(addon)
+			except OSError as exc:
+				job.output.append("%s  no rollback snapshot: %s%s" % (YELLOW, exc, NO_COLOR))
 
-					# store information of this update
-					addons_updated.append(
-						{
-							'addon': addon,
-							'from':  old_version,
-							'to':    installable.version,
-						}
-					)
+		try:
+			installable.configure(config)
+			await installable.installAsync(config.addons_dir)
+
+			installable.updateAddonInfo(addon)
+
+			# update timestamp
+			addon.last_updated = int(time())
+
+			# store downloaded addon into addondb
+			addondb.add(addon)
+
+		except Exception as exc:
+			job.error = exc
+			job.output.append("%sFAILED: %s%s" % (RED, exc, NO_COLOR))
+			finish(job)
+			return
+
+		# store information of this update
+		addons_updated.append(
+			{
+				'index': job.index,
+				'addon': addon,
+				'from':  old_version,
+				'to':    installable.version,
+			}
+		)
+
+		job.output.append("%sDONE%s" % (GREEN, NO_COLOR))
+		finish(job)
+
+	check_stage = PipelineStage(
+		'check',
+		check,
+		workers=get_check_workers(config, check_workers),
+		queue_size=queue_size,
+		on_error=on_stage_error
+	)
+
+	download_stage = PipelineStage(
+		'download',
+		download,
+		workers=get_worker_count(config, 'download-workers', default_download_workers),
+		queue_size=queue_size,
+		on_error=on_stage_error
+	)
+
+	install_stage = PipelineStage(
+		'install',
+		install,
+		workers=get_worker_count(config, 'install-workers', default_install_workers),
+		queue_size=queue_size,
+		on_error=on_stage_error
+	)
+
+	stages = [check_stage, download_stage, install_stage]
+
+	for stage in stages:
+		stage.start()
+
+	for index, addon in enumerate(addons):
+		await check_stage.put(AddOnUpdateJob(index, addon))
+
+	# close the stages in order, so each stage receives all items of the previous one
+	for stage in stages:
+		await stage.close()
+
+	# keep the summary in the same order as the list of addons
+	addons_updated.sort(key=lambda updated: updated['index'])
+
+	if show_stats:
+		print("")
+		print("%sPipeline:%s" % (GRAY, NO_COLOR))
+
+		for stage in stages:
+			print("%s%s%s" % (GRAY, stage.to_string(), NO_COLOR))
 
-					print("%sDONE%s" % (GREEN, NO_COLOR))
+		print("%s%s%s" % (GRAY, config.http_cache.to_string(), NO_COLOR))
 
 	if len(addons_updated) > 0:
 		print("")
@@ -217,6 +602,11 @@ def update_all(addondb, config, dry_run=False, scan_all=True):
 				)
 			)
 
+	if update_cache.dirty:
+		update_cache.save()
+
+	addondb.pruneNotFound(existing_names)
+
 	if addondb.dirty:
 		addondb.save()
 
@@ -244,3 +634,58 @@ def findUpdateFor(addon, config):
 
 	return None
 
+
+
+async def findUpdateForAsync(addon, config, cache=None, addondb=None, retry_not_found=False):
+	for updater in config.updaters:
+		if updater.isPreferredUpdaterFor(addon):
+			update = await findCachedUpdateFor(updater, addon, cache)
+
+			if update is not None:
+				return update
+
+	for updater in config.updaters:
+		if updater.canHandle(addon):
+			update = await findCachedUpdateFor(updater, addon, cache)
+
+			if update is not None:
+				return update
+
+	# addons, which were not found by their name, are searched again after some time
+	if addondb is not None and not retry_not_found and not addondb.isNotFoundRetryDue(addon.name):
+		return None
+
+	for updater in config.updaters:
+		update = await updater.findDownloadByNameAsync(addon.name)
+
+		if update is not None:
+			if addondb is not None:
+				addondb.clearNotFound(addon.name)
+
+			return update
+
+	if addondb is not None:
+		addondb.recordNotFound(addon.name)
+
+	return None
+
+
+
+async def findCachedUpdateFor(updater, addon, cache):
+	key = None
+
+	if cache is not None:
+		key = updater.getCacheKey(addon)
+
+	if key is not None:
+		entry = cache.get(key)
+
+		if entry is not None:
+			return updater.createDownloadableFromCache(addon, entry)
+
+	update = await updater.findUpdateForAsync(addon)
+
+	if key is not None and update is not None:
+		cache.put(key, updater.createCacheEntry(update))
+
+	return update
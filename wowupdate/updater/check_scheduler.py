@@ -0,0 +1,112 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+from time import time
+
+
+# number of observed releases stored per addon
+release_history_size = 8
+
+# an addon is checked again after this fraction of its usual time between two releases
+check_interval_factor = 0.1
+
+# limits of the time between two checks, in seconds
+min_check_interval = 3600
+max_check_interval = 7 * 24 * 3600
+
+# time until an addon, which could not be found, is searched again. it
+# doubles with each unsuccessful search until reaching the maximum
+min_not_found_interval = 6 * 3600
+max_not_found_interval = 30 * 24 * 3600
+
+
+
+def get_release_interval(addon):
+	history = addon.release_history
+
+	# average time between the observed releases
+	if len(history) >= 2:
+		return (history[-1] - history[0]) / (len(history) - 1)
+
+	return None
+
+
+
+def get_check_interval(addon, now=None):
+	if now is None:
+		now = time()
+
+	# never checked before
+	if addon.last_checked == 0:
+		return 0
+
+	# a known update was not installed yet
+	if addon.remote_version is not None and addon.isVersionUpgrade(addon.remote_version):
+		return 0
+
+	interval = get_release_interval(addon)
+
+	if interval is None:
+		# without a known release cadence, use the age of the last known release
+		last_release = 0
+
+		if len(addon.release_history) > 0:
+			last_release = addon.release_history[-1]
+		elif addon.last_updated > 0:
+			last_release = addon.last_updated
+
+		if last_release == 0:
+			return min_check_interval
+
+		interval = now - last_release
+
+	return min(max_check_interval, max(min_check_interval, interval * check_interval_factor))
+
+
+
+def is_check_due(addon, now=None):
+	if now is None:
+		now = time()
+
+	return (now - addon.last_checked) >= get_check_interval(addon, now)
+
+
+
+def record_check(addon, version, now=None):
+	if now is None:
+		now = time()
+
+	addon.last_checked = int(now)
+
+	if version is not None and version != addon.remote_version:
+		# the first version seen is not a release observed by us
+		if addon.remote_version is not None:
+			addon.release_history.append(int(now))
+			addon.release_history = addon.release_history[-release_history_size:]
+
+		addon.remote_version = version
+
+
+
+def get_not_found_interval(attempts):
+	return min(max_not_found_interval, min_not_found_interval * (2 ** max(0, attempts - 1)))
+
+
+
+def is_not_found_retry_due(entry, now=None):
+	if now is None:
+		now = time()
+
+	return (now - entry['last-attempt']) >= get_not_found_interval(entry['attempts'])
@@ -0,0 +1,162 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+import http.client
+import io
+import json
+import zlib
+
+# brotli is optional, responses are only requested with it when available
+try:
+	import brotli
+except ImportError:
+	brotli = None
+
+
+# size of the chunks read from the response and of the decompressed chunks
+decode_chunk_size = 64 * 1024
+
+supported_encodings = ['gzip', 'deflate']
+
+if brotli is not None:
+	supported_encodings.append('br')
+
+# value of the Accept-Encoding header for responses, which are decoded by decode_response
+accept_encoding = ', '.join(supported_encodings)
+
+
+class UnsupportedContentEncoding(http.client.HTTPException):
+	pass
+
+
+
+def is_zlib_header(data):
+	# deflate should be sent with a zlib header, but some servers send raw deflate data
+	return len(data) >= 2 and (data[0] & 0x0f) == 8 and ((data[0] << 8) | data[1]) % 31 == 0
+
+
+
+# Decompresses a stream while it is read, so neither the whole compressed
+# nor the whole decompressed data needs to be kept in memory.
+class DecodingReader(io.RawIOBase):
+	def __init__(self, fileobj, encoding):
+		io.RawIOBase.__init__(self)
+		self.fileobj      = fileobj
+		self.encoding     = encoding
+		self.decompressor = None
+		self.pending      = b''
+		self.buffer       = b''
+		self.eof          = False
+
+
+	def readable(self):
+		return True
+
+
+	def createDecompressor(self, data):
+		if self.encoding == 'gzip':
+			return zlib.decompressobj(16 + zlib.MAX_WBITS)
+
+		if self.encoding == 'deflate':
+			return zlib.decompressobj(zlib.MAX_WBITS if is_zlib_header(data) else -zlib.MAX_WBITS)
+
+		return brotli.Decompressor()
+
+
+	def decompress(self, data):
+		if self.decompressor is None:
+			self.decompressor = self.createDecompressor(data)
+
+		if self.encoding == 'br':
+			if hasattr(self.decompressor, 'process'):
+				return self.decompressor.process(data)
+
+			return self.decompressor.decompress(data)
+
+		# limit the size of the output, the remaining input is kept for the next call
+		output = self.decompressor.decompress(data, decode_chunk_size)
+		self.pending = self.decompressor.unconsumed_tail
+
+		# a gzip stream may consist of several members
+		if self.decompressor.eof and len(self.decompressor.unused_data) > 0:
+			self.pending = self.decompressor.unused_data + self.pending
+			self.decompressor = None
+
+		return output
+
+
+	def fill(self):
+		while len(self.buffer) == 0 and not self.eof:
+			if len(self.pending) > 0:
+				data = self.pending
+				self.pending = b''
+			else:
+				data = self.fileobj.read(decode_chunk_size)
+
+			if len(data) == 0:
+				self.eof = True
+
+				if self.decompressor is not None and self.encoding != 'br':
+					self.buffer = self.decompressor.flush()
+
+				break
+
+			self.buffer = self.decompress(data)
+
+
+	def readinto(self, buffer):
+		self.fill()
+
+		size = min(len(buffer), len(self.buffer))
+		buffer[:size] = self.buffer[:size]
+		self.buffer = self.buffer[size:]
+
+		return size
+
+
+	def close(self):
+		if not self.closed:
+			self.fileobj.close()
+
+		io.RawIOBase.close(self)
+
+
+
+def get_content_encodings(response):
+	value = response.headers.get('Content-Encoding', '')
+
+	return [encoding.strip().lower() for encoding in value.split(',') if encoding.strip() != '']
+
+
+def decode_response(response):
+	# returns a stream of the decoded body, which is the response itself when not encoded
+	stream = response
+
+	# encodings are listed in the order they were applied
+	for encoding in reversed(get_content_encodings(response)):
+		if encoding == 'identity':
+			continue
+
+		if encoding not in supported_encodings:
+			raise UnsupportedContentEncoding("unsupported content encoding: %s" % encoding)
+
+		stream = io.BufferedReader(DecodingReader(stream, encoding), decode_chunk_size)
+
+	return stream
+
+
+def read_json_from_response(response):
+	# json detects the encoding of the bytes itself
+	return json.load(decode_response(response))
@@ -0,0 +1,70 @@
+# Copyright (C) 2018 by Christian Fischer
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program. If not, see <http://www.gnu.org/licenses/>.
+
+
+import os
+import shutil
+
+
+# name of the directory inside the staging directory, which keeps the replaced folders
+replaced_dir_name = '.replaced'
+
+
+
+def swap_folders(target_dir, staging_dir, folders, replaced_folders):
+	# Moves the replaced folders out of the way and the folders prepared in the
+	# staging directory into their place. When any of the moves fails, all
+	# folders are put back as they were, so the target is never left with a
+	# mix of old and new folders. The staging directory is deleted afterwards,
+	# together with the replaced folders.
+	replaced_dir = os.path.join(staging_dir, replaced_dir_name)
+
+	# folders moved out of the way and folders moved into place so far
+	replaced = []
+	swapped = []
+	keep_staging_dir = False
+
+	try:
+		os.mkdir(replaced_dir)
+
+		for folder in replaced_folders:
+			path = os.path.join(target_dir, folder)
+
+			if os.path.exists(path):
+				os.replace(path, os.path.join(replaced_dir, folder))
+				replaced.append(folder)
+
+		for folder in folders:
+			os.replace(os.path.join(staging_dir, folder), os.path.join(target_dir, folder))
+			swapped.append(folder)
+
+	except:
+		for folder in swapped:
+			shutil.rmtree(os.path.join(target_dir, folder), ignore_errors=True)
+
+		for folder in replaced:
+			try:
+				os.replace(os.path.join(replaced_dir, folder), os.path.join(target_dir, folder))
+
+			except OSError:
+				# never delete a folder, which could not be moved back
+				keep_staging_dir = True
+				print("could not move %s back, it was kept in %s" % (folder, replaced_dir))
+
+		raise
+
+	finally:
+		if not keep_staging_dir:
+			shutil.rmtree(staging_dir, ignore_errors=True)